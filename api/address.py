@@ -0,0 +1,265 @@
+import re
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator, Sequence
+from functools import cache, lru_cache
+from typing import Any, NamedTuple
+
+from logbook import Logger
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.helpers import normalize_search_name
+
+
+# Resolve free-form addresses, like "P. Bến Nghé, Q.1, TP HCM", to the division codes, in one pass.
+#
+# Every name of every level (with and without division type, abbreviated type, codename, common nicknames)
+# is compiled to one Aho-Corasick automaton. It works on normalized words, not characters, so that names only
+# match whole words. Scanning the address gives all the names found in it. Then we pick the most consistent
+# hierarchy: the chain of (ward, district, province) in which each is the parent of the previous,
+# which gives the highest total weight of matches, without overlapping.
+
+logger = Logger(__name__)
+
+# A part of the address between separators. Names are not matched across separators.
+SEPARATOR = ','
+_TOKEN_RE = re.compile(r'[^\W_]+|[,;\n]')
+
+# Longest first, so that "thi xa" is not taken as "thi" + "xa"
+DIVISION_TYPES = (
+    ('thanh', 'pho'),
+    ('thi', 'xa'),
+    ('thi', 'tran'),
+    ('dac', 'khu'),
+    ('tinh',),
+    ('quan',),
+    ('huyen',),
+    ('phuong',),
+    ('xa',),
+)
+TYPE_ABBREVIATIONS: dict[tuple[str, ...], tuple[str, ...]] = {
+    ('thanh', 'pho'): ('tp',),
+    ('thi', 'xa'): ('tx',),
+    ('thi', 'tran'): ('tt',),
+    ('quan',): ('q',),
+    ('huyen',): ('h',),
+    ('phuong',): ('p',),
+    ('xa',): ('x',),
+}
+# Nicknames of provinces, by their name without division type
+PROVINCE_NICKNAMES: dict[tuple[str, ...], tuple[tuple[str, ...], ...]] = {
+    ('ho', 'chi', 'minh'): (('hcm',), ('tphcm',), ('sai', 'gon'), ('sg',)),
+    ('ha', 'noi'): (('hn',),),
+    ('ba', 'ria', 'vung', 'tau'): (('brvt',),),
+    ('thua', 'thien', 'hue'): (('hue',),),
+}
+# Match weight, added when the division type is also found (like "Phường 1", "P.1"), or for a nickname.
+TYPE_BONUS = 1
+
+
+@lru_cache(maxsize=65536)
+def normalize_token(token: str) -> str:
+    return normalize_search_name(token)
+
+
+def tokenize(text: str) -> list[re.Match[str]]:
+    return list(_TOKEN_RE.finditer(text))
+
+
+def normalize_tokens(matches: Iterable[re.Match[str]]) -> list[str]:
+    return [SEPARATOR if (t := m[0]) in ',;\n' else normalize_token(t) for m in matches]
+
+
+def split_division_type(words: Sequence[str]) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    for type_words in DIVISION_TYPES:
+        n = len(type_words)
+        if tuple(words[:n]) == type_words and len(words) > n:
+            return type_words, tuple(words[n:])
+    return (), tuple(words)
+
+
+class Division(NamedTuple):
+    level: int
+    code: int
+    name: str
+    # Codes of the parent divisions, from the top level
+    parents: tuple[int, ...]
+
+
+class _Match(NamedTuple):
+    start: int
+    end: int
+    division: int
+    weight: int
+
+
+class ParseResult(NamedTuple):
+    # Division at each level (None if not found), and the part of text which matched it
+    # (None if the division is not in text, but deduced from its child).
+    divisions: tuple[Division | None, ...]
+    matched: tuple[str | None, ...]
+    score: int
+    # Another hierarchy fits the text equally well
+    ambiguous: bool
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton, with words (not characters) as symbols."""
+
+    def __init__(self, patterns: Iterable[Sequence[str]]):
+        self.goto: list[dict[str, int]] = [{}]
+        # Patterns (by position and length) ending at each state
+        self.outputs: list[tuple[tuple[int, int], ...]] = [()]
+        self.size = 0
+        for pid, words in enumerate(patterns):
+            self.size += 1
+            state = 0
+            for word in words:
+                next_state = self.goto[state].get(word)
+                if next_state is None:
+                    next_state = self.goto[state][word] = len(self.goto)
+                    self.goto.append({})
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] += ((pid, len(words)),)
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                if state:
+                    f = self.fail[state]
+                    while f and word not in self.goto[f]:
+                        f = self.fail[f]
+                    self.fail[child] = self.goto[f].get(word, 0)
+                self.outputs[child] += self.outputs[self.fail[child]]
+
+    def iter_matches(self, words: Iterable[str]) -> Iterator[tuple[int, int, int]]:
+        """Yield (start, end, pattern) of every pattern found in words."""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for pid, length in outputs[state]:
+                yield i + 1 - length, i + 1, pid
+
+
+class AddressParser:
+    def __init__(self, levels: Sequence[Iterable[Any]]):
+        """
+        `levels` are the records of each level, from top (province) down. Records have `name`, `code`, `codename`,
+        and the code of their parents, like `province_code`, `district_code`.
+        """
+        parent_attrs = ('province_code', 'district_code')
+        self.levels = len(levels)
+        self.divisions: list[Division] = []
+        self.by_code: dict[tuple[int, int], Division] = {}
+        # Words -> divisions (by position) and weights
+        patterns: defaultdict[tuple[str, ...], dict[int, int]] = defaultdict(dict)
+        for level, records in enumerate(levels):
+            for record in records:
+                d = len(self.divisions)
+                parents = tuple(int(getattr(record, attr)) for attr in parent_attrs[:level])
+                self.divisions.append(Division(level, int(record.code), record.name, parents))
+                self.by_code[(level, int(record.code))] = self.divisions[-1]
+                for words, weight in self._variants(record, level):
+                    if patterns[words].get(d, 0) < weight:
+                        patterns[words][d] = weight
+        self.patterns = tuple(tuple(p.items()) for p in patterns.values())
+        self.automaton = TokenAutomaton(patterns.keys())
+
+    @staticmethod
+    def _variants(record: Any, level: int) -> Iterator[tuple[tuple[str, ...], int]]:
+        for name in (record.name, record.codename):
+            type_words, words = split_division_type(normalize_tokens(tokenize(name)))
+            weight = len(words)
+            # A number alone (like "1" of "Quận 1") is not a name.
+            if not words[-1].isdigit():
+                yield words, weight
+            if type_words:
+                yield type_words + words, weight + TYPE_BONUS
+                for abbr in TYPE_ABBREVIATIONS.get(type_words, ()):
+                    yield (abbr, *words), weight + TYPE_BONUS
+                    if len(words) == 1 and words[0].isdigit():
+                        # Like "Q1"
+                        yield (abbr + words[0],), weight + TYPE_BONUS
+            if level == 0:
+                for nickname in PROVINCE_NICKNAMES.get(words, ()):
+                    yield nickname, weight + TYPE_BONUS
+                    # Like "TP HCM"
+                    for abbr in TYPE_ABBREVIATIONS.get(type_words, ()):
+                        yield (abbr, *nickname), weight + TYPE_BONUS
+
+    def find(self, words: Sequence[str]) -> list[_Match]:
+        matches = []
+        for start, end, pid in self.automaton.iter_matches(words):
+            for d, weight in self.patterns[pid]:
+                matches.append(_Match(start, end, d, weight))
+        return matches
+
+    def parse(self, text: str) -> ParseResult:
+        tokens = tokenize(text)
+        matches = self.find(normalize_tokens(tokens))
+        # Best matches of each division, by level and code
+        by_code: list[defaultdict[int, list[_Match]]] = [defaultdict(list) for _i in range(self.levels)]
+        for m in matches:
+            d = self.divisions[m.division]
+            by_code[d.level][d.code].append(m)
+        for by_level in by_code:
+            for ms in by_level.values():
+                ms.sort(key=lambda m: m.weight, reverse=True)
+        best: tuple[int, int] = (0, 0)
+        best_chain: tuple[_Match, ...] = ()
+        best_divisions: set[Division] = set()
+        # Each match is tried as the lowest level of a chain, then completed with the matches of its parents.
+        for m in matches:
+            d = self.divisions[m.division]
+            chain = [m]
+            for level, code in enumerate(d.parents):
+                parent = next((p for p in by_code[level].get(code, ()) if not any(_overlap(p, c) for c in chain)), None)
+                if parent:
+                    chain.append(parent)
+            rank = (sum(c.weight for c in chain), len(chain))
+            if rank > best:
+                best, best_chain, best_divisions = rank, tuple(chain), {d}
+            elif rank == best:
+                best_divisions.add(d)
+        if not best_chain:
+            return ParseResult((None,) * self.levels, (None,) * self.levels, 0, False)
+        lowest = self.divisions[best_chain[0].division]
+        divisions: list[Division | None] = [None] * self.levels
+        matched: list[str | None] = [None] * self.levels
+        for level, code in enumerate(lowest.parents):
+            divisions[level] = self.by_code.get((level, code))
+        for m in best_chain:
+            d = self.divisions[m.division]
+            divisions[d.level] = d
+            matched[d.level] = text[tokens[m.start].start() : tokens[m.end - 1].end()]
+        return ParseResult(tuple(divisions), tuple(matched), best[0], len(best_divisions) > 1)
+
+
+def _overlap(a: _Match, b: _Match) -> bool:
+    return a.start < b.end and b.start < a.end
+
+
+@cache
+def address_parser() -> AddressParser:
+    return AddressParser((Province.iter_all(), Ward.iter_all()))
+
+
+@cache
+def legacy_address_parser() -> AddressParser:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+    from vietnam_provinces.legacy import Province as LegacyProvince
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    return AddressParser((LegacyProvince.iter_all(), LegacyDistrict.iter_all(), LegacyWard.iter_all()))
+
+
+def build_parsers():
+    logger.debug('Built address parser of {} names', address_parser().automaton.size)
+
+
+def build_legacy_parsers():
+    logger.debug('Built legacy address parser of {} names', legacy_address_parser().automaton.size)
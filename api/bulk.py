@@ -0,0 +1,214 @@
+import csv
+import io
+from collections.abc import AsyncIterator, Iterable
+from enum import StrEnum
+
+import msgspec
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .legacy_map import legacy_ward_map
+from .streaming import NDJSON_MEDIA_TYPE
+
+
+# Convert many legacy (pre-2025) ward codes or names to new wards, in one request.
+# The request body is read line by line while the converted rows are sent back, so the memory use only depends
+# on the size of one received chunk (and the longest line), not the size of the upload.
+
+# Longer lines are not read into memory, they are reported as invalid rows.
+MAX_LINE_SIZE = 8 * 1024
+# For ambiguous rows, we list at most this number of candidate wards.
+MAX_CANDIDATES = 10
+
+INPUT_FIELDS = ('ref', 'legacy_code', 'legacy_name', 'legacy_province_code')
+OUTPUT_FIELDS = ('line', 'ref', 'status', 'ward_code', 'ward_name', 'province_code', 'source_code', 'candidates')
+
+
+class BulkFormat(StrEnum):
+    CSV = 'text/csv'
+    NDJSON = NDJSON_MEDIA_TYPE
+
+
+class ConversionStatus(StrEnum):
+    CONVERTED = 'converted'
+    # Matched more than one new ward. The best match is still filled in, and other matches are in "candidates".
+    AMBIGUOUS = 'ambiguous'
+    NOT_FOUND = 'not-found'
+    INVALID = 'invalid'
+
+
+class LegacyAddressRow(msgspec.Struct):
+    # Opaque value from the caller (like customer ID), echoed back to help joining the result.
+    ref: str | int | None = None
+    legacy_code: int = 0
+    legacy_name: str = ''
+    # Narrow down the name search to one legacy province.
+    legacy_province_code: int = 0
+
+
+class ConversionResult(msgspec.Struct):
+    line: int
+    ref: str | int | None
+    status: ConversionStatus
+    ward_code: int | None = None
+    ward_name: str | None = None
+    province_code: int | None = None
+    source_code: int | None = None
+    candidates: tuple[int, ...] = ()
+
+
+class BulkInputError(ValueError):
+    pass
+
+
+def convert_row(line: int, row: LegacyAddressRow) -> ConversionResult:
+    ward_map = legacy_ward_map()
+    if row.legacy_code > 0:
+        matches = ward_map.from_legacy_code(row.legacy_code)
+    elif row.legacy_name.strip():
+        matches = ward_map.search_by_legacy_name(row.legacy_name, row.legacy_province_code)
+    else:
+        return ConversionResult(line, row.ref, ConversionStatus.INVALID)
+    if not matches:
+        return ConversionResult(line, row.ref, ConversionStatus.NOT_FOUND)
+    best = matches[0]
+    status = ConversionStatus.CONVERTED if len(matches) == 1 else ConversionStatus.AMBIGUOUS
+    candidates = tuple(m.ward.code for m in matches[:MAX_CANDIDATES]) if len(matches) > 1 else ()
+    return ConversionResult(
+        line, row.ref, status, best.ward.code, best.ward.name, best.ward.province_code, best.source_code, candidates
+    )
+
+
+async def iter_line_batches(chunks: AsyncIterator[bytes]) -> AsyncIterator[list[bytes | None]]:
+    """
+    Split the body into lines, yielding the complete lines of each received chunk together.
+    A line longer than MAX_LINE_SIZE is yielded as None.
+    """
+    pending = b''
+    overflow = False
+    async for chunk in chunks:
+        *complete, rest = chunk.split(b'\n')
+        batch: list[bytes | None] = []
+        for i, part in enumerate(complete):
+            if i:
+                batch.append(None if len(part) > MAX_LINE_SIZE else part)
+                continue
+            line = pending + part
+            batch.append(None if overflow or len(line) > MAX_LINE_SIZE else line)
+            pending, overflow = b'', False
+        if complete:
+            pending = rest
+        elif not overflow:
+            pending += rest
+        if len(pending) > MAX_LINE_SIZE:
+            pending, overflow = b'', True
+        if batch:
+            yield batch
+    if overflow:
+        yield [None]
+    elif pending:
+        yield [pending]
+
+
+class BulkConverter:
+    def __init__(self, fmt: BulkFormat, chunks: AsyncIterator[bytes]):
+        self.fmt = fmt
+        self.batches = iter_line_batches(chunks)
+        self.line = 0
+        # Position of each input field in CSV rows
+        self.columns: dict[str, int] = {}
+        self.leftover: list[bytes | None] = []
+
+    async def read_header(self):
+        """Read the CSV header, before we start responding, so that a wrong header can be reported as error."""
+        if self.fmt != BulkFormat.CSV:
+            return
+        async for batch in self.batches:
+            for i, raw in enumerate(batch):
+                self.line += 1
+                if raw is None:
+                    raise BulkInputError('CSV header is too long')
+                if not raw.strip():
+                    continue
+                header = next(csv.reader([raw.decode('utf-8-sig', 'replace')]))
+                names = [h.strip().lower() for h in header]
+                self.columns = {f: names.index(f) for f in INPUT_FIELDS if f in names}
+                if 'legacy_code' not in self.columns and 'legacy_name' not in self.columns:
+                    raise BulkInputError('CSV header must have "legacy_code" or "legacy_name" column')
+                self.leftover = batch[i + 1 :]
+                return
+        raise BulkInputError('CSV header is missing')
+
+    def _parse_csv(self, raw: bytes) -> LegacyAddressRow:
+        values = next(csv.reader([raw.decode()]))
+        fields = {f: values[i].strip() for f, i in self.columns.items() if i < len(values)}
+        return LegacyAddressRow(
+            ref=fields.get('ref') or None,
+            legacy_code=int(fields.get('legacy_code') or 0),
+            legacy_name=fields.get('legacy_name', ''),
+            legacy_province_code=int(fields.get('legacy_province_code') or 0),
+        )
+
+    def convert_batch(self, batch: Iterable[bytes | None]) -> list[ConversionResult]:
+        results = []
+        for raw in batch:
+            self.line += 1
+            if raw is not None:
+                raw = raw.rstrip(b'\r')
+                if not raw.strip():
+                    continue
+            try:
+                if raw is None:
+                    raise BulkInputError('Line is too long')
+                if self.fmt == BulkFormat.CSV:
+                    row = self._parse_csv(raw)
+                else:
+                    row = msgspec.json.decode(raw, type=LegacyAddressRow)
+            except (ValueError, msgspec.DecodeError):
+                results.append(ConversionResult(self.line, None, ConversionStatus.INVALID))
+                continue
+            results.append(convert_row(self.line, row))
+        return results
+
+    def encode(self, results: Iterable[ConversionResult]) -> bytes:
+        if self.fmt == BulkFormat.NDJSON:
+            return b''.join(msgspec.json.encode(r) + b'\n' for r in results)
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        for r in results:
+            writer.writerow(
+                (
+                    r.line,
+                    r.ref,
+                    r.status,
+                    r.ward_code,
+                    r.ward_name,
+                    r.province_code,
+                    r.source_code,
+                    ' '.join(map(str, r.candidates)),
+                )
+            )
+        return buf.getvalue().encode()
+
+    async def iter_output(self) -> AsyncIterator[bytes]:
+        if self.fmt == BulkFormat.CSV:
+            yield (','.join(OUTPUT_FIELDS) + '\n').encode()
+        if self.leftover:
+            yield self.encode(await run_in_threadpool(self.convert_batch, self.leftover))
+            self.leftover = []
+        async for batch in self.batches:
+            # Name lookup takes CPU time, don't block the event loop with it.
+            results = await run_in_threadpool(self.convert_batch, batch)
+            if results:
+                yield self.encode(results)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    # StreamingResponse, for older ASGI servers, listens for client disconnection while sending,
+    # which takes away the request body messages that our body iterator is still reading.
+    # Disconnection is still noticed, when reading the request body.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
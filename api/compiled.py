@@ -0,0 +1,117 @@
+"""
+Pre-serialized responses (snapshots, with their compressed variants), compiled into one file.
+
+Without it, each worker process builds and compresses its own copy of the snapshots. With it, the workers map
+the file to memory, read-only, so that they share the same pages of the OS page cache, and serve the responses
+as slices of the mapping, without copying.
+
+Compile it (again) when the "vietnam_provinces" package or this app is upgraded,
+then point COMPILED_SNAPSHOTS_FILE to it:
+
+    python -m api.compiled /var/lib/provinces/snapshots.bin
+
+The file is replaced atomically, so the running workers keep their mapping of the old one until restarted.
+A file of another data version, or compiled by another version of this app, is ignored.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Hashable, Iterable
+from pathlib import Path
+from typing import cast
+
+import msgspec
+from logbook import Logger
+from vietnam_provinces import __data_version__
+
+from . import __version__
+from .snapshots import add_snapshots, iter_snapshots
+
+
+logger = Logger(__name__)
+
+MAGIC = b'VNPSNAP\x01'
+# Length of the header which follows the magic
+HEADER_SIZE = struct.Struct('<I')
+
+
+class CompiledHeader(msgspec.Struct):
+    data_version: str
+    # The serialization of responses (and their ETag) may change between versions of the app
+    app_version: str
+    # Snapshot key (ending with the content encoding), offset (from the end of header) and length of its content
+    entries: list[tuple[tuple[str | int, ...], int, int]]
+
+
+def write_compiled(path: Path, snapshots: Iterable[tuple[tuple[Hashable, ...], bytes | memoryview]]) -> int:
+    """Write the snapshots to the file. Return the number of them."""
+    entries: list[tuple[tuple[str | int, ...], int, int]] = []
+    contents = []
+    offset = 0
+    for key, content in snapshots:
+        # Keys are made of strings (including StrEnum members) and integers.
+        entries.append((cast(tuple[str | int, ...], key), offset, len(content)))
+        contents.append(content)
+        offset += len(content)
+    header = msgspec.json.encode(CompiledHeader(__data_version__, __version__, entries))
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with tmp_path.open('wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_SIZE.pack(len(header)))
+        f.write(header)
+        f.writelines(contents)
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+def load_compiled(path: Path) -> int:
+    """Map the file to memory and add its snapshots. Return the number of them, 0 if the file cannot be used."""
+    try:
+        with path.open('rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        logger.warning('Cannot map compiled snapshots {}: {}', path, e)
+        return 0
+    start = len(MAGIC) + HEADER_SIZE.size
+    if len(mm) < start or mm[: len(MAGIC)] != MAGIC:
+        logger.warning('{} is not a compiled snapshots file', path)
+        return 0
+    (header_size,) = HEADER_SIZE.unpack_from(mm, len(MAGIC))
+    try:
+        header = msgspec.json.decode(mm[start : start + header_size], type=CompiledHeader)
+    except msgspec.DecodeError as e:
+        logger.warning('Cannot read header of compiled snapshots {}: {}', path, e)
+        return 0
+    if header.data_version != __data_version__ or header.app_version != __version__:
+        logger.warning(
+            'Ignore {}, compiled from data version {} by app version {}', path, header.data_version, header.app_version
+        )
+        return 0
+    # The contents of a truncated file would be served cut short.
+    data_size = len(mm) - start - header_size
+    if any(offset < 0 or length < 0 or offset + length > data_size for _key, offset, length in header.entries):
+        logger.warning('Ignore {}, it is truncated', path)
+        return 0
+    # The slices keep the mapping open, as long as they are in use.
+    data = memoryview(mm)[start + header_size :]
+    add_snapshots((key, data[offset : offset + length]) for key, offset, length in header.entries)
+    logger.info('Mapped {} compiled snapshots from {}', len(header.entries), path)
+    return len(header.entries)
+
+
+def compile_snapshots(path: Path) -> int:
+    from .v1 import preload_snapshots as preload_v1_snapshots
+    from .v2 import preload_snapshots as preload_v2_snapshots
+
+    preload_v2_snapshots()
+    preload_v1_snapshots()
+    return write_compiled(path, iter_snapshots())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('Usage: python -m api.compiled <file>')
+    output = Path(sys.argv[1])
+    print(f'Compiled {compile_snapshots(output)} snapshots to {output}')
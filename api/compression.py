@@ -0,0 +1,89 @@
+import gzip
+from collections.abc import Callable
+
+from logbook import Logger
+
+
+# Compressors for the pre-serialized responses. Because each variant is built only once per data version,
+# we can afford the highest compression levels. Brotli and Zstandard are optional dependencies.
+
+logger = Logger(__name__)
+
+IDENTITY = 'identity'
+# Responses smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+
+def _compress_gzip(data: bytes) -> bytes:
+    # mtime=0 to make the output reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# Ordered by our preference, when client accepts several encodings with the same weight.
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {}
+
+try:
+    import brotli
+
+    def _compress_brotli(data: bytes) -> bytes:
+        return brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+
+    COMPRESSORS['br'] = _compress_brotli
+except ImportError:
+    logger.debug('Brotli is not available')
+
+try:
+    from compression import zstd  # type: ignore[import-not-found]
+
+    def _compress_zstd(data: bytes) -> bytes:
+        return zstd.compress(data, level=19)
+
+    COMPRESSORS['zstd'] = _compress_zstd
+except ImportError:
+    try:
+        import zstandard
+
+        def _compress_zstd(data: bytes) -> bytes:
+            return zstandard.ZstdCompressor(level=19).compress(data)
+
+        COMPRESSORS['zstd'] = _compress_zstd
+    except ImportError:
+        logger.debug('Zstandard is not available')
+
+COMPRESSORS['gzip'] = _compress_gzip
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    weights: dict[str, float] = {}
+    for item in header.split(','):
+        coding, *params = (s.strip() for s in item.split(';'))
+        if not coding:
+            continue
+        q = 1.0
+        for p in params:
+            name, _sep, value = p.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    return weights
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Pick the content coding we will use for a response, given Accept-Encoding header."""
+    if not accept_encoding:
+        return IDENTITY
+    weights = parse_accept_encoding(accept_encoding)
+    wildcard = weights.get('*', 0.0)
+    best, best_q = IDENTITY, 0.0
+    for coding in COMPRESSORS:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return COMPRESSORS[encoding](data)
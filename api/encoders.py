@@ -0,0 +1,49 @@
+from enum import StrEnum
+from typing import Any, Protocol
+
+import msgspec
+from pydantic import TypeAdapter
+
+
+# Encode the response records (msgspec structs from records_v1, records_v2) to JSON.
+# Our data comes from the trusted vietnam_provinces package, so validating it again on every response
+# is not necessary. The "pydantic" encoder is kept to cross-check and as a fallback.
+
+
+class EncoderName(StrEnum):
+    PYDANTIC = 'pydantic'
+    MSGSPEC = 'msgspec'
+
+
+class JsonEncoder(Protocol):
+    def encode(self, data: Any, schema: Any) -> bytes: ...
+
+
+class PydanticEncoder:
+    """Validate with the response schema, then serialize, like FastAPI does with `response_model`."""
+
+    def __init__(self):
+        self._adapters: dict[Any, TypeAdapter[Any]] = {}
+
+    def encode(self, data: Any, schema: type[Any]) -> bytes:
+        try:
+            adapter = self._adapters[schema]
+        except KeyError:
+            adapter = self._adapters[schema] = TypeAdapter(schema)
+        return adapter.dump_json(adapter.validate_python(msgspec.to_builtins(data)))
+
+
+class MsgspecEncoder:
+    """Encode the records as they are. The schema is only for API doc."""
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+
+    def encode(self, data: Any, schema: Any) -> bytes:
+        return self._encoder.encode(data)
+
+
+def get_encoder(name: EncoderName) -> JsonEncoder:
+    if name == EncoderName.PYDANTIC:
+        return PydanticEncoder()
+    return MsgspecEncoder()
@@ -0,0 +1,121 @@
+import io
+from collections.abc import Sequence
+from enum import StrEnum
+from importlib.util import find_spec
+from typing import Any
+
+import msgspec
+from starlette.requests import Request
+
+from .compression import parse_accept_encoding
+
+
+# Whole dataset in other formats than JSON, for the backends which load all of it.
+# MessagePack comes with msgspec. CBOR (cbor2) and Arrow / Parquet (pyarrow) are optional dependencies,
+# imported on first use only, because pyarrow is slow to import.
+#
+# The nested tree can only be given in the row formats. The columnar formats give one table per level,
+# in which the parents are referenced by code columns (like "province_code").
+
+# Path segment of the export endpoints, which are the only ones whose content depends on the Accept header
+EXPORT_PATH = '/export/'
+
+
+class ExportFormat(StrEnum):
+    JSON = 'json'
+    MSGPACK = 'msgpack'
+    CBOR = 'cbor'
+    ARROW = 'arrow'
+    PARQUET = 'parquet'
+
+
+# Ordered by our preference, when client accepts several formats with the same weight.
+MEDIA_TYPES = {
+    ExportFormat.JSON: 'application/json',
+    ExportFormat.MSGPACK: 'application/vnd.msgpack',
+    ExportFormat.CBOR: 'application/cbor',
+    ExportFormat.ARROW: 'application/vnd.apache.arrow.file',
+    ExportFormat.PARQUET: 'application/vnd.apache.parquet',
+}
+# Other media types seen in the wild
+_ALIASES = {
+    'application/msgpack': MEDIA_TYPES[ExportFormat.MSGPACK],
+    'application/x-msgpack': MEDIA_TYPES[ExportFormat.MSGPACK],
+    'application/x-parquet': MEDIA_TYPES[ExportFormat.PARQUET],
+}
+# For API doc
+EXPORT_RESPONSES: dict[int | str, dict[str, Any]] = {200: {'content': {t: {} for t in MEDIA_TYPES.values()}}}
+COLUMNAR_FORMATS = frozenset((ExportFormat.ARROW, ExportFormat.PARQUET))
+_REQUIRED_MODULES = {ExportFormat.CBOR: 'cbor2', ExportFormat.ARROW: 'pyarrow', ExportFormat.PARQUET: 'pyarrow'}
+AVAILABLE_FORMATS = tuple(f for f in ExportFormat if f not in _REQUIRED_MODULES or find_spec(_REQUIRED_MODULES[f]))
+
+
+def is_export_request(request: Request) -> bool:
+    return EXPORT_PATH in request.url.path
+
+
+def negotiate_format(accept: str) -> ExportFormat:
+    """Pick the available format with the highest weight in the Accept header. JSON if none is acceptable."""
+    weights: dict[str, float] = {}
+    for media_type, q in parse_accept_encoding(accept).items():
+        media_type = _ALIASES.get(media_type, media_type)
+        weights[media_type] = max(q, weights.get(media_type, 0.0))
+    wildcard = max(weights.get('*/*', 0.0), weights.get('application/*', 0.0))
+    best, best_q = ExportFormat.JSON, 0.0
+    for fmt in AVAILABLE_FORMATS:
+        q = weights.get(MEDIA_TYPES[fmt], wildcard)
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def request_format(request: Request, fmt: ExportFormat | None) -> ExportFormat:
+    """Format asked by the "format" query parameter, else by the Accept header."""
+    return fmt or negotiate_format(request.headers.get('accept', ''))
+
+
+def encode_rows(data: Any, fmt: ExportFormat) -> bytes:
+    """Encode records (possibly nested) to one of the row formats."""
+    if fmt == ExportFormat.MSGPACK:
+        return msgspec.msgpack.encode(data)
+    if fmt == ExportFormat.CBOR:
+        import cbor2
+
+        return cbor2.dumps(msgspec.to_builtins(data))
+    if fmt == ExportFormat.JSON:
+        return msgspec.json.encode(data)
+    raise ValueError(f'{fmt} is not a row format')
+
+
+def encode_table(records: Sequence[msgspec.Struct], fmt: ExportFormat) -> bytes:
+    """Encode flat records (of one type) to one of the columnar formats. Nested fields (like "wards") are left out."""
+    import pyarrow as pa
+
+    types = {int: pa.int32(), str: pa.string()}
+    # Few distinct values, better stored once
+    dictionary_fields = ('division_type',)
+    columns = {}
+    for field in msgspec.structs.fields(type(records[0])):
+        if field.type not in types:
+            continue
+        values = pa.array([getattr(r, field.name) for r in records], types[field.type])
+        columns[field.name] = values.dictionary_encode() if field.name in dictionary_fields else values
+    table = pa.table(columns)
+    sink = io.BytesIO()
+    if fmt == ExportFormat.ARROW:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif fmt == ExportFormat.PARQUET:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, sink, compression='zstd')
+    else:
+        raise ValueError(f'{fmt} is not a columnar format')
+    return sink.getvalue()
+
+
+def encode_level(records: Sequence[msgspec.Struct], fmt: ExportFormat) -> bytes:
+    """Encode the records of one level, to any format."""
+    if fmt in COLUMNAR_FORMATS:
+        return encode_table(records, fmt)
+    return encode_rows(records, fmt)
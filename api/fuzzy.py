@@ -0,0 +1,194 @@
+import math
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Sequence
+from functools import cache, partial
+from typing import Any, NamedTuple
+
+from fastapi import Query
+from logbook import Logger
+from vietnam_provinces import Province, Ward
+
+from .paging import ListParams
+from .search import SearchIndex
+from .suggest import LEVELS, normalize, strip_division_type
+
+
+# Typo-tolerant search, by trigram similarity (Dice coefficient) between the query and names,
+# both normalized (no diacritics, no division type). It finds "thu dc" or "Thủ Đứ" for "Phường Thủ Đức".
+#
+# To keep latency bounded, even for short queries, we only look at the records which can reach the cutoff score:
+# - Their number of trigrams must be in a window around the query's (a short query cannot be similar to a long name).
+#   Postings are sorted by that number, so the window is a slice.
+# Then common trigrams are counted from the postings, there is no set intersection to compute per record.
+# A search limited to a parent division just scores all records in it.
+
+logger = Logger(__name__)
+
+DEFAULT_MIN_SCORE = 0.5
+MAX_FUZZY_RESULTS = 100
+
+
+class FuzzyParams(NamedTuple):
+    enabled: bool
+    min_score: float
+
+
+def fuzzy_params(
+    fuzzy: bool = Query(
+        False,
+        title='Tolerate typos',
+        description=f'Rank results by similarity of names. Only the best {MAX_FUZZY_RESULTS} results are returned.',
+    ),
+    min_score: float = Query(
+        DEFAULT_MIN_SCORE, gt=0, le=1, title='For fuzzy search, minimum similarity, from 0 to 1 (exact)'
+    ),
+) -> FuzzyParams:
+    return FuzzyParams(fuzzy, min_score)
+
+
+def trigrams(text: str) -> frozenset[str]:
+    if not text:
+        return frozenset()
+    padded = f'  {text} '
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def _normalize(name: str) -> str:
+    return strip_division_type(normalize(name).strip())
+
+
+class FuzzyIndex:
+    def __init__(self, records: Iterable[Any], scopes: Sequence[str] = ()):
+        self.records = tuple(records)
+        self.scopes = tuple(scopes)
+        self.grams = tuple(trigrams(_normalize(r.name)) for r in self.records)
+        self.levels = tuple(LEVELS.get(r.division_type, len(LEVELS)) for r in self.records)
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        members: defaultdict[tuple[str, int], list[int]] = defaultdict(list)
+        for i, grams in enumerate(self.grams):
+            for attr in self.scopes:
+                members[(attr, int(getattr(self.records[i], attr)))].append(i)
+            for gram in grams:
+                postings[gram].append(i)
+        # Each posting list is sorted by the number of trigrams of the record, along with those numbers, to bisect.
+        self.postings: dict[str, tuple[tuple[int, ...], tuple[int, ...]]] = {}
+        for gram, ids in postings.items():
+            ids.sort(key=lambda i: len(self.grams[i]))
+            self.postings[gram] = (tuple(ids), tuple(len(self.grams[i]) for i in ids))
+        self.members = {key: tuple(ids) for key, ids in members.items()}
+
+    def __len__(self):
+        return len(self.records)
+
+    def scored_search(
+        self, name: str, min_score: float = DEFAULT_MIN_SCORE, limit: int = MAX_FUZZY_RESULTS, **scope: int
+    ) -> tuple[tuple[Any, float], ...]:
+        """
+        Records similar to the name, with their score, best first.
+        Optionally limited to one parent division, like `search('thu dc', province_code=79)`.
+        """
+        if scope:
+            ((attr, code),) = scope.items()
+            if attr not in self.scopes:
+                raise ValueError(f'Fuzzy index is not partitioned by {attr}')
+        query = trigrams(_normalize(name))
+        if not query:
+            return ()
+        size = len(query)
+        # Dice = 2 * common / (size + other size). From it, the minimum of common trigrams, and bounds of other size.
+        # (With some tolerance for rounding errors)
+        needed = max(1, math.ceil(min_score * size / (2 - min_score) - 1e-9))
+        min_size, max_size = needed, math.floor(size * (2 - min_score) / min_score + 1e-9)
+        if scope:
+            # Few records, just score them all
+            members = self.members.get((attr, int(code)), ())
+            counts = {i: len(query & self.grams[i]) for i in members if min_size <= len(self.grams[i]) <= max_size}
+        else:
+            counts = Counter[int]()
+            for gram in query:
+                if posting := self.postings.get(gram):
+                    ids, sizes = posting
+                    counts.update(ids[bisect_left(sizes, min_size) : bisect_right(sizes, max_size)])
+        scored = []
+        for i, common in counts.items():
+            if common < needed:
+                continue
+            score = 2 * common / (size + len(self.grams[i]))
+            if score >= min_score:
+                scored.append((-score, self.levels[i], i))
+        scored.sort()
+        return tuple((self.records[i], -s) for s, _level, i in scored[:limit])
+
+    def search(
+        self, name: str, min_score: float = DEFAULT_MIN_SCORE, limit: int = MAX_FUZZY_RESULTS, **scope: int
+    ) -> tuple[Any, ...]:
+        return tuple(r for r, _s in self.scored_search(name, min_score, limit, **scope))
+
+
+def ranking_limit(page: ListParams | None) -> int:
+    """Number of fuzzy results to rank, enough for the requested page."""
+    # A cursor is looked up in the ranked results, so we cannot tell how many of them are needed.
+    if page is None or page.limit is None or page.after is not None:
+        return MAX_FUZZY_RESULTS
+    return min(page.offset + page.limit, MAX_FUZZY_RESULTS)
+
+
+def pick_search(
+    get_index: Callable[[], SearchIndex],
+    get_fuzzy_index: Callable[[], FuzzyIndex],
+    params: FuzzyParams,
+    page: ListParams | None = None,
+) -> Callable[..., Sequence[Any]]:
+    """
+    Return the search function of the normal or fuzzy index, following the query parameters.
+    Fuzzy search only ranks as many results as needed for the page.
+    """
+    if params.enabled:
+        return partial(get_fuzzy_index().search, min_score=params.min_score, limit=ranking_limit(page))
+    return get_index().search
+
+
+@cache
+def fuzzy_province_index() -> FuzzyIndex:
+    return FuzzyIndex(Province.iter_all())
+
+
+@cache
+def fuzzy_ward_index() -> FuzzyIndex:
+    return FuzzyIndex(Ward.iter_all(), ('province_code',))
+
+
+@cache
+def legacy_fuzzy_province_index() -> FuzzyIndex:
+    from vietnam_provinces.legacy import Province as LegacyProvince
+
+    return FuzzyIndex(LegacyProvince.iter_all())
+
+
+@cache
+def legacy_fuzzy_district_index() -> FuzzyIndex:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+
+    return FuzzyIndex(LegacyDistrict.iter_all(), ('province_code',))
+
+
+@cache
+def legacy_fuzzy_ward_index() -> FuzzyIndex:
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    return FuzzyIndex(LegacyWard.iter_all(), ('district_code', 'province_code'))
+
+
+def _build(*builders: Callable[[], FuzzyIndex]):
+    for build in builders:
+        index = build()
+        logger.debug('Built fuzzy index of {} records, {} trigrams', len(index), len(index.postings))
+
+
+def build_fuzzy_indexes():
+    _build(fuzzy_province_index, fuzzy_ward_index)
+
+
+def build_legacy_fuzzy_indexes():
+    _build(legacy_fuzzy_province_index, legacy_fuzzy_district_index, legacy_fuzzy_ward_index)
@@ -0,0 +1,117 @@
+"""
+Snapshots of earlier versions of the (2025) dataset, to tell clients what changed since the version they have.
+
+When the "vietnam_provinces" package is upgraded, save the snapshot of the new data with:
+
+    python -m api.history
+
+The snapshots of the current and previous data versions are shipped in "api/data_history".
+For clients on older versions, copy those to another folder, set it in the DATASET_HISTORY_DIR environment variable
+(which the server also reads), and save the older snapshots there from the matching "vietnam_provinces" releases:
+
+    cp api/data_history/*.json.gz /srv/history/
+    pip install --target /tmp/vp vietnam-provinces==2025.8.1
+    PYTHONPATH=/tmp/vp:. DATASET_HISTORY_DIR=/srv/history python -m api.history
+"""
+
+import gzip
+import os
+from collections.abc import Iterable
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+import msgspec
+from logbook import Logger
+from vietnam_provinces import __data_version__
+
+from .records_v2 import DatasetDeltaRecord, ProvinceChangesRecord, ProvinceRecord, WardChangesRecord, WardRecord
+from .store import division_store
+
+
+logger = Logger(__name__)
+
+DEFAULT_HISTORY_DIR = Path(__file__).parent / 'data_history'
+SUFFIX = '.json.gz'
+
+
+class DatasetSnapshot(msgspec.Struct):
+    data_version: str
+    provinces: tuple[ProvinceRecord, ...]
+    wards: tuple[WardRecord, ...]
+
+
+@cache
+def current_snapshot() -> DatasetSnapshot:
+    store = division_store()
+    return DatasetSnapshot(__data_version__, tuple(store.provinces.records), tuple(store.wards.records))
+
+
+def diff_records(old: Iterable[Any], new: Iterable[Any]) -> tuple[tuple[Any, ...], tuple[Any, ...], tuple[int, ...]]:
+    """Compare two lists of records by code. Return the added, changed (in new form) records and removed codes."""
+    old_by_code = {r.code: r for r in old}
+    added, changed = [], []
+    for record in new:
+        if (previous := old_by_code.pop(record.code, None)) is None:
+            added.append(record)
+        elif previous != record:
+            changed.append(record)
+    return tuple(added), tuple(changed), tuple(sorted(old_by_code))
+
+
+class DatasetHistory:
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self._snapshots: dict[str, DatasetSnapshot] = {}
+        self._deltas: dict[tuple[str, str], DatasetDeltaRecord] = {}
+        # The folder is listed once, snapshots added to it later are seen after restart.
+        self._versions: tuple[str, ...] | None = None
+
+    def versions(self) -> tuple[str, ...]:
+        """Data versions which we can compute a delta from, oldest first."""
+        if self._versions is None:
+            folder = self.folder
+            stored = (p.name.removesuffix(SUFFIX) for p in folder.glob(f'*{SUFFIX}')) if folder.is_dir() else ()
+            self._versions = tuple(sorted({*stored, __data_version__}))
+        return self._versions
+
+    def load(self, version: str) -> DatasetSnapshot | None:
+        if version == __data_version__:
+            return current_snapshot()
+        # Only look up names from the folder listing, so that "version" is never used to build a path.
+        if version not in self.versions():
+            return None
+        if (snapshot := self._snapshots.get(version)) is None:
+            content = gzip.decompress((self.folder / f'{version}{SUFFIX}').read_bytes())
+            snapshot = self._snapshots[version] = msgspec.json.decode(content, type=DatasetSnapshot)
+            logger.debug('Loaded dataset snapshot {}', version)
+        return snapshot
+
+    def delta(self, since: str) -> DatasetDeltaRecord | None:
+        """Changes from the "since" version to the current one, or None if we don't have that version."""
+        key = (since, __data_version__)
+        if (delta := self._deltas.get(key)) is not None:
+            return delta
+        if (old := self.load(since)) is None:
+            return None
+        new = current_snapshot()
+        delta = self._deltas[key] = DatasetDeltaRecord(
+            since,
+            new.data_version,
+            ProvinceChangesRecord(*diff_records(old.provinces, new.provinces)),
+            WardChangesRecord(*diff_records(old.wards, new.wards)),
+        )
+        return delta
+
+    def save_current(self) -> Path:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder / f'{__data_version__}{SUFFIX}'
+        # Fixed mtime, so that saving the same data twice gives the same file
+        path.write_bytes(gzip.compress(msgspec.json.encode(current_snapshot()), 9, mtime=0))
+        self._versions = None
+        return path
+
+
+if __name__ == '__main__':
+    folder = Path(os.getenv('DATASET_HISTORY_DIR', DEFAULT_HISTORY_DIR))
+    print(f'Saved {DatasetHistory(folder).save_current()}')
@@ -0,0 +1,63 @@
+import hashlib
+from datetime import UTC, datetime
+from email.utils import format_datetime
+
+from starlette.requests import Request
+from vietnam_provinces import __data_version__
+
+from . import __version__
+from .compression import negotiate_encoding
+from .export import is_export_request, negotiate_format
+
+
+# Our responses are pure functions of the request and the data (plus our code) version,
+# so the ETag can be computed from the request alone, without running the handler.
+
+VERSIONED_PREFIXES = ('/api/v1/', '/api/v2/')
+
+
+def is_versioned_request(request: Request) -> bool:
+    return request.method in ('GET', 'HEAD') and request.url.path.startswith(VERSIONED_PREFIXES)
+
+
+def canonical_request(request: Request) -> str:
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.multi_items()))
+    return f'{request.url.path}?{query}'
+
+
+def representation_key(request: Request) -> str:
+    """Everything that the response to a GET request depends on."""
+    # Different content codings are different representations, so they must not share the ETag.
+    encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+    source = f'{__version__}|{__data_version__}|{canonical_request(request)}|{encoding}'
+    if is_export_request(request):
+        # Same for the formats picked by Accept header
+        source += f'|{negotiate_format(request.headers.get("accept", ""))}'
+    return source
+
+
+def make_etag(request: Request) -> str:
+    digest = hashlib.blake2b(representation_key(request).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison, as required for If-None-Match (RFC 9110, section 13.1.2)
+    candidates = (t.strip().removeprefix('W/') for t in if_none_match.split(','))
+    return etag in candidates
+
+
+def data_version_datetime() -> datetime:
+    return datetime.strptime(__data_version__, '%Y-%m-%d').replace(tzinfo=UTC)
+
+
+def format_http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return format_datetime(value.astimezone(UTC), usegmt=True)
+
+
+def vary_header(request: Request) -> str:
+    return 'Accept-Encoding, Accept' if is_export_request(request) else 'Accept-Encoding'
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections.abc import Callable
+from enum import StrEnum
+from typing import Any
+
+from logbook import Logger
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
+
+
+# Parts of the app which are slow to import or build (the legacy dataset), loaded on first use
+# or in background after the server has started, so that a new instance can serve /api/v2 sooner.
+
+logger = Logger(__name__)
+
+
+class LoadMode(StrEnum):
+    # Load at startup, before serving requests
+    EAGER = 'eager'
+    # Load in background, after the server is started
+    BACKGROUND = 'background'
+    # Load on first request which needs it
+    LAZY = 'lazy'
+
+
+class LoadState(StrEnum):
+    PENDING = 'pending'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+
+
+class Lazy:
+    def __init__(self, name: str, load: Callable[[], Any]):
+        self.name = name
+        self._load = load
+        self.value: Any = None
+        self.state = LoadState.PENDING
+        # A first request and the background preloading can ask at the same time, in different threads.
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self.value is not None:
+            return self.value
+        with self._lock:
+            if self.value is None:
+                self.state = LoadState.LOADING
+                start = time.perf_counter()
+                try:
+                    self.value = self._load()
+                except Exception:
+                    self.state = LoadState.FAILED
+                    logger.exception('Failed to load {}', self.name)
+                    raise
+                self.state = LoadState.READY
+                logger.info('Loaded {} in {:.2f}s', self.name, time.perf_counter() - start)
+        return self.value
+
+    async def get_async(self) -> Any:
+        # Loading is blocking, don't hold the event loop with it.
+        return self.value if self.value is not None else await run_in_threadpool(self.get)
+
+
+class LazyApp:
+    """ASGI app which imports the real app on first request."""
+
+    def __init__(self, lazy: Lazy):
+        self.lazy = lazy
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        app = await self.lazy.get_async()
+        await app(scope, receive, send)
@@ -0,0 +1,113 @@
+from functools import cache
+
+from logbook import Logger
+from vietnam_provinces import Ward
+from vietnam_provinces.helpers import normalize_search_name
+
+from .lazy import Lazy
+from .records_v2 import LegacyWardRecord, WardRecord, WardWithLegacySourceRecord
+from .search import PROVINCE_DIVISION_WORDS, MatchRule, SearchIndex, match_score
+
+
+# Tables between legacy (pre-2025) wards and new wards, built once, so that converting one way or the other
+# is a dict lookup, instead of walking the conversion table (and building the records again) on each request.
+# The results are the same as `Ward.search_from_legacy()` and `Ward.get_legacy_sources()`, including ordering.
+# Those methods read the conversion table from a private module of vietnam_provinces, so do we.
+
+logger = Logger(__name__)
+
+_PREFIXES = ('xã ', 'phường ', 'thị trấn ')
+
+
+def _prefix_bonus(division_type: str) -> int:
+    from vietnam_provinces.legacy import VietNamDivisionType
+
+    # When scores are equal, "Thị trấn" comes first, then "Phường", then "Xã".
+    # Keys are StrEnum members, which match the division type as plain string.
+    bonuses: dict[str, int] = {
+        VietNamDivisionType.THI_TRAN: 0,
+        VietNamDivisionType.PHUONG: 3,
+        VietNamDivisionType.XA: 6,
+    }
+    return bonuses.get(division_type, 0)
+
+
+class LegacyWardMap:
+    def __init__(self):
+        from vietnam_provinces._ward_conversion_2025 import NEW_TO_OLD, OLD_TO_NEW
+        from vietnam_provinces.legacy import Ward as LegacyWard
+
+        legacy_records = {int(w.code): LegacyWardRecord.from_legacy_ward(w) for w in LegacyWard.iter_all()}
+        ward_records = {int(w.code): WardRecord.from_ward(w) for w in Ward.iter_all()}
+        # Legacy ward code -> new wards, with the legacy code as source code
+        self.forward: dict[int, tuple[WardWithLegacySourceRecord, ...]] = {}
+        for old_code, entry in OLD_TO_NEW.items():
+            self.forward[old_code] = tuple(
+                WardWithLegacySourceRecord(old_code, ward_records[nw.code])
+                for nw in entry.new_wards
+                if nw.code in ward_records
+            )
+        # New ward code -> legacy wards which were merged into it
+        self.reverse: dict[int, tuple[LegacyWardRecord, ...]] = {
+            new_code: tuple(legacy_records[ow.code] for ow in entry.old_wards if ow.code in legacy_records)
+            for new_code, entry in NEW_TO_OLD.items()
+        }
+        self.legacy_wards = legacy_records
+        # Name index, over legacy wards in the same order as the conversion table, which is the order
+        # vietnam_provinces walks when searching by name. Partitioned by legacy province, for scoped searches.
+        self.name_index = SearchIndex(
+            (legacy_records[c] for c in OLD_TO_NEW if c in legacy_records),
+            MatchRule.ALL_WORDS,
+            PROVINCE_DIVISION_WORDS,
+            ('province_code',),
+        )
+        self.prefix_bonuses = tuple(_prefix_bonus(e.record.division_type) for e in self.name_index.entries)
+
+    def from_legacy_code(self, code: int) -> tuple[WardWithLegacySourceRecord, ...]:
+        return self.forward.get(code, ())
+
+    def to_legacies(self, code: int) -> tuple[LegacyWardRecord, ...]:
+        return self.reverse.get(code, ())
+
+    def search_by_legacy_name(self, name: str, province_code: int = 0) -> tuple[WardWithLegacySourceRecord, ...]:
+        # Limited to the legacy wards of one legacy province, before the new wards are deduplicated
+        scope = {'province_code': province_code} if province_code else {}
+        candidates = self.name_index.candidates(name, **scope)
+        if not candidates:
+            return ()
+        normalized_query = normalize_search_name(name)
+        has_prefix = name.lower().startswith(_PREFIXES)
+        seen: set[int] = set()
+        scored: list[tuple[int, WardWithLegacySourceRecord]] = []
+        for i in candidates:
+            entry = self.name_index.entries[i]
+            score = match_score(name, normalized_query, entry)
+            # Same as vietnam_provinces: exact match with prefix given in query doesn't get the bonus.
+            if score < 1000 and not (has_prefix and score <= 1):
+                score += self.prefix_bonuses[i]
+            # A new ward is listed once, with the first legacy ward (in table order) which maps to it.
+            for item in self.forward.get(entry.record.code, ()):
+                if item.ward.code not in seen:
+                    seen.add(item.ward.code)
+                    scored.append((score, item))
+        scored.sort(key=lambda x: x[0])
+        return tuple(item for _s, item in scored)
+
+    def search(self, name: str = '', code: int = 0) -> tuple[WardWithLegacySourceRecord, ...]:
+        """Same as `Ward.search_from_legacy()`."""
+        if code > 0:
+            return self.from_legacy_code(code)
+        if not name:
+            return ()
+        return self.search_by_legacy_name(name)
+
+
+@cache
+def legacy_ward_map() -> LegacyWardMap:
+    ward_map = LegacyWardMap()
+    logger.debug('Built legacy ward map of {} legacy wards, {} new wards', len(ward_map.forward), len(ward_map.reverse))
+    return ward_map
+
+
+# For handlers, which must not build it in the event loop, and for the readiness report
+lazy_legacy_ward_map = Lazy('legacy_ward_map', legacy_ward_map)
@@ -0,0 +1,6 @@
+# Limits of request sizes, shared by the v1 and v2 APIs.
+
+# Longest address we parse, in characters
+MAX_ADDRESS_LENGTH = 500
+# Limit the number of items in one batch request, to keep response size and latency bounded.
+BATCH_MAX_SIZE = 1000
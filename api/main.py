@@ -1,21 +1,97 @@
+import asyncio
+import math
 import os
 import sys
+from contextlib import asynccontextmanager
+from datetime import datetime
 from http import HTTPStatus
+from pathlib import Path
 
 from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response
 from logbook import Logger, StreamHandler
 from logbook.more import ColorizedStderrHandler
 from pydantic_settings import BaseSettings
+from starlette.concurrency import run_in_threadpool
 
 from . import __version__
-from .v1 import api_v1
-from .v2 import api_v2
+from .address import build_legacy_parsers, build_parsers
+from .compiled import load_compiled
+from .encoders import EncoderName, get_encoder
+from .fuzzy import build_fuzzy_indexes, build_legacy_fuzzy_indexes
+from .history import DEFAULT_HISTORY_DIR, DatasetHistory
+from .http_cache import (
+    data_version_datetime,
+    etag_matches,
+    format_http_date,
+    is_versioned_request,
+    make_etag,
+    vary_header,
+)
+from .lazy import Lazy, LazyApp, LoadMode, LoadState
+from .legacy_map import lazy_legacy_ward_map
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .metrics import MetricsMiddleware, metrics
+from .ratelimit import (
+    Blocklist,
+    MemoryBucketStore,
+    RateLimiter,
+    SharedBucketStore,
+    is_api_request,
+    is_blockable_request,
+    request_cost,
+)
+from .response_cache import ResponseCache, ResponseCacheMiddleware
+from .search import build_indexes, build_legacy_indexes
+from .store import build_legacy_stores, build_stores
+from .store import options as store_options
+from .suggest import build_legacy_suggest_indexes, build_suggest_indexes
+from .v2 import TooManyRequestsError, api_v2
+from .v2 import eh as v2_error_handler
+from .v2 import preload_snapshots as preload_v2_snapshots
 
 
 class Settings(BaseSettings):
     tracking: bool = False
     cdn_cache_interval: int = 30
+    # Cache lifetime for browsers. Our data only changes with a new data version, so origins which
+    # purge their CDN on deployment can set it long and turn on "immutable".
+    browser_cache_max_age: int = 0
+    cache_immutable: bool = False
+    # Value for "Last-Modified" header. Default to the data version date.
+    last_modified: datetime | None = None
+    # JSON encoder for each sub-app. "msgspec" skips validating the (trusted) data again with Pydantic.
+    v1_encoder: EncoderName = EncoderName.MSGSPEC
+    v2_encoder: EncoderName = EncoderName.MSGSPEC
+    # Build the pre-serialized responses at startup, instead of on first request.
+    preload_snapshots: bool = False
+    # Or map them from a file compiled beforehand, shared by all workers (see api.compiled).
+    compiled_snapshots_file: Path | None = None
+    # When to load the legacy (pre-2025) dataset, which is needed by /api/v1 and the legacy ward conversion.
+    # On Vercel, the function can be frozen after responding, so background loading doesn't help there.
+    legacy_loading: LoadMode = LoadMode.LAZY if os.getenv('VERCEL') else LoadMode.BACKGROUND
+    # Clients (IP addresses or networks, comma-separated) which are refused the heavy requests.
+    blacklisted_clients: str = ''
+    # File with more of them, one per line. It is reloaded when modified.
+    blocklist_file: Path | None = None
+    # Per-client token bucket: request costs more tokens for bigger response (see ratelimit.request_cost).
+    rate_limit: bool = False
+    rate_limit_rate: float = 10.0
+    rate_limit_burst: float = 300.0
+    # Keep buckets in this file, mapped to memory, so that all workers enforce one limit.
+    rate_limit_shared_file: Path | None = None
+    # Snapshots of earlier data versions, to compute the changes since them (see api.history).
+    dataset_history_dir: Path = DEFAULT_HISTORY_DIR
+    # In-process cache of the responses to queries with parameters (searches, filtered lists).
+    response_cache: bool = True
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entry_bytes: int = 1024 * 1024
+    # Seconds. Entries of an old data version are never served, so it only bounds how long unpopular entries stay.
+    response_cache_ttl: float = 3600
+    # Collect request metrics and expose them at /metrics, in Prometheus format.
+    metrics: bool = True
+    # Keep ward records as compact columns (see api.store): much less memory, slower lookups of wards.
+    compact_wards: bool = False
 
 
 logger = Logger(__name__)
@@ -26,12 +102,91 @@ else:
     StreamHandler(sys.stdout).push_application()
 
 
+settings = Settings()
+store_options.compact_wards = settings.compact_wards
+blocklist = Blocklist(settings.blacklisted_clients, settings.blocklist_file)
+
+
+def build_rate_limiter() -> RateLimiter | None:
+    if not settings.rate_limit:
+        return None
+    if settings.rate_limit_shared_file:
+        store: MemoryBucketStore | SharedBucketStore = SharedBucketStore(settings.rate_limit_shared_file)
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(settings.rate_limit_rate, settings.rate_limit_burst, store)
+
+
+rate_limiter = build_rate_limiter()
+response_cache = ResponseCache(
+    settings.response_cache_max_bytes, settings.response_cache_ttl, settings.response_cache_max_entry_bytes
+)
+
+
+def load_api_v1() -> FastAPI:
+    # Importing it imports the legacy dataset. Its tables and indexes are built here too, in the thread which
+    # loads it, so that the first requests to v1 don't build them in the event loop.
+    from .v1 import api_v1
+
+    build_legacy_stores()
+    build_legacy_indexes()
+    build_legacy_suggest_indexes()
+    build_legacy_fuzzy_indexes()
+    build_legacy_parsers()
+    api_v1.state.encoder = get_encoder(settings.v1_encoder)
+    return api_v1
+
+
+lazy_api_v1 = Lazy('api_v1', load_api_v1)
+
+
+def preload_legacy():
+    lazy_api_v1.get()
+    lazy_legacy_ward_map.get()
+    if settings.preload_snapshots:
+        from .v1 import preload_snapshots as preload_v1_snapshots
+
+        preload_v1_snapshots()
+
+
+async def preload_legacy_in_background():
+    try:
+        await run_in_threadpool(preload_legacy)
+    except Exception:
+        # Already logged. The failed parts will be tried again on first use.
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    build_stores()
+    build_indexes()
+    build_suggest_indexes()
+    build_fuzzy_indexes()
+    build_parsers()
+    if settings.compiled_snapshots_file:
+        load_compiled(settings.compiled_snapshots_file)
+    if settings.preload_snapshots:
+        logger.info('Preloading snapshots...')
+        preload_v2_snapshots()
+    preloading = None
+    if settings.legacy_loading == LoadMode.EAGER:
+        preload_legacy()
+    elif settings.legacy_loading == LoadMode.BACKGROUND:
+        preloading = asyncio.create_task(preload_legacy_in_background())
+    yield
+    if preloading:
+        preloading.cancel()
+
+
 app = FastAPI(
     title='Vietnam Provinces online API',
     version=__version__,
+    lifespan=lifespan,
 )
-settings = Settings()
-app.mount('/api/v1', api_v1)
+api_v2.state.encoder = get_encoder(settings.v2_encoder)
+api_v2.state.dataset_history = DatasetHistory(settings.dataset_history_dir)
+app.mount('/api/v1', LazyApp(lazy_api_v1))
 app.mount('/api/v2', api_v2)
 
 
@@ -40,9 +195,88 @@ def redirect_api():
     return RedirectResponse(url='/api/v1/', status_code=HTTPStatus.TEMPORARY_REDIRECT)
 
 
+@app.get('/metrics', include_in_schema=False)
+def show_metrics():
+    if not settings.metrics:
+        return Response(status_code=HTTPStatus.NOT_FOUND)
+    content = metrics.render() + (response_cache.render() if settings.response_cache else '')
+    return PlainTextResponse(content, media_type=METRICS_CONTENT_TYPE, headers={'Cache-Control': 'no-store'})
+
+
+@app.get('/ready', include_in_schema=False)
+def show_readiness():
+    components = {c.name: c.state for c in (lazy_api_v1, lazy_legacy_ward_map)}
+    # In lazy mode, the parts not loaded yet are not waited for.
+    waited = {LoadState.READY, LoadState.PENDING} if settings.legacy_loading == LoadMode.LAZY else {LoadState.READY}
+    ready = all(state in waited for state in components.values())
+    return JSONResponse(
+        {'ready': ready, 'legacy_loading': settings.legacy_loading, 'components': components},
+        status_code=HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+def build_cache_control() -> str:
+    # Ref: https://vercel.com/docs/edge-network/headers#cache-control-header
+    directives = [f's-maxage={settings.cdn_cache_interval}', 'stale-while-revalidate']
+    if settings.browser_cache_max_age:
+        directives.insert(0, f'max-age={settings.browser_cache_max_age}')
+    if settings.cache_immutable:
+        directives.append('immutable')
+    return ', '.join(directives)
+
+
+# Added before guide_cdn_cache, to run inside it: revalidation requests don't need the cached body.
+if settings.response_cache:
+    app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+
 @app.middleware('http')
 async def guide_cdn_cache(request: Request, call_next):
+    if not is_versioned_request(request):
+        response = await call_next(request)
+        response.headers.setdefault('Cache-Control', build_cache_control())
+        return response
+    etag = make_etag(request)
+    validator_headers = {
+        'ETag': etag,
+        'Last-Modified': format_http_date(settings.last_modified or data_version_datetime()),
+        'Cache-Control': build_cache_control(),
+        'Vary': vary_header(request),
+    }
+    # Answer revalidation before any handler work.
+    if (if_none_match := request.headers.get('if-none-match')) and etag_matches(etag, if_none_match):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=validator_headers)
     response = await call_next(request)
-    # Ref: https://vercel.com/docs/edge-network/headers#cache-control-header
-    response.headers['Cache-Control'] = f's-maxage={settings.cdn_cache_interval}, stale-while-revalidate'
+    if response.status_code == HTTPStatus.OK:
+        response.headers.update(validator_headers)
+    else:
+        response.headers['Cache-Control'] = validator_headers['Cache-Control']
     return response
+
+
+def too_many_requests(request: Request, retry_after: float | None = None) -> Response:
+    headers = {'Retry-After': str(math.ceil(retry_after))} if retry_after else None
+    # Each API version answers errors in its own format.
+    if request.url.path.startswith('/api/v2/'):
+        return v2_error_handler(request, TooManyRequestsError(headers=headers))
+    return JSONResponse({'detail': 'Too Many Requests'}, status_code=HTTPStatus.TOO_MANY_REQUESTS, headers=headers)
+
+
+# Added last, to run first.
+@app.middleware('http')
+async def limit_rate(request: Request, call_next):
+    if not is_api_request(request):
+        return await call_next(request)
+    client_ip = request.client.host if request.client else None
+    if is_blockable_request(request) and (not client_ip or client_ip in blocklist):
+        return too_many_requests(request)
+    if rate_limiter and client_ip and (wait := rate_limiter.acquire(client_ip, request_cost(request))):
+        logger.info('Rate limit client {}, retry after {:.1f}s', client_ip, wait)
+        return too_many_requests(request, wait)
+    return await call_next(request)
+
+
+# Added after other middlewares, to also measure them.
+if settings.metrics:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
@@ -0,0 +1,191 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.routing import BaseRoute, Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# Request metrics, exposed in Prometheus text format.
+# Routes are labeled by their template (like "/api/v2/w/{code}"), not the raw path,
+# to keep the number of series bounded.
+# Each process has its own numbers. With many workers, Prometheus should scrape and sum them.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_ROUTE = '<unmatched>'
+# The method comes from the client, any other token is labeled as OTHER_METHOD, to keep the series bounded.
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'OPTIONS'))
+OTHER_METHOD = 'other'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # The last one is for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestTiming:
+    __slots__ = ('serialization',)
+
+    def __init__(self):
+        self.serialization = 0.0
+
+
+_timing: ContextVar[RequestTiming | None] = ContextVar('request_timing', default=None)
+
+
+@contextmanager
+def serialization_timer() -> Iterator[None]:
+    """Count the time in the block as serialization time of the current request."""
+    timing = _timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.serialization += time.perf_counter() - start
+
+
+class Metrics:
+    def __init__(self):
+        self.requests: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.response_size: dict[tuple[str, str], Histogram] = {}
+        self.handler_time: dict[tuple[str, str], Histogram] = {}
+        self.serialization_time: dict[tuple[str, str], Histogram] = {}
+
+    @staticmethod
+    def _histogram(family: dict[tuple[str, str], Histogram], key: tuple[str, str], buckets: Sequence[float]):
+        try:
+            return family[key]
+        except KeyError:
+            histogram = family[key] = Histogram(buckets)
+            return histogram
+
+    def record(
+        self, method: str, route: str, status: int, duration: float, size: int, handler: float, serialization: float
+    ):
+        key = (method, route)
+        self.requests[(method, route, status)] += 1
+        self._histogram(self.latency, key, LATENCY_BUCKETS).observe(duration)
+        self._histogram(self.response_size, key, SIZE_BUCKETS).observe(size)
+        self._histogram(self.handler_time, key, LATENCY_BUCKETS).observe(handler)
+        self._histogram(self.serialization_time, key, LATENCY_BUCKETS).observe(serialization)
+
+    def render(self) -> str:
+        lines = [
+            '# HELP http_requests_total Number of HTTP requests.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        families = (
+            ('http_request_duration_seconds', 'Time to send the whole response.', self.latency),
+            ('http_response_size_bytes', 'Size of response body, as sent.', self.response_size),
+            ('http_handler_duration_seconds', 'Time to start the response, except serialization.', self.handler_time),
+            ('http_serialization_duration_seconds', 'Time spent in JSON encoding.', self.serialization_time),
+        )
+        for name, help_text, family in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (method, route), h in sorted(family.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip((*h.buckets, '+Inf'), h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {h.sum}')
+                lines.append(f'{name}_count{{{labels}}} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        self.__init__()
+
+
+metrics = Metrics()
+
+
+def match_template(routes: Sequence[BaseRoute], scope: Scope) -> str | None:
+    # For responses sent by middlewares before routing (like 304 and 429), find the route the same way Starlette would.
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match != Match.FULL:
+            continue
+        if isinstance(route, Mount):
+            sub_scope = {**scope, **child_scope}
+            # Sub-apps without routes of their own (like the lazily loaded one) are labeled by the mount path
+            return match_template(route.routes, sub_scope) or sub_scope['root_path']
+        return scope.get('root_path', '') + getattr(route, 'path', '')
+    return None
+
+
+def route_template(scope: Scope, routes: Sequence[BaseRoute] = ()) -> str:
+    # Starlette leaves the matched route in the scope. For sub-apps, root_path holds the mount path.
+    route = scope.get('route')
+    if route is None:
+        return match_template(routes, scope) or UNMATCHED_ROUTE
+    if isinstance(route, Mount):
+        return UNMATCHED_ROUTE
+    return scope.get('root_path', '') + route.path
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics, routes: Sequence[BaseRoute] = ()):
+        self.app = app
+        self.registry = registry
+        # Routes of the wrapped app, to label the responses which didn't reach routing
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+        handler = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status, size, handler
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                handler = time.perf_counter() - start - timing.serialization
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timing.reset(token)
+            duration = time.perf_counter() - start
+            method = scope['method']
+            self.registry.record(
+                method if method in KNOWN_METHODS else OTHER_METHOD,
+                route_template(scope, self.routes),
+                status,
+                duration,
+                size,
+                duration if handler is None else handler,
+                timing.serialization,
+            )
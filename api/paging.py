@@ -0,0 +1,162 @@
+from bisect import bisect_right
+from collections.abc import Callable, Iterable, Sequence
+from operator import attrgetter
+from typing import Any, NamedTuple
+
+import msgspec
+from fastapi import Query
+from fastapi.responses import Response
+from starlette.requests import Request
+
+from .store import CompactRecords
+from .streaming import StreamMode, streaming_response
+
+
+# Pagination and sparse fieldsets for the list and search routes.
+# The listings are already sorted by code, so a page is just a slice, found by bisecting for the "after" cursor.
+# Search results are sorted by score, there the cursor is looked up by position.
+
+MAX_PAGE_SIZE = 1000
+
+# Requested fields, as a tree. An empty node means the whole value.
+FieldTree = dict[str, 'FieldTree']
+
+
+class UnknownFieldError(ValueError):
+    pass
+
+
+class ListParams(NamedTuple):
+    limit: int | None
+    offset: int
+    after: int | None
+    fields: FieldTree | None
+
+    @property
+    def is_default(self) -> bool:
+        return self.limit is None and not self.offset and self.after is None and self.fields is None
+
+
+def parse_fields(value: str) -> FieldTree:
+    """Parse "code,name,districts.code" to {'code': {}, 'name': {}, 'districts': {'code': {}}}."""
+    tree: FieldTree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (n.strip() for n in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def list_params(
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, title='Maximum number of items to return'),
+    offset: int = Query(0, ge=0, title='Number of items to skip (after the cursor, if given)'),
+    after: int | None = Query(None, title='Cursor: only return items after the one with this code'),
+    fields: str | None = Query(
+        None,
+        title='Fields to include',
+        description='Comma-separated. Use dot for nested objects, like "code,name,districts.code,districts.name".',
+        examples=['code,name'],
+    ),
+) -> ListParams:
+    return ListParams(limit, offset, after, parse_fields(fields) if fields else None)
+
+
+def page_range(items: Sequence[Any], params: ListParams, sorted_by_code: bool) -> tuple[int, int]:
+    """Return the positions of the first item of the page, and after its last one."""
+    start = 0
+    if params.after is not None:
+        if isinstance(items, CompactRecords):
+            # Bisect the codes column, instead of building the records
+            start = bisect_right(items.codes, params.after)
+        elif sorted_by_code:
+            start = bisect_right(items, params.after, key=attrgetter('code'))
+        else:
+            start = next((i + 1 for i, item in enumerate(items) if item.code == params.after), len(items))
+    start = min(start + params.offset, len(items))
+    stop = len(items) if params.limit is None else min(start + params.limit, len(items))
+    return start, stop
+
+
+def paginate(items: Sequence[Any], params: ListParams, sorted_by_code: bool) -> tuple[Sequence[Any], bool]:
+    """Return the page, and whether there are more items after it."""
+    start, stop = page_range(items, params, sorted_by_code)
+    return items[start:stop], stop < len(items)
+
+
+def iter_page(items: Sequence[Any], start: int, stop: int) -> Iterable[Any]:
+    # Compact records are built while the page is consumed, not all at once.
+    return items.iter_range(start, stop) if isinstance(items, CompactRecords) else items[start:stop]
+
+
+def next_page_link(request: Request, page: Sequence[Any]) -> str:
+    url = request.url.remove_query_params('offset').include_query_params(after=page[-1].code)
+    return f'<{url}>; rel="next"'
+
+
+def select_fields(record: msgspec.Struct, tree: FieldTree) -> dict[str, Any]:
+    names = record.__struct_fields__
+    if unknown := tree.keys() - set(names):
+        raise UnknownFieldError(', '.join(sorted(unknown)))
+    # Keep the field order of the full response
+    selected = {}
+    for name in names:
+        if name not in tree:
+            continue
+        value = getattr(record, name)
+        if subtree := tree[name]:
+            if isinstance(value, msgspec.Struct):
+                value = select_fields(value, subtree)
+            elif isinstance(value, tuple | list):
+                value = [select_fields(v, subtree) for v in value]
+            else:
+                raise UnknownFieldError(', '.join(f'{name}.{n}' for n in subtree))
+        selected[name] = value
+    return selected
+
+
+def check_fields(tree: FieldTree):
+    # Like "fields=," which names no field. The items would be all empty.
+    if not tree:
+        raise UnknownFieldError('no field name given')
+
+
+def encode_selected(items: Sequence[msgspec.Struct], tree: FieldTree) -> bytes:
+    # The result doesn't match the response schema anymore, so it is encoded as plain JSON.
+    return msgspec.json.encode([select_fields(r, tree) for r in items])
+
+
+def list_response(
+    request: Request,
+    items: Sequence[Any],
+    params: ListParams,
+    encode: Callable[[Sequence[Any]], bytes],
+    sorted_by_code: bool = True,
+) -> Response:
+    """
+    Respond with one page of the items. `encode` is used when all fields are requested.
+    Raise UnknownFieldError if the "fields" parameter is wrong.
+    """
+    if params.fields is not None:
+        check_fields(params.fields)
+    page, has_more = paginate(items, params, sorted_by_code)
+    content = encode(page) if params.fields is None else encode_selected(page, params.fields)
+    headers = {'Link': next_page_link(request, page)} if has_more else None
+    return Response(content, media_type='application/json', headers=headers)
+
+
+def stream_list(
+    items: Sequence[Any],
+    params: ListParams,
+    encode_item: Callable[[Any], bytes],
+    mode: StreamMode,
+    sorted_by_code: bool = True,
+) -> Response:
+    start, stop = page_range(items, params, sorted_by_code)
+    page = iter_page(items, start, stop)
+    if (fields := params.fields) is None:
+        return streaming_response(page, encode_item, mode)
+    # Check the fields before starting the response, because we cannot report error after that.
+    check_fields(fields)
+    if start < stop:
+        select_fields(items[start], fields)
+    return streaming_response(page, lambda r: msgspec.json.encode(select_fields(r, fields)), mode)
@@ -0,0 +1,231 @@
+import hashlib
+import ipaddress
+import math
+import os
+import struct
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Protocol
+
+from logbook import Logger
+from starlette.requests import Request
+
+
+# Per-client token buckets. Each client gets `burst` tokens, refilled at `rate` tokens per second,
+# and each request takes some tokens, depending on how expensive it is to serve.
+# The buckets live in process memory, or in a file mapped to memory by all workers, to enforce one limit.
+
+logger = Logger(__name__)
+
+API_PREFIXES = ('/api/v1/', '/api/v2/')
+
+# Cost of the tree endpoints, by depth
+TREE_COSTS = {'/api/v1/': (1, 20, 100), '/api/v2/': (1, 50)}
+# Cost of full listings, when not narrowed by a filter or page
+LISTING_COSTS = {'/api/v1/w/': 20, '/api/v1/d/': 5, '/api/v2/w/': 20}
+LISTING_NARROWING_PARAMS = frozenset(('limit', 'province', 'search'))
+# Cost of the whole dataset exports, same as the JSON tree or listing they replace
+EXPORT_COSTS = {
+    '/api/v1/export/': 100,
+    '/api/v1/export/ward': 20,
+    '/api/v1/export/district': 5,
+    '/api/v2/export/': 50,
+    '/api/v2/export/ward': 20,
+}
+SUBTREE_COST = 5
+BATCH_COST = 5
+BULK_COST = 50
+
+
+def is_api_request(request: Request) -> bool:
+    return request.url.path.startswith(API_PREFIXES)
+
+
+def _depth(request: Request) -> int:
+    try:
+        return int(request.query_params.get('depth', 1))
+    except ValueError:
+        return 1
+
+
+def is_blockable_request(request: Request) -> bool:
+    """Whether clients in blocklist are refused the request: trees below the first level."""
+    return request.method == 'GET' and request.url.path in TREE_COSTS and _depth(request) > 1
+
+
+def request_cost(request: Request) -> int:
+    path, query = request.url.path, request.query_params
+    if request.method == 'POST':
+        return BULK_COST if path.endswith('/bulk/') else BATCH_COST
+    depth = _depth(request)
+    if costs := TREE_COSTS.get(path):
+        return costs[min(max(depth, 1), len(costs)) - 1]
+    if cost := EXPORT_COSTS.get(path):
+        return cost
+    if path in LISTING_COSTS and not (query.keys() & LISTING_NARROWING_PARAMS):
+        return LISTING_COSTS[path]
+    return SUBTREE_COST if depth >= 2 else 1
+
+
+def _take(tokens: float, last: float, cost: float, rate: float, burst: float, now: float) -> tuple[float, float]:
+    """Refill the bucket and try to take `cost` tokens. Return remaining tokens and seconds to wait (0 if taken)."""
+    tokens = min(burst, tokens + max(0.0, now - last) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class BucketStore(Protocol):
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float: ...
+
+
+class MemoryBucketStore:
+    def __init__(self, max_clients: int = 100_000):
+        self.max_clients = max_clients
+        self.buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, last = self.buckets.pop(key, (burst, now))
+        tokens, wait = _take(tokens, last, cost, rate, burst, now)
+        # Re-inserted, so the dict is ordered by last use, and we can drop the least recently seen clients.
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_clients:
+            del self.buckets[next(iter(self.buckets))]
+        return wait
+
+
+class SharedBucketStore:
+    """
+    Buckets in a file, which is mapped to memory by all worker processes.
+    It is an open-addressing hash table of fixed size. Each update takes an exclusive file lock.
+    """
+
+    # Client key digest, tokens, last update (monotonic clock, which is system-wide on Linux)
+    SLOT = struct.Struct('<16sdd')
+    EMPTY = bytes(16)
+    # Number of slots to look at before evicting the least recently seen client
+    PROBES = 8
+
+    def __init__(self, path: Path, slots: int = 65536):
+        import fcntl
+        import mmap
+
+        self._flock = fcntl.flock
+        self._lock_ex, self._lock_un = fcntl.LOCK_EX, fcntl.LOCK_UN
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.mm = mmap.mmap(self.fd, size)
+
+    def _find_slot(self, digest: bytes) -> tuple[int, bool]:
+        """Return offset of the slot for the key, and whether it already holds the key's bucket."""
+        start = int.from_bytes(digest[:8], 'little')
+        oldest_offset, oldest_time = 0, math.inf
+        for i in range(self.PROBES):
+            offset = (start + i) % self.slots * self.SLOT.size
+            key, _tokens, last = self.SLOT.unpack_from(self.mm, offset)
+            if key == digest:
+                return offset, True
+            if key == self.EMPTY:
+                return offset, False
+            if last < oldest_time:
+                oldest_offset, oldest_time = offset, last
+        return oldest_offset, False
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        self._flock(self.fd, self._lock_ex)
+        try:
+            now = time.monotonic()
+            offset, found = self._find_slot(digest)
+            tokens, last = (burst, now)
+            if found:
+                _key, tokens, last = self.SLOT.unpack_from(self.mm, offset)
+            tokens, wait = _take(tokens, min(last, now), cost, rate, burst, now)
+            self.SLOT.pack_into(self.mm, offset, digest, tokens, now)
+        finally:
+            self._flock(self.fd, self._lock_un)
+        return wait
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: float, store: BucketStore):
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+
+    def acquire(self, client: str, cost: float) -> float:
+        """Take tokens for a request. Return 0 if allowed, otherwise the seconds to wait before retrying."""
+        # A request costing more than the bucket size would be never allowed
+        return self.store.take(client, min(cost, self.burst), self.rate, self.burst)
+
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class Blocklist:
+    """
+    Clients which are refused the heavy requests, as IP addresses or networks (other values are matched exactly).
+    Entries come from a comma-separated string (parsed once) and an optional file (one entry per line),
+    which is reloaded when it is modified.
+    """
+
+    # Seconds between checks for file modification
+    CHECK_INTERVAL = 5.0
+
+    def __init__(self, entries: str = '', path: Path | None = None):
+        self.fixed = self.parse(entries.split(','))
+        self.path = path
+        self.from_file: tuple[tuple[Network, ...], frozenset[str]] = ((), frozenset())
+        self.mtime: float | None = None
+        self.checked_at = -math.inf
+        self.reload()
+
+    @staticmethod
+    def parse(entries: Iterable[str]) -> tuple[tuple[Network, ...], frozenset[str]]:
+        networks = []
+        names = set()
+        for entry in filter(None, (e.split('#')[0].strip() for e in entries)):
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                names.add(entry)
+        return tuple(networks), frozenset(names)
+
+    def reload(self):
+        self.checked_at = time.monotonic()
+        if not self.path:
+            return
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError as e:
+            logger.warning('Cannot read blocklist file: {}', e)
+            self.from_file, self.mtime = ((), frozenset()), None
+            return
+        if mtime == self.mtime:
+            return
+        self.from_file = self.parse(self.path.read_text().splitlines())
+        self.mtime = mtime
+        logger.info('Loaded blocklist file {}', self.path)
+
+    def __contains__(self, client: str) -> bool:
+        if self.path and time.monotonic() - self.checked_at >= self.CHECK_INTERVAL:
+            self.reload()
+        for networks, names in (self.fixed, self.from_file):
+            if client in names:
+                return True
+            try:
+                address = ipaddress.ip_address(client)
+            except ValueError:
+                continue
+            if any(address in network for network in networks):
+                return True
+        return False
@@ -0,0 +1,92 @@
+from typing import Self
+
+import msgspec
+from vietnam_provinces.legacy import District, Province, Ward
+
+
+# Mirrors of the response schemas in schema_v1, as msgspec structs. They are filled straight from
+# vietnam_provinces records (no `asdict` copy), and can be encoded to JSON without re-validation.
+# Fields must be kept in the same order as schema_v1, to produce the same JSON.
+
+
+class WardRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    district_code: int
+
+    @classmethod
+    def from_ward(cls, ward: Ward) -> Self:
+        return cls(ward.name, ward.code, ward.division_type, ward.codename, ward.district_code)
+
+
+class DistrictRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    province_code: int
+    wards: tuple[WardRecord, ...] = ()
+
+    @classmethod
+    def from_district(cls, district: District, wards: tuple[WardRecord, ...] = ()) -> Self:
+        return cls(
+            district.name, district.code, district.division_type, district.codename, district.province_code, wards
+        )
+
+
+class ProvinceRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    phone_code: int
+    districts: tuple[DistrictRecord, ...] = ()
+
+    @classmethod
+    def from_province(cls, province: Province, districts: tuple[DistrictRecord, ...] = ()) -> Self:
+        return cls(
+            province.name, province.code, province.division_type, province.codename, province.phone_code, districts
+        )
+
+
+class SearchResultRecord(msgspec.Struct):
+    name: str
+    code: int
+
+
+class ProvinceLookupResultRecord(msgspec.Struct):
+    code: int
+    found: bool
+    province: ProvinceRecord | None = None
+
+
+class DistrictLookupResultRecord(msgspec.Struct):
+    code: int
+    found: bool
+    district: DistrictRecord | None = None
+    province: ProvinceRecord | None = None
+
+
+class WardLookupResultRecord(msgspec.Struct):
+    code: int
+    found: bool
+    ward: WardRecord | None = None
+    district: DistrictRecord | None = None
+    province: ProvinceRecord | None = None
+
+
+class MatchedDivisionRecord(msgspec.Struct):
+    code: int
+    name: str
+    matched: str | None = None
+
+
+class ParsedAddressRecord(msgspec.Struct):
+    text: str
+    province: MatchedDivisionRecord | None
+    district: MatchedDivisionRecord | None
+    ward: MatchedDivisionRecord | None
+    score: int
+    ambiguous: bool
@@ -0,0 +1,123 @@
+from typing import TYPE_CHECKING, Self
+
+import msgspec
+from vietnam_provinces import Province, Ward
+
+
+if TYPE_CHECKING:
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+
+# Mirrors of the response schemas in schema_v2, as msgspec structs. They are filled straight from
+# vietnam_provinces records (no `asdict` copy), and can be encoded to JSON without re-validation.
+# Fields must be kept in the same order as schema_v2, to produce the same JSON.
+
+
+class WardRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    province_code: int
+
+    @classmethod
+    def from_ward(cls, ward: Ward) -> Self:
+        return cls(ward.name, ward.code, ward.division_type, ward.codename, ward.province_code)
+
+
+class ProvinceRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    phone_code: int
+    wards: tuple[WardRecord, ...] = ()
+
+    @classmethod
+    def from_province(cls, province: Province, wards: tuple[WardRecord, ...] = ()) -> Self:
+        return cls(province.name, province.code, province.division_type, province.codename, province.phone_code, wards)
+
+
+# The whole tree (`/?depth=2`) is the nested divisions file of vietnam_provinces, whose fields differ.
+# Its pages are decoded from the same file, to have the same shape.
+
+
+class NestedWardRecord(msgspec.Struct):
+    name: str
+    code: int
+    codename: str
+    division_type: str
+    short_codename: str
+
+
+class NestedProvinceRecord(msgspec.Struct):
+    name: str
+    code: int
+    codename: str
+    division_type: str
+    phone_code: int
+    wards: tuple[NestedWardRecord, ...] = ()
+
+
+class WardWithLegacySourceRecord(msgspec.Struct):
+    source_code: int
+    ward: WardRecord
+
+
+class LegacyWardRecord(msgspec.Struct):
+    name: str
+    code: int
+    division_type: str
+    codename: str
+    district_code: int
+    province_code: int
+
+    @classmethod
+    def from_legacy_ward(cls, ward: 'LegacyWard') -> Self:
+        return cls(ward.name, ward.code, ward.division_type, ward.codename, ward.district_code, ward.province_code)
+
+
+class ProvinceLookupResultRecord(msgspec.Struct):
+    code: int
+    found: bool
+    province: ProvinceRecord | None = None
+
+
+class WardLookupResultRecord(msgspec.Struct):
+    code: int
+    found: bool
+    ward: WardRecord | None = None
+    province: ProvinceRecord | None = None
+
+
+class MatchedDivisionRecord(msgspec.Struct):
+    code: int
+    name: str
+    matched: str | None = None
+
+
+class ParsedAddressRecord(msgspec.Struct):
+    text: str
+    province: MatchedDivisionRecord | None
+    ward: MatchedDivisionRecord | None
+    score: int
+    ambiguous: bool
+
+
+class ProvinceChangesRecord(msgspec.Struct):
+    added: tuple[ProvinceRecord, ...]
+    changed: tuple[ProvinceRecord, ...]
+    removed: tuple[int, ...]
+
+
+class WardChangesRecord(msgspec.Struct):
+    added: tuple[WardRecord, ...]
+    changed: tuple[WardRecord, ...]
+    removed: tuple[int, ...]
+
+
+class DatasetDeltaRecord(msgspec.Struct):
+    since: str
+    data_version: str
+    provinces: ProvinceChangesRecord
+    wards: WardChangesRecord
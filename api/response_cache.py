@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .http_cache import is_versioned_request, representation_key
+from .snapshots import SNAPSHOT_SCOPE_KEY
+
+
+# In-process cache of the responses to parameterized queries (searches, filtered lists, pages), which are not
+# covered by the pre-serialized snapshots. The key holds everything the response depends on, including the data
+# version, so entries of the old data are never served, they just age out.
+#
+# Concurrent requests for the same missing key wait for the first one to compute the response ("single flight"),
+# instead of each running the search.
+
+# Rough memory used by an entry, other than the body and headers
+ENTRY_OVERHEAD = 200
+CACHED_MEDIA_TYPES = (b'application/json',)
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    headers: tuple[tuple[bytes, bytes], ...]
+    body: bytes
+    expires: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers) + ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    """LRU cache, bounded by the total size of entries, which also expire after `ttl` seconds."""
+
+    def __init__(self, max_bytes: int, ttl: float, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Requests which waited for another one to compute the response
+        self.coalesced = 0
+        self._inflight: dict[str, asyncio.Future[CachedResponse | None]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        if entry.size > self.max_entry_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        self.size -= self.entries.pop(key).size
+
+    def flight(self, key: str) -> asyncio.Future[CachedResponse | None] | None:
+        """Future of the response being computed for the key, by another request."""
+        return self._inflight.get(key)
+
+    def start_flight(self, key: str):
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+
+    def end_flight(self, key: str, entry: CachedResponse | None):
+        # Waiters get None if the response is not cacheable
+        self._inflight.pop(key).set_result(entry)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def render(self) -> str:
+        """Counters in Prometheus text format, to append to the request metrics."""
+        lines = []
+        counters = (
+            ('hits', 'Responses served from cache.', self.hits),
+            ('misses', 'Responses computed, because not in cache.', self.misses),
+            ('evictions', 'Entries removed to keep the cache under its size.', self.evictions),
+            ('expirations', 'Entries removed because they were too old.', self.expirations),
+            ('coalesced', 'Requests which waited for an identical request to compute the response.', self.coalesced),
+        )
+        for name, help_text, value in counters:
+            lines.append(f'# HELP response_cache_{name}_total {help_text}')
+            lines.append(f'# TYPE response_cache_{name}_total counter')
+            lines.append(f'response_cache_{name}_total {value}')
+        for name, help_text, value in (
+            ('bytes', 'Size of cached responses.', self.size),
+            ('entries', 'Number of cached responses.', len(self.entries)),
+        ):
+            lines.append(f'# HELP response_cache_{name} {help_text}')
+            lines.append(f'# TYPE response_cache_{name} gauge')
+            lines.append(f'response_cache_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def is_cacheable_request(request: Request) -> bool:
+    # Requests without query string are served from the snapshots already. Those with parameters which
+    # only pick a snapshot (like a tree depth) are told apart by their response, see `ResponseCacheMiddleware`.
+    if request.method != 'GET' or not is_versioned_request(request):
+        return False
+    return bool(request.query_params)
+
+
+def cache_key(request: Request) -> str:
+    # The paging Link header holds absolute URLs, so responses to other hosts (or schemes) are not shared.
+    return f'{request.url.scheme}://{request.url.netloc}|{representation_key(request)}'
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app: ASGIApp, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        if not is_cacheable_request(request):
+            await self.app(scope, receive, send)
+            return
+        cache = self.cache
+        key = cache_key(request)
+        entry = cache.get(key)
+        waited = False
+        if entry is None and (flight := cache.flight(key)) is not None:
+            cache.coalesced += 1
+            entry = await asyncio.shield(flight)
+            waited = True
+        if entry is not None:
+            cache.hits += 1
+            await send({'type': 'http.response.start', 'status': entry.status, 'headers': list(entry.headers)})
+            await send({'type': 'http.response.body', 'body': entry.body})
+            return
+        cache.misses += 1
+        if waited:
+            # The response we waited for cannot be cached. Don't wait again, just compute it.
+            await self.app(scope, receive, send)
+            return
+        cache.start_flight(key)
+        start: Message | None = None
+        chunks: list[bytes] = []
+        size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal start, size
+            if message['type'] == 'http.response.start':
+                start = message
+            elif message['type'] == 'http.response.body':
+                size += len(body := message.get('body', b''))
+                # Stop collecting once it is too big to cache
+                if size <= cache.max_entry_bytes:
+                    chunks.append(body)
+            await send(message)
+
+        entry = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+            # Snapshots are kept in memory (with their compressed variants) already
+            if start and start['status'] == 200 and size <= cache.max_entry_bytes and not scope.get(SNAPSHOT_SCOPE_KEY):
+                headers = tuple(start.get('headers', ()))
+                content_type = next((v for k, v in headers if k == b'content-type'), b'')
+                if content_type.startswith(CACHED_MEDIA_TYPES):
+                    entry = CachedResponse(200, headers, b''.join(chunks), time.monotonic() + cache.ttl)
+                    cache.put(key, entry)
+        finally:
+            cache.end_flight(key, entry)
@@ -4,6 +4,8 @@ from typing import Annotated
 from pydantic import BaseModel, ConfigDict, Field, JsonValue
 from vietnam_provinces.legacy import VietNamDivisionType
 
+from .limits import BATCH_MAX_SIZE, MAX_ADDRESS_LENGTH
+
 
 # The code here looks like a duplicate of vietnam_provinces.base, but unfortunately, we cannot subclass from
 # vietnam_provinces.base's dataclasses, because:
@@ -89,3 +91,54 @@ class SearchResult(BaseModel):
     model_config = ConfigDict(json_schema_extra={'examples': [_EXAMPLE_MATCH]})
     name: str
     code: int
+
+
+class BatchLookupRequest(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'codes': [1, 4, 999999], 'expand': False}]})
+    codes: Annotated[list[int], Field(max_length=BATCH_MAX_SIZE)]
+    # Include the parent divisions in result
+    expand: bool = False
+
+
+class ProvinceLookupResult(BaseModel):
+    code: int
+    found: bool
+    province: ProvinceResponse | None = None
+
+
+class DistrictLookupResult(BaseModel):
+    code: int
+    found: bool
+    district: District | None = None
+    province: ProvinceResponse | None = None
+
+
+class WardLookupResult(BaseModel):
+    code: int
+    found: bool
+    ward: Ward | None = None
+    district: District | None = None
+    province: ProvinceResponse | None = None
+
+
+class MatchedDivision(BaseModel):
+    code: int
+    name: str
+    # Part of the address which names the division. None if it is deduced from the lower division.
+    matched: str | None = None
+
+
+class ParsedAddress(BaseModel):
+    text: str
+    province: MatchedDivision | None
+    district: MatchedDivision | None
+    ward: MatchedDivision | None
+    # Sum of the weights of matched names
+    score: int
+    # Another division fits the address equally well
+    ambiguous: bool
+
+
+class AddressBatchRequest(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'addresses': ['P. Bến Nghé, Q.1, TP HCM']}]})
+    addresses: Annotated[list[Annotated[str, Field(max_length=MAX_ADDRESS_LENGTH)]], Field(max_length=BATCH_MAX_SIZE)]
@@ -1,9 +1,17 @@
+from enum import StrEnum
 from typing import Annotated
 
 from pydantic import BaseModel, ConfigDict, Field, JsonValue
 from pydantic.dataclasses import dataclass
 from vietnam_provinces import Province, Ward
 
+from .limits import BATCH_MAX_SIZE, MAX_ADDRESS_LENGTH
+
+
+class DivisionLevel(StrEnum):
+    P = 'province'
+    W = 'ward'
+
 
 _EXAMPLE_PROVINCE: dict[str, JsonValue] = {
     'name': 'Thành phố Hà Nội',
@@ -62,3 +70,95 @@ class LegacyWardResponse(BaseModel):
     codename: str
     district_code: int
     province_code: int
+
+
+class BatchLookupRequest(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'codes': [4, 26560, 999999], 'expand': False}]})
+    codes: Annotated[list[int], Field(max_length=BATCH_MAX_SIZE)]
+    # Include the parent province in result
+    expand: bool = False
+
+
+class ProvinceLookupResult(BaseModel):
+    code: int
+    found: bool
+    province: ProvinceResponse | None = None
+
+
+class WardLookupResult(BaseModel):
+    code: int
+    found: bool
+    ward: WardResponse | None = None
+    province: ProvinceResponse | None = None
+
+
+class MatchedDivision(BaseModel):
+    code: int
+    name: str
+    # Part of the address which names the division. None if it is deduced from the lower division.
+    matched: str | None = None
+
+
+class ParsedAddress(BaseModel):
+    text: str
+    province: MatchedDivision | None
+    ward: MatchedDivision | None
+    # Sum of the weights of matched names
+    score: int
+    # Another division fits the address equally well
+    ambiguous: bool
+
+
+class AddressBatchRequest(BaseModel):
+    model_config = ConfigDict(json_schema_extra={'examples': [{'addresses': ['Phường Bến Nghé, Quận 1, TP HCM']}]})
+    addresses: Annotated[list[Annotated[str, Field(max_length=MAX_ADDRESS_LENGTH)]], Field(max_length=BATCH_MAX_SIZE)]
+
+
+class ProvinceChanges(BaseModel):
+    added: list[ProvinceResponse]
+    # New form of the provinces which have the same code but other details
+    changed: list[ProvinceResponse]
+    # Codes
+    removed: list[int]
+
+
+class WardChanges(BaseModel):
+    added: list[WardResponse]
+    changed: list[WardResponse]
+    removed: list[int]
+
+
+class DatasetDelta(BaseModel):
+    # Data version the client has
+    since: str
+    # Data version the changes lead to
+    data_version: str
+    provinces: ProvinceChanges
+    wards: WardChanges
+
+
+class VersionResponse(BaseModel):
+    data_version: str
+
+
+@dataclass(frozen=True)
+class NestedWard:
+    """Ward in the whole tree (`/?depth=2`), as in the nested divisions file of vietnam_provinces."""
+
+    name: str
+    code: int
+    codename: str
+    division_type: str
+    short_codename: str
+
+
+@dataclass(frozen=True)
+class NestedProvince:
+    """Province in the whole tree (`/?depth=2`), as in the nested divisions file of vietnam_provinces."""
+
+    name: str
+    code: int
+    codename: str
+    division_type: str
+    phone_code: int
+    wards: Annotated[tuple[NestedWard, ...], Field(default_factory=tuple)]
@@ -0,0 +1,240 @@
+import re
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Sequence
+from enum import Enum
+from functools import cache
+from typing import Any, NamedTuple
+
+from logbook import Logger
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.helpers import normalize_search_name
+
+
+# Inverted index over division names, to answer the search queries without scanning the whole dataset.
+# The results (both matching and ordering) are the same as the `search()` class methods
+# of vietnam_provinces, which we follow step by step, just with the per-record work precomputed.
+# We normalize with the same function as vietnam_provinces (not Unidecode directly), because a different
+# transliteration for some rare characters would make our results differ from the library.
+
+logger = Logger(__name__)
+
+_PREFIX_RE = re.compile(r'^(xã|phường|thị trấn)\s+', flags=re.IGNORECASE)
+_LOWER_PREFIX_RE = re.compile(r'^(xã|phường|thị trấn)\s+')
+_NORMALIZED_PREFIX_RE = re.compile(r'^(xa|phuong|thi tran)\s+')
+
+# Words which are treated as division type, and removed from the query.
+PROVINCE_DIVISION_WORDS = frozenset(('tinh', 'thanh', 'pho', 'xa', 'phuong', 'thi', 'tran'))
+LEGACY_PROVINCE_DIVISION_WORDS = frozenset(('tinh', 'thanh', 'pho'))
+LEGACY_DIVISION_WORDS = frozenset(('tinh', 'thanh', 'pho', 'quan', 'huyen', 'thi', 'xa', 'phuong', 'tran'))
+
+
+class MatchRule(Enum):
+    # All query words must be whole words of the name. Division words are only skipped at the beginning.
+    ALL_WORDS = 'all-words'
+    # First word must be a whole word. If there are more words, at least one must be prefix of a name word.
+    FIRST_WORD_ANY_REST = 'first-word-any-rest'
+    # First word must be a whole word. All other words must be prefix of a name word.
+    FIRST_WORD_ALL_REST = 'first-word-all-rest'
+
+
+class _Entry(NamedTuple):
+    record: Any
+    name: str
+    name_words: tuple[str, ...]
+    # Precomputed forms of name, used by scoring
+    clean: str
+    lower: str
+    lower_clean: str
+    normalized: str
+    normalized_clean: str
+
+
+def _make_entry(record: Any) -> _Entry:
+    name: str = record.name
+    normalized = normalize_search_name(name)
+    lower = name.lower()
+    return _Entry(
+        record=record,
+        name=name,
+        name_words=tuple(normalized.split()),
+        clean=_PREFIX_RE.sub('', name),
+        lower=lower,
+        lower_clean=_LOWER_PREFIX_RE.sub('', lower),
+        normalized=normalized,
+        normalized_clean=_NORMALIZED_PREFIX_RE.sub('', normalized),
+    )
+
+
+def match_score(query: str, normalized_query: str, entry: _Entry) -> int:
+    # Same as vietnam_provinces.helpers.calculate_simple_match_score (lower is better)
+    query_lower = query.lower()
+    if query_lower.startswith(('xã ', 'phường ', 'thị trấn ')):
+        if query == entry.name:
+            return 0
+        if query_lower == entry.lower:
+            return 1
+    else:
+        if query == entry.clean:
+            return 0
+        if query_lower == entry.lower_clean:
+            return 1
+    if normalized_query == entry.normalized_clean:
+        return 2
+    pos = entry.normalized.find(normalized_query)
+    if pos == 0:
+        return 10
+    if pos > 0:
+        return 100 + pos
+    return 1000
+
+
+class SearchIndex:
+    def __init__(
+        self,
+        records: Iterable[Any],
+        rule: MatchRule,
+        division_words: frozenset[str],
+        scopes: Sequence[str] = (),
+    ):
+        self.rule = rule
+        self.division_words = division_words
+        self.entries: tuple[_Entry, ...] = tuple(_make_entry(r) for r in records)
+        # Besides the whole-dataset postings, we keep postings partitioned by parent division (scope),
+        # so that a search limited to a province or district only touches the records of that scope.
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        scoped_postings: defaultdict[tuple[str, int], defaultdict[str, list[int]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        members: defaultdict[tuple[str, int], list[int]] = defaultdict(list)
+        for i, entry in enumerate(self.entries):
+            words = set(entry.name_words)
+            scope_keys = tuple((attr, int(getattr(entry.record, attr))) for attr in scopes)
+            for key in scope_keys:
+                members[key].append(i)
+            for word in words:
+                postings[word].append(i)
+                for key in scope_keys:
+                    scoped_postings[key][word].append(i)
+        # Entry positions are kept in dataset order, so that ties in score are ordered as vietnam_provinces does.
+        self.postings: dict[str, tuple[int, ...]] = {w: tuple(ids) for w, ids in postings.items()}
+        self.scoped_postings: dict[tuple[str, int], dict[str, tuple[int, ...]]] = {
+            key: {w: tuple(ids) for w, ids in p.items()} for key, p in scoped_postings.items()
+        }
+        self.members: dict[tuple[str, int], tuple[int, ...]] = {key: tuple(ids) for key, ids in members.items()}
+        self.scopes = tuple(scopes)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def query_words(self, name: str) -> list[str]:
+        words = [normalize_search_name(word) for word in name.split()]
+        if self.rule != MatchRule.ALL_WORDS:
+            return [w for w in words if w not in self.division_words]
+        # Only skip division words at the beginning (e.g., "Xã Tân Hòa" -> "Tân Hòa")
+        for i, word in enumerate(words):
+            if word not in self.division_words:
+                return words[i:]
+        return []
+
+    def _candidates(
+        self, words: Sequence[str], postings: dict[str, tuple[int, ...]], universe: Sequence[int]
+    ) -> Sequence[int]:
+        if self.rule == MatchRule.ALL_WORDS:
+            if not words:
+                return universe
+            sets = sorted((postings.get(w, ()) for w in set(words)), key=len)
+            common = set(sets[0]).intersection(*sets[1:])
+            return sorted(common)
+        if not words:
+            return ()
+        candidates = postings.get(words[0], ())
+        rest = words[1:]
+        if not rest:
+            return candidates
+        if self.rule == MatchRule.FIRST_WORD_ANY_REST:
+            return tuple(
+                i for i in candidates if any(nw.startswith(w) for w in rest for nw in self.entries[i].name_words)
+            )
+        return tuple(
+            i for i in candidates if all(any(nw.startswith(w) for nw in self.entries[i].name_words) for w in rest)
+        )
+
+    def candidates(self, name: str, **scope: int) -> Sequence[int]:
+        """
+        Positions (in `entries`) of the records matching the name, in dataset order, not scored yet.
+        """
+        if not name:
+            return ()
+        words = self.query_words(name)
+        if scope:
+            ((attr, code),) = scope.items()
+            if attr not in self.scopes:
+                raise ValueError(f'Search index is not partitioned by {attr}')
+            key = (attr, int(code))
+            return self._candidates(words, self.scoped_postings.get(key, {}), self.members.get(key, ()))
+        return self._candidates(words, self.postings, range(len(self.entries)))
+
+    def search(self, name: str, **scope: int) -> tuple[Any, ...]:
+        """
+        Search by name, optionally limited to one parent division, like `search('Phúc Xá', district_code=1)`.
+        """
+        candidates = self.candidates(name, **scope)
+        if not candidates:
+            return ()
+        normalized_query = normalize_search_name(name)
+        scored = [(match_score(name, normalized_query, self.entries[i]), i) for i in candidates]
+        # Candidates are in dataset order, and sort is stable, so ties keep that order.
+        scored.sort(key=lambda x: x[0])
+        return tuple(self.entries[i].record for _s, i in scored)
+
+
+@cache
+def province_index() -> SearchIndex:
+    return SearchIndex(Province.iter_all(), MatchRule.ALL_WORDS, PROVINCE_DIVISION_WORDS)
+
+
+@cache
+def ward_index() -> SearchIndex:
+    return SearchIndex(Ward.iter_all(), MatchRule.FIRST_WORD_ANY_REST, PROVINCE_DIVISION_WORDS, ('province_code',))
+
+
+@cache
+def legacy_province_index() -> SearchIndex:
+    from vietnam_provinces.legacy import Province as LegacyProvince
+
+    return SearchIndex(LegacyProvince.iter_all(), MatchRule.FIRST_WORD_ALL_REST, LEGACY_PROVINCE_DIVISION_WORDS)
+
+
+@cache
+def legacy_district_index() -> SearchIndex:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+
+    return SearchIndex(
+        LegacyDistrict.iter_all(), MatchRule.FIRST_WORD_ALL_REST, LEGACY_DIVISION_WORDS, ('province_code',)
+    )
+
+
+@cache
+def legacy_ward_index() -> SearchIndex:
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    return SearchIndex(
+        LegacyWard.iter_all(),
+        MatchRule.FIRST_WORD_ALL_REST,
+        LEGACY_DIVISION_WORDS,
+        ('district_code', 'province_code'),
+    )
+
+
+def _build(*builders: Callable[[], SearchIndex]):
+    for build in builders:
+        index = build()
+        logger.debug('Built search index of {} records, {} words', len(index), len(index.postings))
+
+
+def build_indexes():
+    _build(province_index, ward_index)
+
+
+def build_legacy_indexes():
+    _build(legacy_province_index, legacy_district_index, legacy_ward_index)
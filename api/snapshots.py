@@ -0,0 +1,89 @@
+from collections.abc import Callable, Hashable, Iterable, Iterator
+
+from fastapi.responses import Response
+from logbook import Logger
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from vietnam_provinces import __data_version__
+
+from .compression import COMPRESSORS, IDENTITY, MIN_COMPRESS_SIZE, compress, negotiate_encoding
+
+
+# Pre-serialized JSON bodies for the responses which only change when the "vietnam_provinces" data changes.
+# They are built once (at startup or on first use) and the following requests just copy the bytes out.
+# Compressed variants are built lazily, the first time a client asks for that encoding.
+# They can also be loaded from a compiled file, shared by all workers (see api.compiled).
+
+logger = Logger(__name__)
+
+# Content is a memoryview when it is a slice of the compiled file
+_snapshots: dict[tuple[Hashable, ...], bytes | memoryview] = {}
+# Set in the ASGI scope of requests answered with a snapshot, so that the response cache doesn't copy them.
+SNAPSHOT_SCOPE_KEY = 'vnprovinces.snapshot'
+
+
+def get_snapshot(key: tuple[Hashable, ...], build: Callable[[], bytes]) -> bytes | memoryview:
+    # The data version is part of the key, so that a process which has the data package upgraded
+    # (reloaded) never serves the bytes built from the old data.
+    full_key = (__data_version__, *key, IDENTITY)
+    try:
+        return _snapshots[full_key]
+    except KeyError:
+        pass
+    logger.debug('Build snapshot {}', full_key)
+    content = _snapshots[full_key] = build()
+    return content
+
+
+def get_compressed_snapshot(key: tuple[Hashable, ...], build: Callable[[], bytes], encoding: str) -> bytes | memoryview:
+    full_key = (__data_version__, *key, encoding)
+    try:
+        return _snapshots[full_key]
+    except KeyError:
+        pass
+    logger.debug('Compress snapshot {}', full_key)
+    # bytes() doesn't copy a bytes object, only a slice of the compiled file
+    content = _snapshots[full_key] = compress(bytes(get_snapshot(key, build)), encoding)
+    return content
+
+
+def preload_snapshot(key: tuple[Hashable, ...], build: Callable[[], bytes]):
+    content = get_snapshot(key, build)
+    if len(content) >= MIN_COMPRESS_SIZE:
+        for encoding in COMPRESSORS:
+            get_compressed_snapshot(key, build, encoding)
+
+
+async def snapshot_response(
+    request: Request, key: tuple[Hashable, ...], build: Callable[[], bytes], media_type: str = 'application/json'
+) -> Response:
+    # Starlette passes the same scope to mounted apps, so the flag is seen by the middlewares of the main app.
+    request.scope[SNAPSHOT_SCOPE_KEY] = True
+    content = get_snapshot(key, build)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding != IDENTITY and len(content) >= MIN_COMPRESS_SIZE:
+        full_key = (__data_version__, *key, encoding)
+        # Compressing with the highest level takes a while, don't block the event loop for it.
+        if (compressed := _snapshots.get(full_key)) is None:
+            compressed = await run_in_threadpool(get_compressed_snapshot, key, build, encoding)
+        content = compressed
+        headers['Content-Encoding'] = encoding
+    return Response(content, media_type=media_type, headers=headers)
+
+
+def iter_snapshots() -> Iterator[tuple[tuple[Hashable, ...], bytes | memoryview]]:
+    """Snapshots of the current data version, as (key with encoding, content)."""
+    for (version, *key), content in _snapshots.items():
+        if version == __data_version__:
+            yield tuple(key), content
+
+
+def add_snapshots(items: Iterable[tuple[tuple[Hashable, ...], bytes | memoryview]]):
+    """Add snapshots of the current data version, with keys as given by `iter_snapshots`."""
+    for key, content in items:
+        _snapshots[(__data_version__, *key)] = content
+
+
+def clear_snapshots():
+    _snapshots.clear()
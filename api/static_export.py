@@ -0,0 +1,172 @@
+"""
+Render the responses which only depend on the URL path and the data version, to files which nginx can serve
+without calling the backend (see Deployment/Nginx/provinces-static.conf):
+
+    python -m api.static_export /opt/Provinces/static-api
+
+The files mirror the URL layout: the response of "/api/v1/p/1" is in "api/v1/p/1/index.json", the one of
+"/api/v1/p/1?depth=2" in "api/v1/p/1/index.depth2.json". Each is followed by its precompressed variants
+(".gz", ".br", ".zst"), if it is big enough to compress.
+
+The responses of each data version are rendered to their own folder, then the "current" symlink is switched
+to it, so that nginx never sees a half-written tree.
+
+The whole trees below the first level and the full listings of districts and wards are not rendered, so that
+nginx passes them to the backend, which applies the blocklist and rate limiting to them.
+
+The headers that nginx adds to the files are written to "nginx-headers.conf", from the same settings as the
+backend (like CDN_CACHE_INTERVAL). Reload nginx after exporting, for it to read them again.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+from collections.abc import Iterator
+from http import HTTPStatus
+from pathlib import Path
+
+from logbook import Logger
+from starlette.types import ASGIApp, Message
+from vietnam_provinces import __data_version__
+
+from .compression import COMPRESSORS, MIN_COMPRESS_SIZE, compress
+from .http_cache import data_version_datetime
+
+
+logger = Logger(__name__)
+
+CURRENT_LINK = 'current'
+NGINX_HEADERS = 'nginx-headers.conf'
+# File suffixes of the content codings, as looked up by nginx gzip_static, brotli_static, zstd_static
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br', 'zstd': '.zst'}
+
+
+def iter_v1_urls() -> Iterator[tuple[str, int]]:
+    """Paths (in /api/v1 app) with their "depth" parameter, 1 being the default one."""
+    from .store import legacy_division_store
+
+    store = legacy_division_store()
+    yield from (('/', 1), ('/p/', 1), ('/version', 1))
+    for p in store.provinces.records:
+        yield from ((f'/p/{p.code}', depth) for depth in (1, 2, 3))
+    for d in store.districts.records:
+        yield from ((f'/d/{d.code}', depth) for depth in (1, 2))
+    yield from ((f'/w/{w.code}', 1) for w in store.wards.records)
+
+
+def iter_v2_urls() -> Iterator[tuple[str, int]]:
+    from .store import division_store
+
+    store = division_store()
+    yield from (('/', 1), ('/p/', 1), ('/version', 1))
+    for p in store.provinces.records:
+        yield from ((f'/p/{p.code}', depth) for depth in (1, 2))
+    for w in store.wards.records:
+        yield f'/w/{w.code}', 1
+        yield f'/w/{w.code}/to-legacies/', 1
+
+
+def file_path(path: str, depth: int) -> Path:
+    name = 'index.json' if depth == 1 else f'index.depth{depth}.json'
+    return Path(path.strip('/')) / name
+
+
+async def fetch(app: ASGIApp, path: str, depth: int) -> tuple[int, bytes]:
+    """Call the ASGI app in process, return the status and body."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': f'depth={depth}'.encode() if depth != 1 else b'',
+        'headers': [(b'accept-encoding', b'identity'), (b'host', b'localhost')],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    status = 0
+    chunks: list[bytes] = []
+
+    async def receive() -> Message:
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message: Message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(bytes(message.get('body', b'')))
+
+    await app(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+def write_file(path: Path, content: bytes, mtime: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    variants = [(path, content)]
+    if len(content) >= MIN_COMPRESS_SIZE:
+        for encoding in COMPRESSORS:
+            variants.append((path.with_name(path.name + ENCODING_SUFFIXES[encoding]), compress(content, encoding)))
+    for p, data in variants:
+        p.write_bytes(data)
+        # For the Last-Modified header given by nginx, same as the backend's
+        os.utime(p, (mtime, mtime))
+
+
+async def render(folder: Path) -> int:
+    """Render all the responses to the folder. Return the number of them."""
+    from .v1 import api_v1
+    from .v2 import api_v2
+
+    mtime = data_version_datetime().timestamp()
+    count = 0
+    for prefix, app, urls in (('/api/v1', api_v1, iter_v1_urls()), ('/api/v2', api_v2, iter_v2_urls())):
+        for path, depth in urls:
+            status, content = await fetch(app, path, depth)
+            if status != HTTPStatus.OK:
+                raise RuntimeError(f'{prefix}{path}?depth={depth} responded {status}')
+            write_file(folder / file_path(prefix + path, depth), content, mtime)
+            count += 1
+    return count
+
+
+def write_nginx_headers(output: Path):
+    from .main import build_cache_control
+
+    lines = (
+        '# Written by api.static_export, from the settings of the backend.',
+        f"add_header 'Cache-Control' '{build_cache_control()}';",
+        "add_header 'Access-Control-Allow-Origin' '*';",
+    )
+    tmp_path = output / f'.{NGINX_HEADERS}.tmp'
+    tmp_path.write_text('\n'.join(lines) + '\n')
+    os.replace(tmp_path, output / NGINX_HEADERS)
+
+
+def export(output: Path) -> int:
+    """Render the responses of the current data version under the output folder, and make it the current one."""
+    output.mkdir(parents=True, exist_ok=True)
+    tmp_folder = output / f'.{__data_version__}.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    count = asyncio.run(render(tmp_folder))
+    folder = output / __data_version__
+    shutil.rmtree(folder, ignore_errors=True)
+    tmp_folder.rename(folder)
+    tmp_link = output / f'.{CURRENT_LINK}.tmp'
+    tmp_link.unlink(missing_ok=True)
+    tmp_link.symlink_to(__data_version__, target_is_directory=True)
+    os.replace(tmp_link, output / CURRENT_LINK)
+    write_nginx_headers(output)
+    logger.info('Rendered {} responses to {}', count, folder)
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('Usage: python -m api.static_export <folder>')
+    output = Path(sys.argv[1])
+    print(f'Exported {export(output)} responses to {output / __data_version__}')
@@ -0,0 +1,213 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from functools import cache
+from itertools import groupby
+from operator import attrgetter
+from typing import Any, cast, overload
+
+import msgspec
+from logbook import Logger
+from vietnam_provinces import Province, Ward
+
+from .records_v2 import ProvinceRecord, WardRecord
+
+
+# All divisions, with their response records, indexed once at startup, so that handlers don't sort or convert
+# the vietnam_provinces objects on each request.
+#
+# Each level is a tuple sorted by code, and a code -> position dict. For each parent level, the divisions are
+# also kept sorted by (parent code, code), so that the children of a parent are one slice of it.
+#
+# Optionally, the wards (the biggest level) are kept as typed columns instead (see CompactRecords), which takes
+# much less memory, but builds the records again on each access.
+
+logger = Logger(__name__)
+
+
+class CompactRecords(Sequence[Any]):
+    """
+    Records of one type, kept as typed columns: integers in arrays, strings as positions in the table of
+    distinct strings. A record is built on access, so that only the ones being served are Python objects.
+    Fields other than int and str are left out, they must have default values.
+    """
+
+    def __init__(self, record_type: type[msgspec.Struct], records: Sequence[msgspec.Struct]):
+        self.record_type = record_type
+        index: dict[str, int] = {}
+        # (column, whether it refers to the string table)
+        self.columns: list[tuple[array[int], bool]] = []
+        for field in msgspec.structs.fields(record_type):
+            values = (getattr(r, field.name) for r in records)
+            if field.type is int:
+                self.columns.append((array('i', values), False))
+            elif field.type is str:
+                self.columns.append((array('I', (index.setdefault(v, len(index)) for v in values)), True))
+            elif field.default is msgspec.NODEFAULT and field.default_factory is msgspec.NODEFAULT:
+                raise TypeError(f'Cannot leave out field {field.name}, it has no default value')
+        self.strings = tuple(index)
+        self.codes = self.columns[[f.name for f in msgspec.structs.fields(record_type)].index('code')][0]
+
+    def __len__(self):
+        return len(self.codes)
+
+    @overload
+    def __getitem__(self, i: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> tuple[Any, ...]: ...
+
+    def __getitem__(self, i: int | slice) -> Any:
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return tuple(self.iter_range(start, stop))
+            return tuple(self._make(j) for j in range(start, stop, step))
+        return self._make(i)
+
+    def iter_range(self, start: int, stop: int) -> Iterator[Any]:
+        """Build the records from `start` to `stop` one by one, as they are consumed."""
+        strings = self.strings
+        columns = [
+            (strings[v] for v in column[start:stop]) if is_string else column[start:stop]
+            for column, is_string in self.columns
+        ]
+        return (self.record_type(*values) for values in zip(*columns))
+
+    def _make(self, i: int) -> Any:
+        strings = self.strings
+        return self.record_type(*(strings[column[i]] if is_string else column[i] for column, is_string in self.columns))
+
+
+class DivisionTable:
+    def __init__(
+        self,
+        items: Iterable[Any],
+        make_record: Callable[[Any], Any],
+        parent_attrs: Sequence[str] = (),
+        compact: bool = False,
+    ):
+        items = sorted(items, key=attrgetter('code'))
+        records = [make_record(i) for i in items]
+        # A tuple, or CompactRecords. Callers which need all of them as objects can just call tuple() on it,
+        # which doesn't copy a tuple.
+        self.records: Sequence[Any]
+        # Compact tables look codes up by bisecting, instead of keeping a dict.
+        self.positions: dict[int, int] | None = None
+        if compact:
+            self.records = CompactRecords(type(records[0]), records)
+        else:
+            self.records = tuple(records)
+            self.positions = {int(item.code): i for i, item in enumerate(items)}
+        # Parent attribute -> (records, or positions if compact, sorted by parent code, then code;
+        # parent code -> range in it)
+        self.by_parent: dict[str, tuple[Sequence[Any], dict[int, tuple[int, int]]]] = {}
+        for attr in parent_attrs:
+            # Stable sort, so it stays sorted by code for each parent
+            order = sorted(range(len(items)), key=lambda i: int(getattr(items[i], attr)))
+            ranges = {}
+            start = 0
+            for parent, group in groupby(order, key=lambda i: int(getattr(items[i], attr))):
+                end = start + sum(1 for _i in group)
+                ranges[parent] = (start, end)
+                start = end
+            self.by_parent[attr] = (array('I', order) if compact else tuple(records[i] for i in order), ranges)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, code: int):
+        return self.position(code) is not None
+
+    def position(self, code: int) -> int | None:
+        if self.positions is not None:
+            return self.positions.get(code)
+        codes = cast(CompactRecords, self.records).codes
+        i = bisect_left(codes, code)
+        return i if i < len(codes) and codes[i] == code else None
+
+    def get(self, code: int) -> Any | None:
+        """Response record of the division with this code."""
+        i = self.position(code)
+        return None if i is None else self.records[i]
+
+    def children(self, attr: str, code: int) -> tuple[Any, ...]:
+        """Records of the divisions whose `attr` (like "province_code") is `code`, sorted by code."""
+        children, ranges = self.by_parent[attr]
+        start, end = ranges.get(code, (0, 0))
+        if self.positions is None:
+            records = self.records
+            return tuple(records[i] for i in children[start:end])
+        return tuple(children[start:end])
+
+    def records_of(self, items: Iterable[Any], sort: bool = False) -> tuple[Any, ...]:
+        """Records of the vietnam_provinces objects, like search results. Optionally sorted by code."""
+        position = self.position
+        positions = [i for item in items if (i := position(int(item.code))) is not None]
+        if sort:
+            positions.sort()
+        records = self.records
+        return tuple(records[i] for i in positions)
+
+
+class StoreOptions:
+    # Keep the ward records as compact columns. Must be set before the stores are built.
+    compact_wards = False
+
+
+options = StoreOptions()
+
+
+class DivisionStore:
+    def __init__(self, provinces: DivisionTable, wards: DivisionTable):
+        self.provinces = provinces
+        self.wards = wards
+
+    def tables(self) -> tuple[DivisionTable, ...]:
+        return (self.provinces, self.wards)
+
+
+class LegacyDivisionStore(DivisionStore):
+    def __init__(self, provinces: DivisionTable, districts: DivisionTable, wards: DivisionTable):
+        super().__init__(provinces, wards)
+        self.districts = districts
+
+    def tables(self) -> tuple[DivisionTable, ...]:
+        return (self.provinces, self.districts, self.wards)
+
+
+@cache
+def division_store() -> DivisionStore:
+    return DivisionStore(
+        DivisionTable(Province.iter_all(), ProvinceRecord.from_province),
+        DivisionTable(Ward.iter_all(), WardRecord.from_ward, ('province_code',), options.compact_wards),
+    )
+
+
+@cache
+def legacy_division_store() -> LegacyDivisionStore:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+    from vietnam_provinces.legacy import Province as LegacyProvince
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    from .records_v1 import DistrictRecord, ProvinceRecord, WardRecord
+
+    return LegacyDivisionStore(
+        DivisionTable(LegacyProvince.iter_all(), ProvinceRecord.from_province),
+        DivisionTable(LegacyDistrict.iter_all(), DistrictRecord.from_district, ('province_code',)),
+        DivisionTable(
+            LegacyWard.iter_all(), WardRecord.from_ward, ('district_code', 'province_code'), options.compact_wards
+        ),
+    )
+
+
+def _log(store: DivisionStore, label: str):
+    logger.debug('Built {} division store of {} divisions', label, sum(len(t) for t in store.tables()))
+
+
+def build_stores():
+    _log(division_store(), '2025')
+
+
+def build_legacy_stores():
+    _log(legacy_division_store(), 'legacy')
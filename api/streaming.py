@@ -0,0 +1,60 @@
+from collections.abc import Callable, Iterable, Iterator
+from enum import StrEnum
+from typing import Any
+
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+
+
+# Write big listings out incrementally, so that memory use doesn't grow with the number of records.
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+# Number of records to encode into one chunk.
+CHUNK_SIZE = 500
+
+
+class StreamMode(StrEnum):
+    JSON = 'json'
+    NDJSON = 'ndjson'
+
+
+StreamQuery = Query(
+    None,
+    title='Stream the listing',
+    description='"json": Same JSON array, sent in chunks. "ndjson": One JSON object per line.',
+)
+
+
+def iter_json_array(items: Iterable[Any], encode: Callable[[Any], bytes]) -> Iterator[bytes]:
+    # Produce the same bytes as encoding the whole list at once
+    separator = b'['
+    chunk: list[bytes] = []
+    for item in items:
+        chunk.append(separator)
+        chunk.append(encode(item))
+        separator = b','
+        if len(chunk) >= CHUNK_SIZE * 2:
+            yield b''.join(chunk)
+            chunk.clear()
+    if separator == b'[':
+        chunk.append(separator)
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+def iter_ndjson(items: Iterable[Any], encode: Callable[[Any], bytes]) -> Iterator[bytes]:
+    chunk: list[bytes] = []
+    for item in items:
+        chunk.append(encode(item))
+        chunk.append(b'\n')
+        if len(chunk) >= CHUNK_SIZE * 2:
+            yield b''.join(chunk)
+            chunk.clear()
+    if chunk:
+        yield b''.join(chunk)
+
+
+def streaming_response(items: Iterable[Any], encode: Callable[[Any], bytes], mode: StreamMode) -> StreamingResponse:
+    if mode == StreamMode.NDJSON:
+        return StreamingResponse(iter_ndjson(items, encode), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(iter_json_array(items, encode), media_type='application/json')
@@ -0,0 +1,223 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Sequence
+from enum import IntEnum
+from functools import cache
+from itertools import groupby
+from typing import Any
+
+from fastapi import Query
+from logbook import Logger
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.helpers import normalize_search_name
+
+from .records_v2 import ProvinceRecord, WardRecord
+
+
+# Autocomplete, for address fields which send a request on each keystroke.
+# Unlike search, it matches prefixes of names (and of each word in names) and only returns the best few.
+#
+# The prefix trie is kept flattened: all keys in one sorted list, so that the subtree of a prefix is a contiguous
+# slice, found by bisecting. The top suggestions of the big subtrees (short prefixes, like "ph") are precomputed,
+# the other subtrees are small enough to be ranked on each request.
+
+logger = Logger(__name__)
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+# Subtrees with more keys than this get their top suggestions precomputed.
+SCAN_LIMIT = 256
+
+SuggestQuery = Query(
+    ...,
+    title='What the user has typed so far',
+    examples=['phu h'],
+    description='Beginning of the name, or of a word in the name, with or without diacritics.',
+)
+SuggestLimitQuery = Query(DEFAULT_SUGGESTIONS, ge=1, le=MAX_SUGGESTIONS, title='Number of suggestions')
+
+_DIVISION_PREFIX_RE = re.compile(r'^(thanh pho|tinh|quan|huyen|thi xa|thi tran|phuong|xa|dac khu) ')
+
+# Among equal matches, the more urban division comes first
+LEVELS = {
+    'thành phố trung ương': 0,
+    'tỉnh': 1,
+    'quận': 0,
+    'thành phố': 1,
+    'thị xã': 2,
+    'huyện': 3,
+    'phường': 0,
+    'thị trấn': 1,
+    'xã': 2,
+    'đặc khu': 3,
+}
+
+
+class MatchKind(IntEnum):
+    # Exact matches (query is the whole name) come before all of these.
+    # Name starts with query, like "Phú" for "Xã Phú Hòa"
+    NAME_PREFIX = 1
+    # A later word of the name starts with query, like "Hò" for "Xã Phú Hòa"
+    WORD_PREFIX = 2
+    # Name with division type starts with query, like "Xã Phú" for "Xã Phú Hòa"
+    TYPE_PREFIX = 3
+
+
+def normalize(text: str) -> str:
+    """Normalize a name or query, keeping the division type. A trailing space is kept, as it ends a word."""
+    normalized = ' '.join(normalize_search_name(w) for w in text.replace('_', ' ').split())
+    return normalized + ' ' if normalized and text[-1].isspace() else normalized
+
+
+def strip_division_type(normalized: str) -> str:
+    return _DIVISION_PREFIX_RE.sub('', normalized)
+
+
+def _keys(record: Any) -> tuple[dict[str, MatchKind], set[str]]:
+    """Return the keys to reach the record, and the whole names which match it exactly."""
+    keys: dict[str, MatchKind] = {}
+    names: set[str] = set()
+    # Codename is the name without diacritics, but is given with division type for wards and not for provinces.
+    for name in (record.name, record.codename):
+        full = normalize(name)
+        clean = strip_division_type(full)
+        words = clean.split(' ')
+        candidates = [(full, MatchKind.TYPE_PREFIX), (clean, MatchKind.NAME_PREFIX)]
+        candidates.extend((' '.join(words[i:]), MatchKind.WORD_PREFIX) for i in range(1, len(words)))
+        for key, kind in candidates:
+            keys[key] = min(kind, keys.get(key, kind))
+        names.update((full, clean))
+    return keys, names
+
+
+class _Table:
+    """Keys of one scope, sorted. Each key points to a record (by position) and has a rank, lower is better."""
+
+    def __init__(self, items: Sequence[tuple[str, int, int]]):
+        items = sorted(items)
+        self.keys = [key for key, _rank, _i in items]
+        self.ranks = [rank for _key, rank, _i in items]
+        self.ids = [i for _key, _rank, i in items]
+        self.top: dict[str, tuple[int, ...]] = {}
+        length = 1
+        while True:
+            big = False
+            start = 0
+            for prefix, group in groupby(self.keys, key=lambda k: k[:length]):
+                size = sum(1 for _k in group)
+                if size > SCAN_LIMIT and len(prefix) == length:
+                    self.top[prefix] = self._rank(start, start + size, MAX_SUGGESTIONS)
+                    big = True
+                start += size
+            if not big:
+                break
+            length += 1
+
+    def _rank(self, lo: int, hi: int, limit: int) -> tuple[int, ...]:
+        seen: dict[int, None] = {}
+        for j in sorted(range(lo, hi), key=self.ranks.__getitem__):
+            seen.setdefault(self.ids[j])
+            if len(seen) >= limit:
+                break
+        return tuple(seen)
+
+    def suggest(self, query: str, exact_ids: Iterable[int], limit: int) -> tuple[int, ...]:
+        lo = bisect_left(self.keys, query)
+        hi = bisect_left(self.keys, query + '\uffff', lo)
+        if lo == hi:
+            return ()
+        # Exact matches would have keys equal to the query, at the start of the slice.
+        exact_hi = bisect_right(self.keys, query, lo, hi)
+        exact = {self.ids[j]: None for j in range(lo, exact_hi) if self.ids[j] in exact_ids}
+        top = self.top.get(query) if hi - lo > SCAN_LIMIT else None
+        if top is None:
+            top = self._rank(lo, hi, limit + len(exact))
+        return tuple({**exact, **dict.fromkeys(top)})[:limit]
+
+
+class SuggestIndex:
+    def __init__(self, records: Iterable[Any], scopes: Sequence[str] = ()):
+        self.records = tuple(records)
+        self.scopes = tuple(scopes)
+        # ((kind, level, name length, position), key, position)
+        scored: list[tuple[tuple[int, int, int, int], str, int]] = []
+        # Records with this whole name (with or without division type)
+        self.exact: defaultdict[str, set[int]] = defaultdict(set)
+        for i, record in enumerate(self.records):
+            level = LEVELS.get(record.division_type, len(LEVELS))
+            keys, names = _keys(record)
+            for name in names:
+                self.exact[name].add(i)
+            for key, kind in keys.items():
+                # Shorter names come before longer ones, then dataset order.
+                scored.append(((kind, level, len(record.name), i), key, i))
+        scored.sort()
+        ranked = [(key, rank, i) for rank, (_score, key, i) in enumerate(scored)]
+        self.table = _Table(ranked)
+        by_scope: defaultdict[tuple[str, int], list[tuple[str, int, int]]] = defaultdict(list)
+        for item in ranked:
+            record = self.records[item[2]]
+            for attr in self.scopes:
+                by_scope[(attr, int(getattr(record, attr)))].append(item)
+        self.scoped_tables = {key: _Table(items) for key, items in by_scope.items()}
+
+    def __len__(self):
+        return len(self.records)
+
+    def suggest(self, query: str, limit: int = DEFAULT_SUGGESTIONS, **scope: int) -> tuple[Any, ...]:
+        """
+        Best records whose name, or a word in name, starts with the query.
+        Optionally limited to one parent division, like `suggest('Phú', province_code=1)`.
+        """
+        query = normalize(query)
+        if not query.strip():
+            return ()
+        table = self.table
+        if scope:
+            ((attr, code),) = scope.items()
+            if attr not in self.scopes:
+                raise ValueError(f'Suggest index is not partitioned by {attr}')
+            if (scoped := self.scoped_tables.get((attr, int(code)))) is None:
+                return ()
+            table = scoped
+        ids = table.suggest(query, self.exact.get(query, ()), limit)
+        return tuple(self.records[i] for i in ids)
+
+
+@cache
+def province_suggest_index() -> SuggestIndex:
+    return SuggestIndex(ProvinceRecord.from_province(p) for p in Province.iter_all())
+
+
+@cache
+def ward_suggest_index() -> SuggestIndex:
+    return SuggestIndex((WardRecord.from_ward(w) for w in Ward.iter_all()), ('province_code',))
+
+
+@cache
+def legacy_district_suggest_index() -> SuggestIndex:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+
+    return SuggestIndex(LegacyDistrict.iter_all(), ('province_code',))
+
+
+@cache
+def legacy_ward_suggest_index() -> SuggestIndex:
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    return SuggestIndex(LegacyWard.iter_all(), ('district_code', 'province_code'))
+
+
+def _build(*builders: Callable[[], SuggestIndex]):
+    for build in builders:
+        index = build()
+        logger.debug('Built suggest index of {} records, {} keys', len(index), len(index.table.keys))
+
+
+def build_suggest_indexes():
+    _build(province_suggest_index, ward_suggest_index)
+
+
+def build_legacy_suggest_indexes():
+    _build(legacy_district_suggest_index, legacy_ward_suggest_index)
@@ -1,21 +1,75 @@
-import os
-from dataclasses import asdict
-from operator import attrgetter
+from collections.abc import Callable, Sequence
+from functools import cache, partial
+from typing import Any
 
-from fastapi import FastAPI, HTTPException, Query, Request
+import msgspec
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response
 from logbook import Logger
 from vietnam_provinces import __data_version__
-from vietnam_provinces.legacy import District, DistrictCode, Province, ProvinceCode, Ward, WardCode
+from vietnam_provinces.legacy import DistrictCode, ProvinceCode
 
 from . import __version__
+from .address import legacy_address_parser
+from .encoders import EncoderName, get_encoder
+from .export import (
+    AVAILABLE_FORMATS,
+    COLUMNAR_FORMATS,
+    EXPORT_RESPONSES,
+    MEDIA_TYPES,
+    ExportFormat,
+    encode_level,
+    encode_rows,
+    request_format,
+)
+from .fuzzy import (
+    FuzzyParams,
+    fuzzy_params,
+    legacy_fuzzy_district_index,
+    legacy_fuzzy_province_index,
+    legacy_fuzzy_ward_index,
+    pick_search,
+)
+from .limits import MAX_ADDRESS_LENGTH
+from .metrics import serialization_timer
+from .paging import ListParams, UnknownFieldError, list_params, list_response, stream_list
+from .records_v1 import (
+    DistrictLookupResultRecord,
+    DistrictRecord,
+    MatchedDivisionRecord,
+    ParsedAddressRecord,
+    ProvinceLookupResultRecord,
+    ProvinceRecord,
+    SearchResultRecord,
+    WardLookupResultRecord,
+    WardRecord,
+)
+from .schema_v1 import (
+    AddressBatchRequest,
+    BatchLookupRequest,
+    DistrictLookupResult,
+    DivisionLevel,
+    ParsedAddress,
+    ProvinceLookupResult,
+    ProvinceResponse,
+    SearchResult,
+    VersionResponse,
+    WardLookupResult,
+)
 from .schema_v1 import District as DistrictResponse
-from .schema_v1 import ProvinceResponse, SearchResult, VersionResponse
 from .schema_v1 import Ward as WardResponse
+from .search import legacy_district_index, legacy_province_index, legacy_ward_index
+from .snapshots import preload_snapshot, snapshot_response
+from .store import legacy_division_store
+from .streaming import StreamMode, StreamQuery
+from .suggest import SuggestLimitQuery, SuggestQuery, legacy_district_suggest_index, legacy_ward_suggest_index
 
 
 logger = Logger(__name__)
 
 api_v1 = FastAPI(title='Vietnam Provinces online API', version=__version__)
+# The main app can switch it, following settings.
+api_v1.state.encoder = get_encoder(EncoderName.MSGSPEC)
 
 SearchResults = list[SearchResult]
 SearchQuery = Query(
@@ -26,170 +80,400 @@ SearchQuery = Query(
 )
 
 
+def _encode(data: Any, schema: Any) -> bytes:
+    with serialization_timer():
+        return api_v1.state.encoder.encode(data, schema)
+
+
+def _json_response(data: Any, schema: Any) -> Response:
+    return Response(_encode(data, schema), media_type='application/json')
+
+
+def _district_record(district: DistrictRecord, depth: int) -> DistrictRecord:
+    if depth < 2:
+        return district
+    wards = legacy_division_store().wards.children('district_code', district.code)
+    return msgspec.structs.replace(district, wards=wards)
+
+
+def _province_record(province: ProvinceRecord, depth: int) -> ProvinceRecord:
+    if depth < 2:
+        return province
+    districts = legacy_division_store().districts.children('province_code', province.code)
+    return msgspec.structs.replace(province, districts=tuple(_district_record(d, depth - 1) for d in districts))
+
+
+@cache
+def _province_records(depth: int) -> tuple[ProvinceRecord, ...]:
+    return tuple(_province_record(p, depth) for p in legacy_division_store().provinces.records)
+
+
+def _district_records() -> Sequence[DistrictRecord]:
+    return legacy_division_store().districts.records
+
+
+def _ward_records() -> Sequence[WardRecord]:
+    return legacy_division_store().wards.records
+
+
+def _build_tree(depth: int) -> bytes:
+    return _encode(_province_records(depth), list[ProvinceResponse])
+
+
+def _build_province(province: ProvinceRecord, depth: int) -> bytes:
+    return _encode(_province_record(province, depth), ProvinceResponse)
+
+
+def _build_district(district: DistrictRecord, depth: int) -> bytes:
+    return _encode(_district_record(district, depth), DistrictResponse)
+
+
+def _build_province_list() -> bytes:
+    return _build_tree(1)
+
+
+def _build_district_list() -> bytes:
+    return _encode(_district_records(), list[DistrictResponse])
+
+
+def _build_ward_list() -> bytes:
+    return _encode(tuple(_ward_records()), list[WardResponse])
+
+
+def _list_response(
+    request: Request, items: Sequence[Any], params: ListParams, schema: Any, sorted_by_code: bool = True
+) -> Response:
+    try:
+        return list_response(request, items, params, partial(_encode, schema=schema), sorted_by_code)
+    except UnknownFieldError as e:
+        raise HTTPException(400, detail=f'invalid-fields: {e}')
+
+
+def _stream_list(items: Sequence[Any], params: ListParams, item_schema: Any, stream: StreamMode) -> Response:
+    try:
+        return stream_list(items, params, partial(_encode, schema=item_schema), stream)
+    except UnknownFieldError as e:
+        raise HTTPException(400, detail=f'invalid-fields: {e}')
+
+
+def preload_snapshots():
+    store = legacy_division_store()
+    for depth in (1, 2, 3):
+        preload_snapshot(('v1', 'tree', depth), partial(_build_tree, depth))
+    for p in store.provinces.records:
+        for depth in (2, 3):
+            preload_snapshot(('v1', 'province', p.code, depth), partial(_build_province, p, depth))
+    for d in store.districts.records:
+        preload_snapshot(('v1', 'district', d.code, 2), partial(_build_district, d, 2))
+    preload_snapshot(('v1', 'provinces'), _build_province_list)
+    preload_snapshot(('v1', 'districts'), _build_district_list)
+    preload_snapshot(('v1', 'wards'), _build_ward_list)
+
+
 @api_v1.get('/', response_model=list[ProvinceResponse])
 async def show_all_divisions(
     request: Request,
     depth: int = Query(
         1, ge=1, le=3, title='Show down to subdivisions', description='2: show districts; 3: show wards'
     ),
+    params: ListParams = Depends(list_params),
 ):
-    client_ip = request.client.host if request.client else None
-    if depth > 1:
-        env_value = os.getenv('BLACKLISTED_CLIENTS', '')
-        blacklist = filter(None, (s.strip() for s in env_value.split(',')))
-        if not client_ip or client_ip in blacklist:
-            raise HTTPException(429)
-
-    provinces = []
-    for p in sorted(Province.iter_all(), key=attrgetter('code')):
-        pd = asdict(p)
-        if depth >= 2:
-            districts = []
-            for d in sorted(District.iter_by_province(p.code), key=attrgetter('code')):
-                dd = asdict(d)
-                if depth >= 3:
-                    dd['wards'] = tuple(
-                        asdict(w) for w in sorted(Ward.iter_by_district(d.code), key=attrgetter('code'))
-                    )
-                districts.append(dd)
-            pd['districts'] = tuple(districts)
-        else:
-            pd['districts'] = ()
-        provinces.append(pd)
-    return provinces
+    if not params.is_default:
+        return _list_response(request, _province_records(depth), params, list[ProvinceResponse])
+    return await snapshot_response(request, ('v1', 'tree', depth), partial(_build_tree, depth))
 
 
 @api_v1.get('/p/', response_model=list[ProvinceResponse])
-async def list_provinces():
-    return tuple(asdict(p) for p in sorted(Province.iter_all(), key=attrgetter('code')))
-
+async def list_provinces(request: Request, params: ListParams = Depends(list_params)):
+    if not params.is_default:
+        return _list_response(request, _province_records(1), params, list[ProvinceResponse])
+    return await snapshot_response(request, ('v1', 'provinces'), _build_province_list)
 
-def _make_search_results(items) -> list[dict]:
-    # Try to extract the enum value safely
-    def _code_value(code):
-        if hasattr(code, 'value'):
-            return code.value
-        return code
 
-    return [{'name': i.name, 'code': _code_value(i.code)} for i in items]
+def _make_search_results(request: Request, items, params: ListParams) -> Response:
+    records = [SearchResultRecord(i.name, i.code) for i in items]
+    # Search results are ordered by score
+    return _list_response(request, records, params, SearchResults, sorted_by_code=False)
 
 
 @api_v1.get('/p/search/', response_model=SearchResults)
-async def search_provinces(q: str = SearchQuery):
-    items = Province.search(q)
-    return _make_search_results(items)
+async def search_provinces(
+    request: Request,
+    q: str = SearchQuery,
+    fuzzy: FuzzyParams = Depends(fuzzy_params),
+    params: ListParams = Depends(list_params),
+):
+    items = pick_search(legacy_province_index, legacy_fuzzy_province_index, fuzzy, params)(q)
+    return _make_search_results(request, items, params)
+
+
+@api_v1.post('/p/batch/', response_model=list[ProvinceLookupResult])
+async def batch_get_provinces(body: BatchLookupRequest):
+    """
+    Look up many provinces at once. Results are in the same order as requested codes.
+    """
+    provinces = legacy_division_store().provinces
+    results = []
+    for code in body.codes:
+        record = provinces.get(code)
+        results.append(ProvinceLookupResultRecord(code, record is not None, record))
+    return _json_response(results, list[ProvinceLookupResult])
 
 
 @api_v1.get('/p/{code}', response_model=ProvinceResponse)
 async def get_province(
+    request: Request,
     code: int,
     depth: int = Query(
         1, ge=1, le=3, title='Show down to subdivisions', description='2: show districts; 3: show wards'
     ),
 ):
-    try:
-        pcode = ProvinceCode(code)
-    except ValueError:
+    if (province := legacy_division_store().provinces.get(code)) is None:
         raise HTTPException(404, detail='invalid-province-code')
-    try:
-        province = Province.from_code(pcode)
-    except (KeyError, ValueError, IndexError):
-        raise HTTPException(404, detail='invalid-province-code')
-    response = asdict(province)
-
-    districts = []
     if depth >= 2:
-        for d in sorted(District.iter_by_province(pcode), key=attrgetter('code')):
-            dd = asdict(d)
-            if depth >= 3:
-                dd['wards'] = tuple(asdict(w) for w in sorted(Ward.iter_by_district(d.code), key=attrgetter('code')))
-            districts.append(dd)
-    response['districts'] = tuple(districts)
-    return response
+        key = ('v1', 'province', province.code, depth)
+        return await snapshot_response(request, key, partial(_build_province, province, depth))
+    return _json_response(_province_record(province, depth), ProvinceResponse)
 
 
 @api_v1.get('/d/', response_model=list[DistrictResponse])
-async def list_districts():
-    return tuple(asdict(d) for d in sorted(District.iter_all(), key=attrgetter('code')))
+async def list_districts(
+    request: Request, stream: StreamMode | None = StreamQuery, params: ListParams = Depends(list_params)
+):
+    if stream is not None:
+        return _stream_list(_district_records(), params, DistrictResponse, stream)
+    if not params.is_default:
+        return _list_response(request, _district_records(), params, list[DistrictResponse])
+    return await snapshot_response(request, ('v1', 'districts'), _build_district_list)
 
 
 @api_v1.get('/d/search/', response_model=SearchResults)
-async def search_districts(q: str = SearchQuery, p: int | None = Query(None, title='Province code to filter')):
+async def search_districts(
+    request: Request,
+    q: str = SearchQuery,
+    p: int | None = Query(None, title='Province code to filter'),
+    fuzzy: FuzzyParams = Depends(fuzzy_params),
+    params: ListParams = Depends(list_params),
+):
+    search = pick_search(legacy_district_index, legacy_fuzzy_district_index, fuzzy, params)
     if p is not None:
         try:
             pcode = ProvinceCode(p)
-            items = tuple(filter(lambda x: x.province_code == pcode, District.search(q)))
+            items = search(q, province_code=pcode)
         except ValueError:
             items = ()
     else:
-        items = tuple(District.search(q))
-    return _make_search_results(items)
+        items = search(q)
+    return _make_search_results(request, items, params)
+
+
+@api_v1.get('/d/suggest/', response_model=SearchResults)
+async def suggest_districts(
+    q: str = SuggestQuery,
+    p: int | None = Query(None, title='Province code to filter'),
+    limit: int = SuggestLimitQuery,
+):
+    """
+    Autocomplete: the best districts whose name, or a word in name, starts with the query.
+    """
+    index = legacy_district_suggest_index()
+    items = index.suggest(q, limit) if p is None else index.suggest(q, limit, province_code=p)
+    return _json_response([SearchResultRecord(i.name, i.code) for i in items], SearchResults)
+
+
+@api_v1.post('/d/batch/', response_model=list[DistrictLookupResult])
+async def batch_get_districts(body: BatchLookupRequest):
+    """
+    Look up many districts at once. Results are in the same order as requested codes.
+    With "expand", the province of each district is included.
+    """
+    store = legacy_division_store()
+    results = []
+    for code in body.codes:
+        if (district := store.districts.get(code)) is None:
+            results.append(DistrictLookupResultRecord(code, False))
+            continue
+        province = store.provinces.get(district.province_code) if body.expand else None
+        results.append(DistrictLookupResultRecord(code, True, district, province))
+    return _json_response(results, list[DistrictLookupResult])
 
 
 @api_v1.get('/d/{code}', response_model=DistrictResponse)
 async def get_district(
-    code: int, depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions', description='2: show wards')
+    request: Request,
+    code: int,
+    depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions', description='2: show wards'),
 ):
-    try:
-        dcode = DistrictCode(code)
-    except ValueError:
-        raise HTTPException(404, detail='invalid-district-code')
-    try:
-        district = District.from_code(dcode)
-    except (KeyError, ValueError, IndexError):
+    if (district := legacy_division_store().districts.get(code)) is None:
         raise HTTPException(404, detail='invalid-district-code')
-
-    response = asdict(district)
-
-    wards = []
     if depth >= 2:
-        wards = [asdict(w) for w in sorted(Ward.iter_by_district(dcode), key=attrgetter('code'))]
-    response['wards'] = tuple(wards)
-    return response
+        key = ('v1', 'district', district.code, depth)
+        return await snapshot_response(request, key, partial(_build_district, district, depth))
+    return _json_response(_district_record(district, depth), DistrictResponse)
 
 
 @api_v1.get('/w/', response_model=list[WardResponse])
-async def list_wards():
-    return tuple(asdict(w) for w in sorted(Ward.iter_all(), key=attrgetter('code')))
+async def list_wards(
+    request: Request, stream: StreamMode | None = StreamQuery, params: ListParams = Depends(list_params)
+):
+    if stream is not None:
+        return _stream_list(_ward_records(), params, WardResponse, stream)
+    if not params.is_default:
+        return _list_response(request, _ward_records(), params, list[WardResponse])
+    return await snapshot_response(request, ('v1', 'wards'), _build_ward_list)
 
 
 @api_v1.get('/w/search/', response_model=SearchResults)
 async def search_wards(
+    request: Request,
     q: str = SearchQuery,
     d: int | None = Query(None, title='District code to filter'),
     p: int | None = Query(None, title='Province code to filter, ignored if district is given'),
+    fuzzy: FuzzyParams = Depends(fuzzy_params),
+    params: ListParams = Depends(list_params),
 ):
-    items = tuple(Ward.search(q))
+    search = pick_search(legacy_ward_index, legacy_fuzzy_ward_index, fuzzy, params)
     if d is not None:
         try:
-            dcode = DistrictCode(d)
-            items = tuple(filter(lambda x: x.district_code == dcode, items))
+            items = search(q, district_code=DistrictCode(d))
         except ValueError:
             items = ()
     elif p is not None:
         try:
-            pcode = ProvinceCode(p)
-            dcodes = {dist.code for dist in District.iter_by_province(pcode)}
-            items = tuple(filter(lambda x: x.district_code in dcodes, items))
+            items = search(q, province_code=ProvinceCode(p))
         except ValueError:
             items = ()
+    else:
+        items = search(q)
 
-    return _make_search_results(items)
+    return _make_search_results(request, items, params)
+
+
+@api_v1.get('/w/suggest/', response_model=SearchResults)
+async def suggest_wards(
+    q: str = SuggestQuery,
+    d: int | None = Query(None, title='District code to filter'),
+    p: int | None = Query(None, title='Province code to filter, ignored if district is given'),
+    limit: int = SuggestLimitQuery,
+):
+    """
+    Autocomplete: the best wards whose name, or a word in name, starts with the query.
+    """
+    index = legacy_ward_suggest_index()
+    if d is not None:
+        items = index.suggest(q, limit, district_code=d)
+    elif p is not None:
+        items = index.suggest(q, limit, province_code=p)
+    else:
+        items = index.suggest(q, limit)
+    return _json_response([SearchResultRecord(i.name, i.code) for i in items], SearchResults)
+
+
+@api_v1.post('/w/batch/', response_model=list[WardLookupResult])
+async def batch_get_wards(body: BatchLookupRequest):
+    """
+    Look up many wards at once. Results are in the same order as requested codes.
+    With "expand", the district and province of each ward are included.
+    """
+    store = legacy_division_store()
+    results = []
+    for code in body.codes:
+        if (ward := store.wards.get(code)) is None:
+            results.append(WardLookupResultRecord(code, False))
+            continue
+        district = province = None
+        if body.expand:
+            if district := store.districts.get(ward.district_code):
+                province = store.provinces.get(district.province_code)
+        results.append(WardLookupResultRecord(code, True, ward, district, province))
+    return _json_response(results, list[WardLookupResult])
 
 
 @api_v1.get('/w/{code}', response_model=WardResponse)
 async def get_ward(code: int):
-    try:
-        wcode = WardCode(code)
-    except ValueError:
+    if (ward := legacy_division_store().wards.get(code)) is None:
         raise HTTPException(404, detail='invalid-ward-code')
-    try:
-        ward = Ward.from_code(wcode)
-    except (KeyError, ValueError, IndexError):
-        raise HTTPException(404, detail='invalid-ward-code')
-    return asdict(ward)
+    return _json_response(ward, WardResponse)
 
 
 @api_v1.get('/version', response_model=VersionResponse)
 async def get_version():
     return VersionResponse(data_version=__data_version__)
+
+
+AddressQuery = Query(
+    ...,
+    min_length=1,
+    max_length=MAX_ADDRESS_LENGTH,
+    title='Free-form address',
+    examples=['P. Bến Nghé, Q.1, TP HCM'],
+)
+
+
+def _parse_address(text: str) -> ParsedAddressRecord:
+    result = legacy_address_parser().parse(text)
+    province, district, ward = (
+        MatchedDivisionRecord(d.code, d.name, m) if d else None for d, m in zip(result.divisions, result.matched)
+    )
+    return ParsedAddressRecord(text, province, district, ward, result.score, result.ambiguous)
+
+
+@api_v1.get('/address/', response_model=ParsedAddress)
+async def parse_address(text: str = AddressQuery):
+    """
+    Find the province, district and ward in a free-form address, like "P. Bến Nghé, Q.1, TP HCM".
+    Abbreviations (like "P.", "Q.1"), missing diacritics and common nicknames (like "HCM", "Sài Gòn") are recognized.
+    """
+    return _json_response(_parse_address(text), ParsedAddress)
+
+
+@api_v1.post('/address/batch/', response_model=list[ParsedAddress])
+async def batch_parse_addresses(body: AddressBatchRequest):
+    """
+    Parse many addresses at once. Results are in the same order as requested addresses.
+    """
+    return _json_response([_parse_address(t) for t in body.addresses], list[ParsedAddress])
+
+
+ExportFormatQuery = Query(None, title='Export format', description='If not given, it is picked from Accept header.')
+
+
+def _check_export_format(fmt: ExportFormat):
+    if fmt not in AVAILABLE_FORMATS:
+        raise HTTPException(406, detail='unavailable-format')
+
+
+@api_v1.get('/export/', response_model=list[ProvinceResponse], responses=EXPORT_RESPONSES)
+async def export_all_divisions(request: Request, format: ExportFormat | None = ExportFormatQuery):
+    """
+    All provinces with their districts and wards, like `/?depth=3`, as JSON, MessagePack or CBOR.
+    For Arrow and Parquet, export each level with `/export/{level}`.
+    """
+    fmt = request_format(request, format)
+    _check_export_format(fmt)
+    if fmt in COLUMNAR_FORMATS:
+        raise HTTPException(406, detail='columnar-format-needs-level')
+    key = ('v1', 'export', 'tree', fmt)
+    return await snapshot_response(request, key, lambda: encode_rows(_province_records(3), fmt), MEDIA_TYPES[fmt])
+
+
+@api_v1.get(
+    '/export/{level}',
+    response_model=list[ProvinceResponse | DistrictResponse | WardResponse],
+    responses=EXPORT_RESPONSES,
+)
+async def export_level(request: Request, level: DivisionLevel, format: ExportFormat | None = ExportFormatQuery):
+    """
+    All divisions of one level, as JSON, MessagePack, CBOR, or a table in Arrow (IPC file) or Parquet format.
+    Districts refer to their province with the "province_code" column, wards to their district with "district_code".
+    """
+    fmt = request_format(request, format)
+    _check_export_format(fmt)
+    levels: dict[DivisionLevel, Callable[[], Sequence[Any]]] = {
+        DivisionLevel.P: partial(_province_records, 1),
+        DivisionLevel.D: _district_records,
+        DivisionLevel.W: _ward_records,
+    }
+    records = levels[level]()
+    key = ('v1', 'export', level, fmt)
+    return await snapshot_response(request, key, lambda: encode_level(tuple(records), fmt), MEDIA_TYPES[fmt])
@@ -1,16 +1,64 @@
-import os
-from dataclasses import asdict
-from operator import attrgetter
+from collections.abc import Iterable, Sequence
+from functools import cache, partial
+from typing import Any
 
-from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import FileResponse, RedirectResponse
-from fastapi_problem.error import NotFoundProblem
+import msgspec
+from fastapi import Depends, FastAPI, Query, Request
+from fastapi.responses import RedirectResponse, Response
+from fastapi_problem.error import BadRequestProblem, NotFoundProblem, StatusProblem
 from fastapi_problem.handler import add_exception_handler, new_exception_handler
 from logbook import Logger
-from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH, Province, ProvinceCode, Ward, WardCode
+from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH, Ward, WardCode, __data_version__
 
 from . import __version__
-from .schema_v2 import LegacyWardResponse, ProvinceResponse, WardResponse, WardWithLegacySource
+from .address import address_parser
+from .bulk import BulkConverter, BulkFormat, BulkInputError, DuplexStreamingResponse
+from .encoders import EncoderName, get_encoder
+from .export import (
+    AVAILABLE_FORMATS,
+    COLUMNAR_FORMATS,
+    EXPORT_RESPONSES,
+    MEDIA_TYPES,
+    ExportFormat,
+    encode_level,
+    encode_rows,
+    request_format,
+)
+from .fuzzy import FuzzyParams, fuzzy_params, fuzzy_province_index, fuzzy_ward_index, pick_search
+from .history import DEFAULT_HISTORY_DIR, DatasetHistory
+from .legacy_map import lazy_legacy_ward_map
+from .limits import MAX_ADDRESS_LENGTH
+from .metrics import serialization_timer
+from .paging import ListParams, UnknownFieldError, list_params, list_response, stream_list
+from .records_v2 import (
+    MatchedDivisionRecord,
+    NestedProvinceRecord,
+    ParsedAddressRecord,
+    ProvinceLookupResultRecord,
+    ProvinceRecord,
+    WardLookupResultRecord,
+    WardRecord,
+)
+from .schema_v2 import (
+    AddressBatchRequest,
+    BatchLookupRequest,
+    DatasetDelta,
+    DivisionLevel,
+    LegacyWardResponse,
+    NestedProvince,
+    ParsedAddress,
+    ProvinceLookupResult,
+    ProvinceResponse,
+    VersionResponse,
+    WardLookupResult,
+    WardResponse,
+    WardWithLegacySource,
+)
+from .search import province_index, ward_index
+from .snapshots import preload_snapshot, snapshot_response
+from .store import division_store
+from .streaming import StreamMode, StreamQuery
+from .suggest import SuggestLimitQuery, SuggestQuery, province_suggest_index, ward_suggest_index
 
 
 api_v2 = FastAPI(title='Vietnam Provinces online API (2025)', version=__version__)
@@ -27,103 +75,299 @@ class WardNotExistError(NotFoundProblem):
     title = 'Ward not exist'
 
 
+class UnsupportedBulkFormatError(StatusProblem):
+    status = 415
+    title = 'Unsupported bulk format'
+
+
+class InvalidBulkInputError(BadRequestProblem):
+    title = 'Invalid bulk input'
+
+
+class InvalidFieldsError(BadRequestProblem):
+    title = 'Invalid fields'
+
+
+class NotAcceptableError(StatusProblem):
+    status = 406
+    title = 'Not acceptable'
+
+
+class DataVersionNotFoundError(NotFoundProblem):
+    title = 'Data version not found'
+
+
+# Raised from the main app's rate limiting, which runs before this app is reached.
+class TooManyRequestsError(StatusProblem):
+    status = 429
+    title = 'Too many requests'
+
+
+# The main app can switch it, following settings.
+api_v2.state.encoder = get_encoder(EncoderName.MSGSPEC)
+api_v2.state.dataset_history = DatasetHistory(DEFAULT_HISTORY_DIR)
+
+
+def _encode(data: Any, schema: Any) -> bytes:
+    with serialization_timer():
+        return api_v2.state.encoder.encode(data, schema)
+
+
+def _json_response(data: Any, schema: Any) -> Response:
+    return Response(_encode(data, schema), media_type='application/json')
+
+
+def _ward_search_records(wards: Iterable[Ward], ranked: bool) -> tuple[WardRecord, ...]:
+    return division_store().wards.records_of(wards, sort=not ranked)
+
+
+def _province_record(province: ProvinceRecord, depth: int) -> ProvinceRecord:
+    if depth < 2:
+        return province
+    return msgspec.structs.replace(province, wards=division_store().wards.children('province_code', province.code))
+
+
+@cache
+def _province_records(depth: int) -> tuple[ProvinceRecord, ...]:
+    return tuple(_province_record(p, depth) for p in division_store().provinces.records)
+
+
+def _ward_records() -> Sequence[WardRecord]:
+    return division_store().wards.records
+
+
+@cache
+def _nested_province_records() -> tuple[NestedProvinceRecord, ...]:
+    return msgspec.json.decode(NESTED_DIVISIONS_JSON_PATH.read_bytes(), type=tuple[NestedProvinceRecord, ...])
+
+
+def _build_province_list() -> bytes:
+    return _encode(_province_records(1), tuple[ProvinceResponse, ...])
+
+
+def _build_ward_list() -> bytes:
+    return _encode(tuple(_ward_records()), tuple[WardResponse, ...])
+
+
+def _list_response(
+    request: Request, items: Sequence[Any], params: ListParams, schema: Any, sorted_by_code: bool = True
+) -> Response:
+    try:
+        return list_response(request, items, params, partial(_encode, schema=schema), sorted_by_code)
+    except UnknownFieldError as e:
+        raise InvalidFieldsError(f'Unknown fields: {e}') from e
+
+
+def _stream_list(
+    items: Sequence[Any], params: ListParams, item_schema: Any, stream: StreamMode, sorted_by_code: bool = True
+) -> Response:
+    try:
+        return stream_list(items, params, partial(_encode, schema=item_schema), stream, sorted_by_code)
+    except UnknownFieldError as e:
+        raise InvalidFieldsError(f'Unknown fields: {e}') from e
+
+
+def preload_snapshots():
+    preload_snapshot(('v2', 'tree', 2), NESTED_DIVISIONS_JSON_PATH.read_bytes)
+    preload_snapshot(('v2', 'provinces'), _build_province_list)
+    preload_snapshot(('v2', 'wards'), _build_ward_list)
+
+
 @api_v2.get('/', response_model=tuple[ProvinceResponse, ...])
-def show_all_divisions(request: Request, depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions')):
-    client_ip = request.client.host if request.client else None
-    if depth > 1:
-        env_value = os.getenv('BLACKLISTED_CLIENTS', '')
-        blacklist = filter(None, (s.strip() for s in env_value.split(',')))
-        if not client_ip or client_ip in blacklist:
-            raise HTTPException(429)
+async def show_all_divisions(
+    request: Request,
+    depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions'),
+    params: ListParams = Depends(list_params),
+):
+    if not params.is_default:
+        if depth >= 2:
+            # Same shape as the whole tree below
+            return _list_response(request, _nested_province_records(), params, tuple[NestedProvince, ...])
+        return _list_response(request, _province_records(1), params, tuple[ProvinceResponse, ...])
     if depth >= 2:
-        return FileResponse(NESTED_DIVISIONS_JSON_PATH)
-    return tuple(asdict(p) for p in sorted(Province.iter_all(), key=attrgetter('code')))
+        return await snapshot_response(request, ('v2', 'tree', 2), NESTED_DIVISIONS_JSON_PATH.read_bytes)
+    return await snapshot_response(request, ('v2', 'provinces'), _build_province_list)
 
 
-@api_v2.get('/p/')
-async def list_provinces(search: str = '') -> tuple[ProvinceResponse, ...]:
-    if search:
-        provinces = Province.search(search)
-    else:
-        provinces = tuple(sorted(Province.iter_all(), key=attrgetter('code')))
-    return tuple(ProvinceResponse(**asdict(p)) for p in provinces)
+@api_v2.get('/p/', response_model=tuple[ProvinceResponse, ...])
+async def list_provinces(
+    request: Request,
+    search: str = '',
+    fuzzy: FuzzyParams = Depends(fuzzy_params),
+    params: ListParams = Depends(list_params),
+) -> Response:
+    if not search:
+        if not params.is_default:
+            return _list_response(request, _province_records(1), params, tuple[ProvinceResponse, ...])
+        return await snapshot_response(request, ('v2', 'provinces'), _build_province_list)
+    search_provinces = pick_search(province_index, fuzzy_province_index, fuzzy, params)
+    provinces = division_store().provinces.records_of(search_provinces(search))
+    # Search results are ordered by score
+    return _list_response(request, provinces, params, tuple[ProvinceResponse, ...], sorted_by_code=False)
 
 
-@api_v2.get('/p/{code}')
-def get_province(
+@api_v2.get('/p/suggest/', response_model=tuple[ProvinceResponse, ...])
+async def suggest_provinces(q: str = SuggestQuery, limit: int = SuggestLimitQuery) -> Response:
+    """
+    Autocomplete: the best provinces whose name, or a word in name, starts with the query.
+    """
+    return _json_response(province_suggest_index().suggest(q, limit), tuple[ProvinceResponse, ...])
+
+
+@api_v2.post('/p/batch/', response_model=list[ProvinceLookupResult])
+async def batch_get_provinces(body: BatchLookupRequest) -> Response:
+    """
+    Look up many provinces at once. Results are in the same order as requested codes.
+    """
+    provinces = division_store().provinces
+    results = []
+    for code in body.codes:
+        record = provinces.get(code)
+        results.append(ProvinceLookupResultRecord(code, record is not None, record))
+    return _json_response(results, list[ProvinceLookupResult])
+
+
+@api_v2.get('/p/{code}', response_model=ProvinceResponse)
+async def get_province(
     code: int,
     depth: int = Query(1, ge=1, le=2, title='Show down to subdivisions', description='2: show wards'),
-) -> ProvinceResponse:
-    try:
-        pcode = ProvinceCode(code)
-    except ValueError as e:
-        raise ProvinceNotExistError(f'No province has code {code}') from e
-    response = asdict(Province.from_code(pcode))
-    if depth >= 2:
-        wards = sorted(Ward.iter_by_province(pcode), key=attrgetter('code'))
-        response['wards'] = tuple(w for w in wards)
-    return ProvinceResponse(**response)
+) -> Response:
+    if (province := division_store().provinces.get(code)) is None:
+        raise ProvinceNotExistError(f'No province has code {code}')
+    return _json_response(_province_record(province, depth), ProvinceResponse)
 
 
 # FIXME: Failed to generate example response in API doc.
 @api_v2.get('/w/', response_model=None)
 async def list_wards(
-    request: Request, province: int = 0, search: str = ''
-) -> tuple[WardResponse, ...] | RedirectResponse:
+    request: Request,
+    province: int = 0,
+    search: str = '',
+    stream: StreamMode | None = StreamQuery,
+    fuzzy: FuzzyParams = Depends(fuzzy_params),
+    params: ListParams = Depends(list_params),
+) -> Response:
+    """
+    List wards, optionally in one province, or matching the search.
+    Search results are sorted by code, except fuzzy search results, which are sorted by similarity.
+    """
+    store = division_store()
     if province:
-        try:
-            province_code = ProvinceCode(province)
-        except ValueError:
+        if province not in store.provinces:
             # For invalid province code, redirect to new URL this this parameter stripped
             url = request.url.remove_query_params('province')
             logger.info('Redirect to {}', url)
             return RedirectResponse(url)
+        province_code: int | None = province
     else:
         province_code = None
+    search_wards = pick_search(ward_index, fuzzy_ward_index, fuzzy, params)
+    ranked = fuzzy.enabled and bool(search.strip())
+    records: Sequence[WardRecord]
     match province_code, search.strip():
         case (p, '') if p is not None:
-            wards = Ward.iter_by_province(p)
+            records = store.wards.children('province_code', p)
         case (p, s) if p is not None:
-            search_pool = Ward.search(search)
-            wards = iter(w for w in search_pool if w.province_code == province)
+            records = _ward_search_records(search_wards(search, province_code=p), ranked)
         case (None, s) if s:
-            wards = iter(Ward.search(s))
+            records = _ward_search_records(search_wards(s), ranked)
+        case _rest if stream is None and params.is_default:
+            return await snapshot_response(request, ('v2', 'wards'), _build_ward_list)
         case _rest:
-            wards = Ward.iter_all()
+            records = _ward_records()
 
-    return tuple(WardResponse(**asdict(p)) for p in sorted(wards, key=attrgetter('code')))
+    if stream is not None:
+        return _stream_list(records, params, WardResponse, stream, sorted_by_code=not ranked)
+    return _list_response(request, records, params, tuple[WardResponse, ...], sorted_by_code=not ranked)
 
 
-@api_v2.get('/w/{code}')
-def get_ward(code: int) -> WardResponse:
-    try:
-        wcode = WardCode(code)
-    except ValueError as e:
-        raise WardNotExistError(f'No ward has code {code}') from e
-    return WardResponse(**asdict(Ward.from_code(wcode)))
+@api_v2.get('/w/suggest/', response_model=tuple[WardResponse, ...])
+async def suggest_wards(
+    q: str = SuggestQuery,
+    province: int = Query(0, title='Province code to filter'),
+    limit: int = SuggestLimitQuery,
+) -> Response:
+    """
+    Autocomplete: the best wards whose name, or a word in name, starts with the query.
+    """
+    index = ward_suggest_index()
+    items = index.suggest(q, limit, province_code=province) if province else index.suggest(q, limit)
+    return _json_response(items, tuple[WardResponse, ...])
+
+
+@api_v2.post('/w/batch/', response_model=list[WardLookupResult])
+async def batch_get_wards(body: BatchLookupRequest) -> Response:
+    """
+    Look up many wards at once. Results are in the same order as requested codes.
+    With "expand", the province of each ward is included.
+    """
+    store = division_store()
+    results = []
+    for code in body.codes:
+        if (ward := store.wards.get(code)) is None:
+            results.append(WardLookupResultRecord(code, False))
+            continue
+        province = store.provinces.get(ward.province_code) if body.expand else None
+        results.append(WardLookupResultRecord(code, True, ward, province))
+    return _json_response(results, list[WardLookupResult])
+
+
+@api_v2.get('/w/{code}', response_model=WardResponse)
+async def get_ward(code: int) -> Response:
+    if (ward := division_store().wards.get(code)) is None:
+        raise WardNotExistError(f'No ward has code {code}')
+    return _json_response(ward, WardResponse)
 
 
 @api_v2.get('/w/from-legacy/', response_model=tuple[WardWithLegacySource, ...])
-def lookup_from_legacy_ward(legacy_name: str = '', legacy_code: int = 0) -> tuple[WardWithLegacySource, ...]:
+async def lookup_from_legacy_ward(legacy_name: str = '', legacy_code: int = 0) -> Response:
     """
     Lookup for new wards from pre-2025 name or pre-2025 code.
     """
-    if not legacy_name and not legacy_code:
-        return ()
+    # Same results as Ward.search_from_legacy, from precomputed tables
+    ward_map = await lazy_legacy_ward_map.get_async()
+    items = ward_map.search(name=legacy_name, code=legacy_code)
+    return _json_response(items, tuple[WardWithLegacySource, ...])
 
-    # Use the search_from_legacy classmethod from Ward as documented
-    results = Ward.search_from_legacy(name=legacy_name, code=legacy_code)
-    if not results:
-        return ()
 
-    # Convert WardWithLegacy objects to WardWithLegacySource dataclass instances
-    response_items = []
-    for result in results:
-        ward_response = WardResponse(**asdict(result.ward))
-        item = WardWithLegacySource(source_code=result.source_code, ward=ward_response)
-        response_items.append(item)
+@api_v2.post(
+    '/w/from-legacy/bulk/',
+    response_model=None,
+    summary='Convert legacy wards in bulk',
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'content': {
+                BulkFormat.CSV: {'example': 'ref,legacy_code,legacy_name\nA1,1,\nA2,,Phúc Xá\n'},
+                BulkFormat.NDJSON: {
+                    'example': '{"ref": "A1", "legacy_code": 1}\n{"ref": "A2", "legacy_name": "Phúc Xá"}\n'
+                },
+            },
+        }
+    },
+)
+async def convert_from_legacy_bulk(request: Request) -> Response:
+    """
+    Convert many pre-2025 ward codes or names to new wards.
 
-    return tuple(response_items)
+    The body is CSV (with header) or NDJSON, with fields "legacy_code" or "legacy_name",
+    and optional "ref" (echoed back) and "legacy_province_code" (to narrow down name search).
+    Converted rows are streamed back in the same format, while the body is being uploaded.
+    Rows matching more than one new ward are marked "ambiguous".
+    """
+    media_type = request.headers.get('content-type', '').partition(';')[0].strip().lower()
+    try:
+        fmt = BulkFormat(media_type)
+    except ValueError as e:
+        raise UnsupportedBulkFormatError(f'Content-Type must be one of: {", ".join(BulkFormat)}') from e
+    # Rows are converted with it, build it before.
+    await lazy_legacy_ward_map.get_async()
+    converter = BulkConverter(fmt, request.stream())
+    try:
+        await converter.read_header()
+    except BulkInputError as e:
+        raise InvalidBulkInputError(str(e)) from e
+    return DuplexStreamingResponse(converter.iter_output(), media_type=fmt)
 
 
 @api_v2.get(
@@ -132,32 +376,108 @@ def lookup_from_legacy_ward(legacy_name: str = '', legacy_code: int = 0) -> tupl
     summary='Get legacy wards',
     description='Get pre-2025 wards that were merged to form this new ward.',
 )
-def get_legacy_wards(code: int) -> tuple[LegacyWardResponse, ...]:
+async def get_legacy_wards(code: int) -> Response:
     """
     Get pre-2025 wards that were merged to form this new ward.
     """
     try:
-        # Get the new ward first
-        ward = Ward.from_code(WardCode(code))
+        wcode = WardCode(code)
     except ValueError as e:
         raise WardNotExistError(f'No ward has code {code}') from e
+    # Same as ward.get_legacy_sources(), from precomputed tables
+    ward_map = await lazy_legacy_ward_map.get_async()
+    return _json_response(ward_map.to_legacies(wcode), tuple[LegacyWardResponse, ...])
+
+
+AddressQuery = Query(
+    ...,
+    min_length=1,
+    max_length=MAX_ADDRESS_LENGTH,
+    title='Free-form address',
+    examples=['P. Bến Nghé, Q.1, TP HCM'],
+)
+
 
-    # Get legacy sources - these are LegacyWard namedtuples
-    legacy_wards = ward.get_legacy_sources()
-    if not legacy_wards:
-        return ()
-
-    # Convert legacy wards to LegacyWardResponse objects
-    # Legacy wards are namedtuples with direct field access
-    result = []
-    for w in legacy_wards:
-        legacy_ward_data = LegacyWardResponse(
-            name=w.name,
-            code=w.code,
-            division_type=w.division_type,
-            codename=w.codename,
-            district_code=w.district_code,
-            province_code=w.province_code,
-        )
-        result.append(legacy_ward_data)
-    return tuple(result)
+def _parse_address(text: str) -> ParsedAddressRecord:
+    result = address_parser().parse(text)
+    province, ward = (
+        MatchedDivisionRecord(d.code, d.name, m) if d else None for d, m in zip(result.divisions, result.matched)
+    )
+    return ParsedAddressRecord(text, province, ward, result.score, result.ambiguous)
+
+
+@api_v2.get('/address/', response_model=ParsedAddress)
+async def parse_address(text: str = AddressQuery) -> Response:
+    """
+    Find the province and ward in a free-form address, like "Phường Bến Nghé, TP HCM".
+    Abbreviations (like "P.", "TP"), missing diacritics and common nicknames (like "HCM", "Sài Gòn") are recognized.
+    """
+    return _json_response(_parse_address(text), ParsedAddress)
+
+
+@api_v2.post('/address/batch/', response_model=list[ParsedAddress])
+async def batch_parse_addresses(body: AddressBatchRequest) -> Response:
+    """
+    Parse many addresses at once. Results are in the same order as requested addresses.
+    """
+    return _json_response([_parse_address(t) for t in body.addresses], list[ParsedAddress])
+
+
+@api_v2.get('/version', response_model=VersionResponse)
+async def get_version() -> Response:
+    return _json_response({'data_version': __data_version__}, VersionResponse)
+
+
+@api_v2.get('/changes/', response_model=DatasetDelta)
+async def get_changes(
+    request: Request,
+    since: str = Query(..., title='Data version the client has', examples=['2025-07-01']),
+) -> Response:
+    """
+    Provinces and wards which were added, changed or removed since an earlier data version (see `/version`).
+    Clients which keep a copy of the data can update it with these, instead of downloading the whole data again.
+    """
+    history: DatasetHistory = api_v2.state.dataset_history
+    if since not in (versions := history.versions()):
+        raise DataVersionNotFoundError(f'No snapshot of data version {since}. Known versions: {", ".join(versions)}')
+    # Cached for each pair of (since, current) versions
+    return await snapshot_response(
+        request, ('v2', 'changes', since), lambda: _encode(history.delta(since), DatasetDelta)
+    )
+
+
+ExportFormatQuery = Query(None, title='Export format', description='If not given, it is picked from Accept header.')
+
+
+def _check_export_format(fmt: ExportFormat):
+    if fmt not in AVAILABLE_FORMATS:
+        raise NotAcceptableError(f'Format {fmt} is not available on this server')
+
+
+@api_v2.get('/export/', response_model=tuple[NestedProvince, ...], responses=EXPORT_RESPONSES)
+async def export_all_divisions(request: Request, format: ExportFormat | None = ExportFormatQuery) -> Response:
+    """
+    All provinces with their wards, like `/?depth=2`, as JSON, MessagePack or CBOR.
+    For Arrow and Parquet, export each level with `/export/{level}`.
+    """
+    fmt = request_format(request, format)
+    _check_export_format(fmt)
+    if fmt in COLUMNAR_FORMATS:
+        raise NotAcceptableError(f'Format {fmt} is only for one level, see /export/{{level}}')
+    key = ('v2', 'export', 'tree', fmt)
+    return await snapshot_response(request, key, lambda: encode_rows(_nested_province_records(), fmt), MEDIA_TYPES[fmt])
+
+
+@api_v2.get('/export/{level}', response_model=tuple[ProvinceResponse | WardResponse, ...], responses=EXPORT_RESPONSES)
+async def export_level(
+    request: Request, level: DivisionLevel, format: ExportFormat | None = ExportFormatQuery
+) -> Response:
+    """
+    All divisions of one level, as JSON, MessagePack, CBOR, or a table in Arrow (IPC file) or Parquet format.
+    Wards refer to their province with the "province_code" column.
+    """
+    fmt = request_format(request, format)
+    _check_export_format(fmt)
+    records = _province_records(1) if level == DivisionLevel.P else _ward_records()
+    key = ('v2', 'export', level, fmt)
+    return await snapshot_response(request, key, lambda: encode_level(tuple(records), fmt), MEDIA_TYPES[fmt])
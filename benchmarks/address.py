@@ -0,0 +1,98 @@
+"""
+Measure the free-text address parser in `api.address`: build time, and addresses parsed per second on one core.
+
+Addresses are generated from the dataset, in several writing styles (full names, abbreviations,
+no diacritics, with street number), so that most of them resolve to a different ward.
+
+Run from the top-level folder:
+
+    python -m benchmarks.address
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections.abc import Callable
+
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.helpers import normalize_search_name
+
+from api.address import AddressParser, address_parser, legacy_address_parser
+
+
+ABBREVIATIONS = (('Phường ', 'P.'), ('Quận ', 'Q.'), ('Huyện ', 'H.'), ('Thành phố ', 'TP '))
+
+
+def abbreviate(name: str) -> str:
+    for full, short in ABBREVIATIONS:
+        name = name.replace(full, short)
+    return name
+
+
+STYLES: tuple[Callable[..., str], ...] = (
+    lambda *names: ', '.join(names),
+    lambda *names: '12 Đường Số 3, ' + ', '.join(names),
+    lambda *names: ', '.join(normalize_search_name(n) for n in names),
+    lambda *names: ' '.join(abbreviate(n) for n in names),
+)
+
+
+def make_addresses(wards, provinces, count: int) -> list[str]:
+    rand = random.Random(0)
+    addresses = []
+    for ward in rand.sample(wards, min(count, len(wards))):
+        names = [ward.name, *(p.name for p in provinces(ward))]
+        addresses.append(rand.choice(STYLES)(*names))
+    return addresses
+
+
+def legacy_addresses(count: int) -> list[str]:
+    from vietnam_provinces.legacy import District as LegacyDistrict
+    from vietnam_provinces.legacy import Province as LegacyProvince
+    from vietnam_provinces.legacy import Ward as LegacyWard
+
+    def parents(w):
+        return (LegacyDistrict.from_code(w.district_code), LegacyProvince.from_code(w.province_code))
+
+    return make_addresses(list(LegacyWard.iter_all()), parents, count)
+
+
+def addresses(count: int) -> list[str]:
+    return make_addresses(list(Ward.iter_all()), lambda w: (Province.from_code(w.province_code),), count)
+
+
+def measure(parser: AddressParser, texts: list[str], rounds: int) -> tuple[float, float]:
+    """Return addresses per second, and p99 time per address (µs)."""
+    timings = []
+    for _i in range(rounds):
+        for text in texts:
+            start = time.perf_counter()
+            parser.parse(text)
+            timings.append(time.perf_counter() - start)
+    return len(timings) / sum(timings), statistics.quantiles(timings, n=100)[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='Number of distinct addresses')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"Dataset":<10} {"build (ms)":>10} {"names":>8} {"addr/s":>10} {"p99 (µs)":>10} {"resolved":>9}')
+    for label, get_parser, get_addresses in (
+        ('2025', address_parser, addresses),
+        ('legacy', legacy_address_parser, legacy_addresses),
+    ):
+        texts = get_addresses(args.count)
+        start = time.perf_counter()
+        address = get_parser()
+        build_ms = (time.perf_counter() - start) * 1000
+        # Share of addresses whose lowest division is found
+        resolved = sum(address.parse(t).divisions[-1] is not None for t in texts) / len(texts)
+        rate, p99 = measure(address, texts, args.rounds)
+        print(f'{label:<10} {build_ms:>10.0f} {address.automaton.size:>8} {rate:>10.0f} {p99:>10.1f} {resolved:>9.1%}')
+
+
+if __name__ == '__main__':
+    main()
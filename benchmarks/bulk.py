@@ -0,0 +1,110 @@
+"""
+Measure the throughput (rows/sec) of the bulk legacy conversion endpoint, and its peak memory use
+for different upload sizes.
+
+The app is driven with bare ASGI calls, because test clients keep the whole response in memory.
+
+Run from the top-level folder:
+
+    python -m benchmarks.bulk
+"""
+
+import asyncio
+import itertools
+import time
+import tracemalloc
+from collections.abc import AsyncIterator
+
+from vietnam_provinces.legacy import Ward as LegacyWard
+
+from api.main import app
+
+
+URL = '/api/v2/w/from-legacy/bulk/'
+# Rows are sent in chunks of this size, like a client uploading a big file.
+UPLOAD_CHUNK_ROWS = 1000
+
+
+def make_rows(by_name: bool, count: int) -> list[str]:
+    wards = itertools.cycle(LegacyWard.iter_all())
+    if by_name:
+        return [f'{i},,"{w.name}",{w.province_code}\n' for i, w in zip(range(count), wards)]
+    return [f'{i},{w.code},,\n' for i, w in zip(range(count), wards)]
+
+
+async def upload(rows: list[str], repeat: int) -> AsyncIterator[bytes]:
+    yield b'ref,legacy_code,legacy_name,legacy_province_code\n'
+    for _r in range(repeat):
+        for start in range(0, len(rows), UPLOAD_CHUNK_ROWS):
+            yield ''.join(rows[start : start + UPLOAD_CHUNK_ROWS]).encode()
+
+
+async def call_app(rows: list[str], repeat: int) -> int:
+    """Upload the rows and return number of response lines."""
+    chunks = upload(rows, repeat)
+    lines = 0
+
+    async def receive():
+        try:
+            body = await anext(chunks)
+        except StopAsyncIteration:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        return {'type': 'http.request', 'body': body, 'more_body': True}
+
+    async def send(message):
+        nonlocal lines
+        if message['type'] == 'http.response.start':
+            assert message['status'] == 200, message
+        elif message['type'] == 'http.response.body':
+            lines += message.get('body', b'').count(b'\n')
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': URL,
+        'raw_path': URL.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'bench'), (b'content-type', b'text/csv')],
+        'client': ('127.0.0.1', 1234),
+        'server': ('bench', 80),
+    }
+    await app(scope, receive, send)
+    return lines
+
+
+async def run(rows: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    lines = await call_app(rows, repeat)
+    elapsed = time.perf_counter() - start
+    # Excluding the header
+    assert lines - 1 == len(rows) * repeat, lines
+    return len(rows) * repeat / elapsed
+
+
+async def peak_memory(rows: list[str], repeat: int) -> int:
+    """Peak traced memory during the conversion, in KiB. It is measured separately, because tracing is slow."""
+    tracemalloc.start()
+    await call_app(rows, repeat)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak // 1024
+
+
+async def main():
+    print(f'{"Input":<8} {"rows":>8} {"rows/sec":>10} {"peak (KiB)":>11}')
+    for label, by_name, count in (('code', False, 10_000), ('name', True, 2_000)):
+        rows = make_rows(by_name, count)
+        # Warm up the lazy loaded data
+        await run(rows[:10], 1)
+        for repeat in (1, 10):
+            rate = await run(rows, repeat)
+            peak = await peak_memory(rows, repeat)
+            print(f'{label:<8} {count * repeat:>8} {rate:>10.0f} {peak:>11}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
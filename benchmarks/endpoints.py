@@ -0,0 +1,176 @@
+"""
+Benchmark the API endpoints in-process, through the same `httpx.ASGITransport` as the tests.
+
+For each endpoint, report throughput, p50/p95/p99 latency and peak allocations (traced by tracemalloc).
+Results can be saved as a JSON baseline, and compared with a previous baseline, failing (exit status 1)
+when p50 latency or peak allocations grow beyond the threshold.
+The response cache stores nothing during the run, so that repeated requests with the same query measure
+the handlers, not cache hits (unless --response-cache is given).
+
+Run from the top-level folder:
+
+    python -m benchmarks.endpoints --save .benchmarks/endpoints.json
+    # After some changes
+    python -m benchmarks.endpoints --baseline .benchmarks/endpoints.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from httpx import ASGITransport, AsyncClient
+from vietnam_provinces import __data_version__
+
+from api.main import app, response_cache
+
+
+class Endpoint(NamedTuple):
+    name: str
+    url: str
+    params: dict[str, Any] = {}
+
+
+ENDPOINTS = (
+    # Trees
+    Endpoint('v1 tree depth=1', '/api/v1/', {'depth': 1}),
+    Endpoint('v1 tree depth=2', '/api/v1/', {'depth': 2}),
+    Endpoint('v1 tree depth=3', '/api/v1/', {'depth': 3}),
+    Endpoint('v2 tree depth=1', '/api/v2/', {'depth': 1}),
+    Endpoint('v2 tree depth=2', '/api/v2/', {'depth': 2}),
+    # Single lookups
+    Endpoint('v1 province', '/api/v1/p/1'),
+    Endpoint('v1 province depth=3', '/api/v1/p/1', {'depth': 3}),
+    Endpoint('v1 district', '/api/v1/d/1'),
+    Endpoint('v1 ward', '/api/v1/w/1'),
+    Endpoint('v2 province', '/api/v2/p/1'),
+    Endpoint('v2 province depth=2', '/api/v2/p/1', {'depth': 2}),
+    Endpoint('v2 ward', '/api/v2/w/4'),
+    # Searches
+    Endpoint('v1 search ward short', '/api/v1/w/search/', {'q': 'an'}),
+    Endpoint('v1 search ward long', '/api/v1/w/search/', {'q': 'Phường Phúc Xá'}),
+    Endpoint('v1 search district', '/api/v1/d/search/', {'q': 'ba dinh'}),
+    Endpoint('v2 search province', '/api/v2/p/', {'search': 'ha'}),
+    Endpoint('v2 search ward short', '/api/v2/w/', {'search': 'an'}),
+    Endpoint('v2 search ward long', '/api/v2/w/', {'search': 'xã tân hòa'}),
+    Endpoint('v1 fuzzy search ward', '/api/v1/w/search/', {'q': 'tan hoa', 'fuzzy': True}),
+    Endpoint('v2 fuzzy search ward', '/api/v2/w/', {'search': 'thu dc', 'fuzzy': True}),
+    Endpoint('v1 suggest ward', '/api/v1/w/suggest/', {'q': 'ph'}),
+    Endpoint('v2 suggest ward', '/api/v2/w/suggest/', {'q': 'phu h'}),
+    # Address parsing
+    Endpoint('v1 parse address', '/api/v1/address/', {'text': 'P. Bến Nghé, Q.1, TP HCM'}),
+    Endpoint('v2 parse address', '/api/v2/address/', {'text': 'Xã Ea Wer, Đắk Lắk'}),
+    # Legacy mapping
+    Endpoint('v2 from legacy code', '/api/v2/w/from-legacy/', {'legacy_code': 1}),
+    Endpoint('v2 from legacy name', '/api/v2/w/from-legacy/', {'legacy_name': 'Ba Đình'}),
+    Endpoint('v2 to legacies', '/api/v2/w/4/to-legacies/'),
+    Endpoint('v2 changes since current', '/api/v2/changes/', {'since': __data_version__}),
+    # Full lists
+    Endpoint('v1 provinces', '/api/v1/p/'),
+    Endpoint('v1 districts', '/api/v1/d/'),
+    Endpoint('v1 wards', '/api/v1/w/'),
+    Endpoint('v2 provinces', '/api/v2/p/'),
+    Endpoint('v2 wards', '/api/v2/w/'),
+    # Exports
+    Endpoint('v1 export tree msgpack', '/api/v1/export/', {'format': 'msgpack'}),
+    Endpoint('v2 export tree msgpack', '/api/v2/export/', {'format': 'msgpack'}),
+)
+# Number of requests to trace for peak allocations. Tracing is slow, so we don't trace the timed requests.
+TRACED_REQUESTS = 3
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+async def run_endpoint(client: AsyncClient, endpoint: Endpoint, rounds: int) -> dict[str, float]:
+    # Warm up: build indexes and snapshots
+    res = await client.get(endpoint.url, params=endpoint.params)
+    res.raise_for_status()
+    latencies = []
+    start = time.perf_counter()
+    for _i in range(rounds):
+        t = time.perf_counter()
+        await client.get(endpoint.url, params=endpoint.params)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for _i in range(TRACED_REQUESTS):
+        await client.get(endpoint.url, params=endpoint.params)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        'rps': rounds / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_kib': peak / 1024,
+        'size_kib': len(res.content) / 1024,
+    }
+
+
+def find_regressions(
+    results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float
+) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if (base := baseline.get(name)) is None:
+            continue
+        for key in ('p50_ms', 'peak_kib'):
+            if result[key] > base[key] * (1 + threshold):
+                regressions.append(f'{name}: {key} {base[key]:.2f} -> {result[key]:.2f}')
+    return regressions
+
+
+async def run(rounds: int, only: str, use_response_cache: bool) -> dict[str, dict[str, float]]:
+    results = {}
+    if not use_response_cache:
+        # Every response is too big to be stored
+        response_cache.max_entry_bytes = -1
+        response_cache.clear()
+    print(f'{"Endpoint":<24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"peak KiB":>9} {"size KiB":>9}')
+    # Accept-Encoding is set, like most clients, so that compressed variants are measured.
+    headers = {'Accept-Encoding': 'gzip, br'}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://bench', headers=headers) as client:
+        for endpoint in ENDPOINTS:
+            if only not in endpoint.name:
+                continue
+            r = results[endpoint.name] = await run_endpoint(client, endpoint, rounds)
+            print(
+                f'{endpoint.name:<24} {r["rps"]:>8.0f} {r["p50_ms"]:>8.2f} {r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f}'
+                f' {r["peak_kib"]:>9.0f} {r["size_kib"]:>9.0f}'
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200, help='Number of timed requests per endpoint')
+    parser.add_argument('--only', default='', help='Only run endpoints whose name contains this')
+    parser.add_argument('--save', type=Path, help='Save results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='Compare with results saved in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed growth, 0.25 means 25%%')
+    parser.add_argument('--response-cache', action='store_true', help='Serve repeated queries from response cache')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.rounds, args.only, args.response_cache))
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2))
+        print(f'Saved to {args.save}')
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print(f'Regressions beyond {args.threshold:.0%}:', *regressions, sep='\n  ')
+            sys.exit(1)
+        print(f'No regression beyond {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare the precomputed tables in `api.legacy_map` with vietnam_provinces `Ward.search_from_legacy()`
+and `Ward.get_legacy_sources()`, which walk the conversion table on each call.
+
+Run from the top-level folder:
+
+    python -m benchmarks.legacy_map
+"""
+
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from vietnam_provinces import Ward, WardCode
+
+from api.legacy_map import LegacyWardMap
+from api.records_v2 import LegacyWardRecord, WardRecord, WardWithLegacySourceRecord
+
+
+NAMES = ('Ba Đình', 'phu my', 'Phường 1', 'Xã Tân Hải', 'hiep binh')
+LEGACY_CODES = (1, 4, 22855, 26740, 26890)
+NEW_CODES = (4, 8, 25, 22861, 26560)
+
+
+def measure(func: Callable[[], object], rounds: int) -> float:
+    """Return average time per call, in microseconds."""
+    start = time.perf_counter()
+    for _i in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    start = time.perf_counter()
+    ward_map = LegacyWardMap()
+    build_ms = (time.perf_counter() - start) * 1000
+    # The data of vietnam_provinces is loaded now, so we only trace the memory of our tables.
+    tracemalloc.start()
+    _tables = LegacyWardMap()
+    size_kib = tracemalloc.get_traced_memory()[0] // 1024
+    tracemalloc.stop()
+    print(f'Build: {build_ms:.0f} ms, {size_kib} KiB')
+
+    # What the endpoints did before: call the library, then copy into response records
+    def library_by_name():
+        for n in NAMES:
+            tuple(
+                WardWithLegacySourceRecord(r.source_code, WardRecord.from_ward(r.ward))
+                for r in Ward.search_from_legacy(n)
+            )
+
+    def library_by_code():
+        for c in LEGACY_CODES:
+            tuple(
+                WardWithLegacySourceRecord(r.source_code, WardRecord.from_ward(r.ward))
+                for r in Ward.search_from_legacy(code=c)
+            )
+
+    def library_to_legacies():
+        for c in NEW_CODES:
+            tuple(LegacyWardRecord.from_legacy_ward(w) for w in Ward.from_code(WardCode(c)).get_legacy_sources())
+
+    cases = (
+        ('by name', library_by_name, lambda: [ward_map.search(name=n) for n in NAMES], len(NAMES)),
+        ('by code', library_by_code, lambda: [ward_map.search(code=c) for c in LEGACY_CODES], len(LEGACY_CODES)),
+        ('to legacies', library_to_legacies, lambda: [ward_map.to_legacies(c) for c in NEW_CODES], len(NEW_CODES)),
+    )
+    print(f'{"Lookup":<12} {"library (µs)":>14} {"table (µs)":>12} {"speedup":>8}')
+    for label, library, table, count in cases:
+        library_us = measure(library, 3) / count
+        table_us = measure(table, 1000) / count
+        print(f'{label:<12} {library_us:>14.1f} {table_us:>12.2f} {library_us / table_us:>7.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure the overhead of the metrics middleware, by calling the v2 app with and without it.
+
+Run from the top-level folder:
+
+    python -m benchmarks.metrics
+"""
+
+import asyncio
+import time
+
+from starlette.types import ASGIApp
+
+from api.metrics import Metrics, MetricsMiddleware
+from api.v2 import api_v2
+
+
+PATHS = (('/w/4', b''), ('/w/', b'search=an'), ('/p/', b''))
+ROUNDS = 2000
+
+
+async def call(app: ASGIApp, path: str, query: bytes):
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0', 'spec_version': '2.4'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query,
+        'headers': [(b'host', b'bench')],
+        'client': ('127.0.0.1', 1234),
+        'server': ('bench', 80),
+    }
+    await app(scope, receive, send)
+
+
+async def measure(app: ASGIApp, path: str, query: bytes) -> float:
+    """Return average time per request, in microseconds."""
+    await call(app, path, query)
+    start = time.perf_counter()
+    for _i in range(ROUNDS):
+        await call(app, path, query)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+async def main():
+    with_metrics = MetricsMiddleware(api_v2, Metrics())
+    print(f'{"Request":<16} {"bare (µs)":>10} {"metrics (µs)":>13} {"overhead (µs)":>14}')
+    for path, query in PATHS:
+        bare = await measure(api_v2, path, query)
+        measured = await measure(with_metrics, path, query)
+        label = f'{path}?{query.decode()}' if query else path
+        print(f'{label:<16} {bare:>10.1f} {measured:>13.1f} {measured - bare:>14.1f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
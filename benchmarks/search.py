@@ -0,0 +1,59 @@
+"""
+Compare the search index in `api.search` with the linear scan of vietnam_provinces `search()` methods.
+
+Run from the top-level folder:
+
+    python -m benchmarks.search
+"""
+
+import time
+from collections.abc import Callable
+
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.legacy import District as LegacyDistrict
+from vietnam_provinces.legacy import Province as LegacyProvince
+from vietnam_provinces.legacy import Ward as LegacyWard
+
+from api.search import (
+    legacy_district_index,
+    legacy_province_index,
+    legacy_ward_index,
+    province_index,
+    ward_index,
+)
+
+
+QUERIES = ('Hà Nội', 'hien hoa', 'Hiền Hòa', 'Phúc Xá', 'ba dinh', 'an', 'Tân Hòa', 'phuong 1', 'thu duc', 'Bà Rịa')
+
+
+def measure(func: Callable[[str], object], rounds: int) -> float:
+    """Return average time per query, in microseconds."""
+    start = time.perf_counter()
+    for _i in range(rounds):
+        for q in QUERIES:
+            func(q)
+    return (time.perf_counter() - start) / (rounds * len(QUERIES)) * 1e6
+
+
+def main():
+    cases = (
+        ('Province', Province.search, province_index),
+        ('Ward', Ward.search, ward_index),
+        ('legacy Province', LegacyProvince.search, legacy_province_index),
+        ('legacy District', LegacyDistrict.search, legacy_district_index),
+        ('legacy Ward', LegacyWard.search, legacy_ward_index),
+    )
+    print(f'{"Dataset":<16} {"build (ms)":>10} {"library (µs)":>14} {"index (µs)":>12} {"speedup":>8}')
+    for label, library_search, get_index in cases:
+        start = time.perf_counter()
+        index = get_index()
+        build_ms = (time.perf_counter() - start) * 1000
+        for q in QUERIES:
+            assert index.search(q) == library_search(q), q
+        library_us = measure(library_search, 1)
+        index_us = measure(index.search, 100)
+        print(f'{label:<16} {build_ms:>10.1f} {library_us:>14.1f} {index_us:>12.1f} {library_us / index_us:>7.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure cold start: import time of the app (with `python -X importtime`) and time to the first responses,
+each in a fresh Python process.
+
+"eager" imports the v1 app (and the legacy dataset) together with the main app, like before it was lazily loaded.
+
+Run from the top-level folder:
+
+    python -m benchmarks.startup
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+
+FIRST_RESPONSES_SCRIPT = """
+import asyncio, sys, time
+start = time.perf_counter()
+from httpx import ASGITransport, AsyncClient
+from api.main import app
+{extra_import}
+imported = time.perf_counter()
+
+async def main():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://bench') as client:
+        (await client.get('/api/v2/p/1')).raise_for_status()
+        v2 = time.perf_counter()
+        (await client.get('/api/v1/p/1')).raise_for_status()
+        v1 = time.perf_counter()
+    print(imported - start, v2 - start, v1 - start)
+
+asyncio.run(main())
+"""
+
+
+def import_time(module_list: str) -> tuple[float, dict[str, float]]:
+    """Return cumulative import time (seconds) of the modules, and of the biggest imported packages."""
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_list}'], capture_output=True, text=True, check=True
+    )
+    cumulative: dict[str, float] = {}
+    for line in res.stderr.splitlines():
+        if m := re.match(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)', line):
+            # Only top-level and second-level entries, to keep the report short
+            if len(m[2]) <= 3:
+                cumulative[m[3]] = int(m[1]) / 1e6
+    total = sum(cumulative[name] for name in module_list.split(', '))
+    return total, cumulative
+
+
+def first_responses(eager: bool) -> list[float]:
+    script = FIRST_RESPONSES_SCRIPT.format(extra_import='import api.v1' if eager else '')
+    res = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return [float(v) for v in res.stdout.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5, help='Number of processes to start for each case')
+    args = parser.parse_args()
+
+    print(f'{"Case":<8} {"import ms":>10} {"1st v2 ms":>10} {"1st v1 ms":>10}')
+    for case, modules in (('lazy', 'api.main'), ('eager', 'api.main, api.v1')):
+        imports = [import_time(modules)[0] for _i in range(args.rounds)]
+        timings = [first_responses(case == 'eager') for _i in range(args.rounds)]
+        print(
+            f'{case:<8} {statistics.median(imports) * 1000:>10.0f}',
+            *(f'{statistics.median(t[i] for t in timings) * 1000:>10.0f}' for i in (1, 2)),
+        )
+    _total, cumulative = import_time('api.main')
+    print('\nBiggest imports of api.main (ms):')
+    for name, seconds in sorted(cumulative.items(), key=lambda x: x[1], reverse=True)[:10]:
+        print(f'  {name:<40} {seconds * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare the ward tables of `api.store`, with records as objects (default) and as compact columns,
+and the vietnam_provinces objects, which the handlers used before.
+
+Run from the top-level folder:
+
+    python -m benchmarks.store
+"""
+
+import time
+import tracemalloc
+from collections.abc import Callable
+from operator import attrgetter
+
+from vietnam_provinces.legacy import DistrictCode as LegacyDistrictCode
+from vietnam_provinces.legacy import Ward as LegacyWard
+from vietnam_provinces.legacy import WardCode as LegacyWardCode
+
+from api.records_v1 import WardRecord
+from api.store import DivisionTable
+
+
+CODES = (1, 4, 26734, 26740, 31117)
+DISTRICTS = tuple(LegacyDistrictCode(c) for c in (1, 760, 769, 916))
+
+
+def measure(func: Callable[[], object], rounds: int) -> float:
+    """Return average time per call, in microseconds."""
+    start = time.perf_counter()
+    for _i in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def build(compact: bool) -> tuple[DivisionTable, int]:
+    """Build the table of legacy wards, return it with its size in KiB."""
+    tracemalloc.start()
+    table = DivisionTable(LegacyWard.iter_all(), WardRecord.from_ward, ('district_code', 'province_code'), compact)
+    size_kib = tracemalloc.get_traced_memory()[0] // 1024
+    tracemalloc.stop()
+    return table, size_kib
+
+
+def main():
+    # Load the data of vietnam_provinces first, so that we only trace the memory of our tables.
+    all_wards = tuple(LegacyWard.iter_all())
+    tracemalloc.start()
+    library_records = tuple(WardRecord.from_ward(w) for w in all_wards)
+    records_kib = tracemalloc.get_traced_memory()[0] // 1024
+    tracemalloc.stop()
+    del library_records
+    tables = {'objects': build(False), 'compact': build(True)}
+    print(f'{len(all_wards)} legacy wards. Only their records, as objects: {records_kib} KiB')
+    for label, (_table, size_kib) in tables.items():
+        print(f'Table with {label}: {size_kib} KiB')
+
+    # What the handlers did before: look up or sort the library objects, then copy into response records
+    def library_get():
+        for c in CODES:
+            WardRecord.from_ward(LegacyWard.from_code(LegacyWardCode(c)))
+
+    def library_children():
+        for d in DISTRICTS:
+            tuple(WardRecord.from_ward(w) for w in sorted(LegacyWard.iter_by_district(d), key=attrgetter('code')))
+
+    def library_page():
+        tuple(WardRecord.from_ward(w) for w in sorted(all_wards, key=attrgetter('code'))[5000:5100])
+
+    cases: list[tuple[str, Callable[[DivisionTable], Callable[[], object]], Callable[[], object], int]] = [
+        ('get', lambda t: lambda: [t.get(c) for c in CODES], library_get, len(CODES)),
+        ('children', lambda t: lambda: [t.children('district_code', d) for d in DISTRICTS], library_children, 4),
+        ('page of 100', lambda t: lambda: t.records[5000:5100], library_page, 1),
+    ]
+    print(f'{"Per lookup":<12} {"library (µs)":>14} {"objects (µs)":>14} {"compact (µs)":>14}')
+    for label, make_case, library, count in cases:
+        library_us = measure(library, 20) / count
+        objects_us, compact_us = (measure(make_case(t), 2000) / count for t, _s in tables.values())
+        print(f'{label:<12} {library_us:>14.2f} {objects_us:>14.2f} {compact_us:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
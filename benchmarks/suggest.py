@@ -0,0 +1,55 @@
+"""
+Measure the autocomplete index in `api.suggest`, by typing names one keystroke at a time,
+compared with running the (unranked) search on each keystroke.
+
+Run from the top-level folder:
+
+    python -m benchmarks.suggest
+"""
+
+import statistics
+import time
+
+from api.search import legacy_ward_index, ward_index
+from api.suggest import legacy_ward_suggest_index, ward_suggest_index
+
+
+TYPED = ('Phường Phúc Xá', 'phu h', 'tan hoa', 'an', 'Ba Đình', 'xa t', 'Hòa Bình')
+
+
+def keystrokes() -> list[str]:
+    return [text[:n] for text in TYPED for n in range(1, len(text) + 1)]
+
+
+def measure(func, queries: list[str], rounds: int) -> tuple[float, float]:
+    """Return median and max time per query, in microseconds."""
+    timings = []
+    for _i in range(rounds):
+        for q in queries:
+            start = time.perf_counter()
+            func(q)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6, max(timings) * 1e6
+
+
+def main():
+    queries = keystrokes()
+    cases = (
+        ('Ward', ward_suggest_index, ward_index, {}),
+        ('Ward in province', ward_suggest_index, ward_index, {'province_code': 1}),
+        ('legacy Ward', legacy_ward_suggest_index, legacy_ward_index, {}),
+        ('legacy Ward in district', legacy_ward_suggest_index, legacy_ward_index, {'district_code': 1}),
+    )
+    print(f'{"Dataset":<24} {"build (ms)":>10} {"suggest p50/max (µs)":>22} {"search p50/max (µs)":>22}')
+    for label, get_suggest_index, get_search_index, scope in cases:
+        start = time.perf_counter()
+        suggest_index = get_suggest_index()
+        build_ms = (time.perf_counter() - start) * 1000
+        search_index = get_search_index()
+        s50, smax = measure(lambda q: suggest_index.suggest(q, **scope), queries, 50)
+        f50, fmax = measure(lambda q: search_index.search(q, **scope), queries, 2)
+        print(f'{label:<24} {build_ms:>10.1f} {s50:>11.1f} / {smax:>8.1f} {f50:>11.1f} / {fmax:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
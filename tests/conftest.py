@@ -0,0 +1,9 @@
+import pytest
+
+from api.main import response_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Tests which patch the app state must not get responses cached by earlier tests.
+    response_cache.clear()
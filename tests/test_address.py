@@ -0,0 +1,71 @@
+import pytest
+
+from api.address import TokenAutomaton, address_parser, legacy_address_parser
+
+
+def test_automaton_finds_all_patterns():
+    patterns = (('a',), ('a', 'b'), ('b', 'c'), ('a', 'b', 'c', 'd'), ('c',))
+    automaton = TokenAutomaton(patterns)
+    words = ['x', 'a', 'b', 'c', 'a', 'b', 'c', 'd']
+    expected = {
+        (i, i + len(p), pid)
+        for pid, p in enumerate(patterns)
+        for i in range(len(words))
+        if tuple(words[i : i + len(p)]) == p
+    }
+    found = list(automaton.iter_matches(words))
+    assert len(found) == len(expected)
+    assert set(found) == expected
+
+
+@pytest.mark.parametrize(
+    ('text', 'names', 'matched'),
+    (
+        (
+            'P. Bến Nghé, Q.1, TP HCM',
+            ('Thành phố Hồ Chí Minh', 'Quận 1', 'Phường Bến Nghé'),
+            ('TP HCM', 'Q.1', 'P. Bến Nghé'),
+        ),
+        (
+            '12 Nguyễn Văn Bảo, P.5, Q. Gò Vấp, Sài Gòn',
+            ('Thành phố Hồ Chí Minh', 'Quận Gò Vấp', 'Phường 5'),
+            ('Sài Gòn', 'Q. Gò Vấp', 'P.5'),
+        ),
+        (
+            'thon 3, xa ea wer, buon don, dak lak',
+            ('Tỉnh Đắk Lắk', 'Huyện Buôn Đôn', 'Xã Ea Wer'),
+            ('dak lak', 'buon don', 'xa ea wer'),
+        ),
+        # The province is deduced from the district
+        ('Quận Ba Đình', ('Thành phố Hà Nội', 'Quận Ba Đình', None), (None, 'Quận Ba Đình', None)),
+    ),
+)
+def test_parse_legacy(text, names, matched):
+    result = legacy_address_parser().parse(text)
+    assert tuple(d.name if d else None for d in result.divisions) == names
+    assert result.matched == matched
+    assert not result.ambiguous
+
+
+def test_parse_ambiguous():
+    result = legacy_address_parser().parse('Phường 1')
+    assert result.divisions[2].name == 'Phường 1'
+    assert result.ambiguous
+    result = legacy_address_parser().parse('Phường 1, Quận 3, TP.HCM')
+    assert (result.divisions[1].name, result.divisions[2].name) == ('Quận 3', 'Phường 1')
+    assert not result.ambiguous
+
+
+def test_parse_not_found():
+    result = address_parser().parse('123 Main Street, Springfield')
+    assert result.divisions == (None, None)
+    assert result.score == 0
+
+
+def test_parse():
+    result = address_parser().parse('Số 1 Tràng Tiền, phuong hoan kiem, ha noi')
+    assert tuple(d.name for d in result.divisions) == ('Thành phố Hà Nội', 'Phường Hoàn Kiếm')
+    assert result.matched == ('ha noi', 'phuong hoan kiem')
+    result = address_parser().parse('Xã Ea Wer, Đắk Lắk')
+    assert tuple(d.code for d in result.divisions) == (66, result.divisions[1].code)
+    assert result.divisions[1].parents == (66,)
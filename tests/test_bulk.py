@@ -0,0 +1,38 @@
+import pytest
+
+from api.bulk import MAX_LINE_SIZE, iter_line_batches
+
+
+async def _collect(chunks: list[bytes]) -> list[bytes | None]:
+    async def gen():
+        for c in chunks:
+            yield c
+
+    return [line async for batch in iter_line_batches(gen()) for line in batch]
+
+
+@pytest.mark.asyncio
+async def test_lines_across_chunks():
+    assert await _collect([b'a,1\nb,', b'2\n', b'c', b',3']) == [b'a,1', b'b,2', b'c,3']
+    assert await _collect([b'a\n\n', b'b\n']) == [b'a', b'', b'b']
+
+
+@pytest.mark.asyncio
+async def test_long_line_is_dropped():
+    long_part = b'x' * (MAX_LINE_SIZE // 2 + 1)
+    lines = await _collect([b'a\n' + long_part, long_part, long_part + b'\nb\n', long_part * 3])
+    assert lines == [b'a', None, b'b', None]
+
+
+@pytest.mark.asyncio
+async def test_long_line_across_two_chunks_is_dropped():
+    # Each part is under the limit, only the whole line is over it
+    half = b'x' * (MAX_LINE_SIZE // 2 + 1)
+    lines = await _collect([b'a\n' + half, half + b'\nb\n'])
+    assert lines == [b'a', None, b'b']
+
+
+@pytest.mark.asyncio
+async def test_long_line_inside_one_chunk_is_dropped():
+    lines = await _collect([b'a\n' + b'x' * (MAX_LINE_SIZE + 1) + b'\nb\n'])
+    assert lines == [b'a', None, b'b']
@@ -0,0 +1,89 @@
+from http import HTTPStatus
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api import compiled
+from api.compiled import load_compiled, write_compiled
+from api.main import app
+from api.snapshots import clear_snapshots, iter_snapshots
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+@pytest.fixture
+def no_snapshots():
+    clear_snapshots()
+    yield
+    clear_snapshots()
+
+
+def test_write_load(tmp_path, no_snapshots):
+    path = tmp_path / 'snapshots.bin'
+    assert write_compiled(path, [(('v2', 'tree', 1, 'identity'), b'[1]'), (('v2', 'tree', 1, 'gzip'), b'')]) == 2
+    assert load_compiled(path) == 2
+    snapshots = dict(iter_snapshots())
+    assert snapshots[('v2', 'tree', 1, 'identity')] == b'[1]'
+    assert isinstance(snapshots[('v2', 'tree', 1, 'identity')], memoryview)
+    assert snapshots[('v2', 'tree', 1, 'gzip')] == b''
+
+
+def test_ignore_other_version(tmp_path, monkeypatch, no_snapshots):
+    path = tmp_path / 'snapshots.bin'
+    monkeypatch.setattr(compiled, '__data_version__', '2025-06-30')
+    write_compiled(path, [(('v2', 'tree', 1, 'identity'), b'[1]')])
+    monkeypatch.undo()
+    assert load_compiled(path) == 0
+    assert not dict(iter_snapshots())
+
+
+def test_ignore_other_app_version(tmp_path, monkeypatch, no_snapshots):
+    path = tmp_path / 'snapshots.bin'
+    monkeypatch.setattr(compiled, '__version__', '0.0.1')
+    write_compiled(path, [(('v2', 'tree', 1, 'identity'), b'[1]')])
+    monkeypatch.undo()
+    assert load_compiled(path) == 0
+    assert not dict(iter_snapshots())
+
+
+def test_ignore_invalid_file(tmp_path, no_snapshots):
+    path = tmp_path / 'snapshots.bin'
+    assert load_compiled(path) == 0
+    path.write_bytes(b'')
+    assert load_compiled(path) == 0
+    path.write_bytes(b'{"data_version": "2026-02-21"}')
+    assert load_compiled(path) == 0
+    path.write_bytes(compiled.MAGIC)
+    assert load_compiled(path) == 0
+    header = b'{"data_version": '
+    path.write_bytes(compiled.MAGIC + compiled.HEADER_SIZE.pack(len(header)) + header)
+    assert load_compiled(path) == 0
+
+
+def test_ignore_truncated_file(tmp_path, no_snapshots):
+    path = tmp_path / 'snapshots.bin'
+    write_compiled(path, [(('v2', 'tree', 1, 'identity'), b'[1]'), (('v2', 'tree', 2, 'identity'), b'[2]')])
+    path.write_bytes(path.read_bytes()[:-1])
+    assert load_compiled(path) == 0
+    assert not dict(iter_snapshots())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+async def test_serve_compiled(async_client, tmp_path, no_snapshots, encoding):
+    headers = {'Accept-Encoding': encoding}
+    built = await async_client.get('/api/v2/', headers=headers)
+    path = tmp_path / 'snapshots.bin'
+    write_compiled(path, iter_snapshots())
+    clear_snapshots()
+    assert load_compiled(path)
+    res = await async_client.get('/api/v2/', headers=headers)
+    assert res.status_code == HTTPStatus.OK
+    assert res.content == built.content
+    assert res.headers.get('content-encoding') == built.headers.get('content-encoding')
+    assert all(isinstance(c, memoryview) for _k, c in iter_snapshots())
@@ -0,0 +1,62 @@
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from pydantic import TypeAdapter
+
+from api import schema_v1, schema_v2
+from api.encoders import EncoderName, get_encoder
+from api.main import app, response_cache
+from api.snapshots import clear_snapshots
+from api.v1 import api_v1
+from api.v2 import api_v2
+
+
+# The fast path (msgspec) must produce output which conforms to the published schemas,
+# and is the same as what Pydantic produces.
+CASES = (
+    ('/api/v1/?depth=3', list[schema_v1.ProvinceResponse]),
+    ('/api/v1/p/1', schema_v1.ProvinceResponse),
+    ('/api/v1/d/1?depth=2', schema_v1.District),
+    ('/api/v1/w/', list[schema_v1.Ward]),
+    ('/api/v1/w/search/?q=an', list[schema_v1.SearchResult]),
+    ('/api/v2/', tuple[schema_v2.ProvinceResponse, ...]),
+    ('/api/v2/?depth=2&limit=3', tuple[schema_v2.NestedProvince, ...]),
+    ('/api/v2/p/1?depth=2', schema_v2.ProvinceResponse),
+    ('/api/v2/w/?search=an', tuple[schema_v2.WardResponse, ...]),
+    ('/api/v2/w/4', schema_v2.WardResponse),
+    ('/api/v2/w/4/to-legacies/', tuple[schema_v2.LegacyWardResponse, ...]),
+    ('/api/v2/w/from-legacy/?legacy_name=ba dinh', tuple[schema_v2.WardWithLegacySource, ...]),
+)
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+async def fetch_with(async_client, encoder: EncoderName, url: str) -> bytes:
+    api_v1.state.encoder = api_v2.state.encoder = get_encoder(encoder)
+    clear_snapshots()
+    response_cache.clear()
+    res = await async_client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    return res.content
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(('url', 'schema'), CASES)
+async def test_msgspec_conforms_to_schema(async_client, url, schema: type[Any]):
+    original = api_v1.state.encoder, api_v2.state.encoder
+    try:
+        fast = await fetch_with(async_client, EncoderName.MSGSPEC, url)
+        validated = await fetch_with(async_client, EncoderName.PYDANTIC, url)
+    finally:
+        api_v1.state.encoder, api_v2.state.encoder = original
+        clear_snapshots()
+    adapter = TypeAdapter(schema)
+    assert adapter.dump_json(adapter.validate_json(fast)) == fast
+    assert fast == validated
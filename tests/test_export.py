@@ -0,0 +1,88 @@
+import io
+from http import HTTPStatus
+
+import msgspec
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api.export import ExportFormat, negotiate_format
+from api.main import app
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+def test_negotiate_format():
+    assert negotiate_format('') == ExportFormat.JSON
+    assert negotiate_format('*/*') == ExportFormat.JSON
+    assert negotiate_format('application/x-msgpack') == ExportFormat.MSGPACK
+    assert negotiate_format('application/json;q=0.5, application/vnd.msgpack') == ExportFormat.MSGPACK
+    assert negotiate_format('text/html') == ExportFormat.JSON
+
+
+def decode(content: bytes, fmt: str):
+    if fmt == 'msgpack':
+        return msgspec.msgpack.decode(content)
+    cbor2 = pytest.importorskip('cbor2')
+    return cbor2.loads(content)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('fmt', ('msgpack', 'cbor'))
+@pytest.mark.parametrize(
+    ('url', 'json_url'), (('/api/v1/export/', '/api/v1/?depth=3'), ('/api/v2/export/ward', '/api/v2/w/'))
+)
+async def test_row_formats_round_trip(async_client, fmt, url, json_url):
+    expected = (await async_client.get(json_url)).json()
+    res = await async_client.get(url, params={'format': fmt})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert decode(res.content, fmt) == expected
+    # Same format, asked by Accept header
+    media_type = res.headers['content-type']
+    res = await async_client.get(url, headers={'Accept': media_type})
+    assert res.headers['content-type'] == media_type
+    assert 'Accept' in res.headers['vary']
+
+
+@pytest.mark.asyncio
+async def test_tree_round_trip(async_client):
+    expected = (await async_client.get('/api/v2/', params={'depth': 2})).json()
+    assert len(expected) == 34
+    assert all(p['wards'] for p in expected)
+    res = await async_client.get('/api/v2/export/', params={'format': 'json'})
+    assert res.json() == expected
+    res = await async_client.get('/api/v2/export/', headers={'Accept': 'application/msgpack'})
+    assert msgspec.msgpack.decode(res.content) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('fmt', ('arrow', 'parquet'))
+async def test_columnar_formats_round_trip(async_client, fmt):
+    pa = pytest.importorskip('pyarrow')
+    expected = (await async_client.get('/api/v1/d/')).json()
+    res = await async_client.get('/api/v1/export/district', params={'format': fmt})
+    assert res.status_code == HTTPStatus.OK, res.text
+    if fmt == 'arrow':
+        table = pa.ipc.open_file(pa.BufferReader(res.content)).read_all()
+    else:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(res.content))
+    assert table.column_names == ['name', 'code', 'division_type', 'codename', 'province_code']
+    assert table.to_pylist() == [{k: v for k, v in d.items() if k != 'wards'} for d in expected]
+    # Only one level per table
+    res = await async_client.get('/api/v1/export/', params={'format': fmt})
+    assert res.status_code == HTTPStatus.NOT_ACCEPTABLE
+
+
+@pytest.mark.asyncio
+async def test_etag_depends_on_format(async_client):
+    json_res = await async_client.get('/api/v2/export/ward')
+    msgpack_res = await async_client.get('/api/v2/export/ward', headers={'Accept': 'application/vnd.msgpack'})
+    assert json_res.headers['etag'] != msgpack_res.headers['etag']
+    res = await async_client.get('/api/v2/export/ward', headers={'If-None-Match': json_res.headers['etag']})
+    assert res.status_code == HTTPStatus.NOT_MODIFIED
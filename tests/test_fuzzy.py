@@ -0,0 +1,68 @@
+import pytest
+
+from api.fuzzy import (
+    MAX_FUZZY_RESULTS,
+    FuzzyIndex,
+    FuzzyParams,
+    _normalize,
+    fuzzy_province_index,
+    fuzzy_ward_index,
+    legacy_fuzzy_district_index,
+    legacy_fuzzy_ward_index,
+    pick_search,
+    ranking_limit,
+    trigrams,
+)
+from api.paging import ListParams
+from api.search import ward_index
+
+
+def brute_force(index: FuzzyIndex, name: str, min_score: float, **scope: int) -> list[int]:
+    query = trigrams(_normalize(name))
+    scored = []
+    for i, grams in enumerate(index.grams):
+        if any(int(getattr(index.records[i], attr)) != code for attr, code in scope.items()):
+            continue
+        score = 2 * len(query & grams) / (len(query) + len(grams)) if query else 0
+        if score >= min_score:
+            scored.append((-score, index.levels[i], i))
+    return [i for _s, _level, i in sorted(scored)]
+
+
+@pytest.mark.parametrize('get_index', (fuzzy_province_index, fuzzy_ward_index, legacy_fuzzy_ward_index))
+@pytest.mark.parametrize('query', ('thu dc', 'an', 'Tan Hoa', 'hoa binh', 'Ha Noi', 'x', ''))
+@pytest.mark.parametrize('min_score', (0.3, 0.5, 0.8, 1.0))
+def test_same_as_brute_force(get_index, query, min_score):
+    index = get_index()
+    results = index.scored_search(query, min_score, limit=100_000)
+    assert [index.records.index(r) for r, _s in results] == brute_force(index, query, min_score)
+    assert all(s >= min_score for _r, s in results)
+
+
+def test_scoped_same_as_brute_force():
+    index = legacy_fuzzy_ward_index()
+    results = index.search('phuc xa', 0.4, district_code=1)
+    assert [index.records.index(r) for r in results] == brute_force(index, 'phuc xa', 0.4, district_code=1)
+
+
+@pytest.mark.parametrize('query', ('Thu Duc', 'Thủ Đức', 'Thu Đuc', 'thu dc', 'Thủ Đứ'))
+def test_typos(query):
+    assert fuzzy_ward_index().search(query)[0].name == 'Phường Thủ Đức'
+    assert legacy_fuzzy_district_index().search(query, province_code=79)[0].name == 'Thành phố Thủ Đức'
+
+
+def test_limit():
+    results = fuzzy_ward_index().scored_search('an', 0.1, limit=5)
+    assert len(results) == 5
+    scores = [s for _r, s in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_ranking_limit():
+    assert ranking_limit(None) == MAX_FUZZY_RESULTS
+    assert ranking_limit(ListParams(10, 5, None, None)) == 15
+    assert ranking_limit(ListParams(MAX_FUZZY_RESULTS, 5, None, None)) == MAX_FUZZY_RESULTS
+    # The position of the cursor in the results is not known in advance
+    assert ranking_limit(ListParams(10, 0, 1, None)) == MAX_FUZZY_RESULTS
+    search = pick_search(ward_index, fuzzy_ward_index, FuzzyParams(True, 0.1), ListParams(3, 0, None, None))
+    assert len(search('an')) == 3
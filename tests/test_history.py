@@ -0,0 +1,98 @@
+import gzip
+from http import HTTPStatus
+from typing import NamedTuple
+
+import msgspec
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api.history import DEFAULT_HISTORY_DIR, SUFFIX, DatasetHistory, DatasetSnapshot, current_snapshot, diff_records
+from api.main import app
+from api.v2 import api_v2
+
+
+OLD_VERSION = '2025-06-30'
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # An older version, in which a ward has another name, a ward doesn't exist yet and another one is removed later.
+    current = current_snapshot()
+    first, second, *others = current.wards
+    wards = (msgspec.structs.replace(first, name='Phường Cũ'), *others, msgspec.structs.replace(second, code=999999))
+    old = DatasetSnapshot(OLD_VERSION, current.provinces, wards)
+    (tmp_path / f'{OLD_VERSION}{SUFFIX}').write_bytes(gzip.compress(msgspec.json.encode(old)))
+    history = DatasetHistory(tmp_path)
+    monkeypatch.setattr(api_v2.state, 'dataset_history', history)
+    return history
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+class Item(NamedTuple):
+    code: int
+    name: str
+
+
+def test_diff_records():
+    old = [Item(1, 'A'), Item(2, 'B'), Item(4, 'D')]
+    new = [Item(2, 'B2'), Item(3, 'C'), Item(4, 'D')]
+    assert diff_records(old, new) == ((Item(3, 'C'),), (Item(2, 'B2'),), (1,))
+
+
+def test_delta(history):
+    current = current_snapshot()
+    assert history.versions() == (OLD_VERSION, current.data_version)
+    delta = history.delta(OLD_VERSION)
+    assert delta.data_version == current.data_version
+    assert delta.provinces.added == delta.provinces.changed == delta.provinces.removed == ()
+    assert delta.wards.added == (current.wards[1],)
+    assert delta.wards.changed == (current.wards[0],)
+    assert delta.wards.removed == (999999,)
+    assert history.delta('2000-01-01') is None
+
+
+def test_versions_listed_once(history, tmp_path):
+    versions = history.versions()
+    (tmp_path / f'2000-01-01{SUFFIX}').write_bytes(b'')
+    assert history.versions() == versions
+    assert history.load('2000-01-01') is None
+
+
+def test_shipped_history():
+    # The previous version is shipped, so that there is something to diff in a default deployment.
+    history = DatasetHistory(DEFAULT_HISTORY_DIR)
+    *older, current = history.versions()
+    assert current == current_snapshot().data_version
+    assert older
+    delta = history.delta(older[-1])
+    assert delta is not None
+    assert delta.wards.changed
+
+
+def test_save_current(tmp_path):
+    history = DatasetHistory(tmp_path)
+    path = history.save_current()
+    assert path.read_bytes() == history.save_current().read_bytes()
+    loaded = msgspec.json.decode(gzip.decompress(path.read_bytes()), type=DatasetSnapshot)
+    assert loaded == current_snapshot()
+
+
+@pytest.mark.asyncio
+async def test_changes_endpoint(history, async_client):
+    res = await async_client.get('/api/v2/changes/', params={'since': OLD_VERSION})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert data['since'] == OLD_VERSION
+    assert [w['code'] for w in data['wards']['changed']] == [current_snapshot().wards[0].code]
+    assert data['wards']['removed'] == [999999]
+    version = (await async_client.get('/api/v2/version')).json()['data_version']
+    res = await async_client.get('/api/v2/changes/', params={'since': version})
+    assert res.json()['wards'] == {'added': [], 'changed': [], 'removed': []}
+    res = await async_client.get('/api/v2/changes/', params={'since': '../../etc/passwd'})
+    assert res.status_code == HTTPStatus.NOT_FOUND
@@ -0,0 +1,124 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from api import main, v2
+from api.lazy import Lazy, LazyApp, LoadMode, LoadState
+from api.legacy_map import legacy_ward_map
+
+
+def test_main_does_not_import_legacy_dataset():
+    code = 'import sys, api.main; print("vietnam_provinces.legacy" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'False'
+
+
+def test_loading_v1_builds_legacy_indexes():
+    code = (
+        'import api.main; from api import address, search, store; api.main.lazy_api_v1.get(); '
+        'caches = (store.legacy_division_store, search.legacy_ward_index, address.legacy_address_parser); '
+        'print(all(c.cache_info().currsize for c in caches))'
+    )
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'True'
+
+
+@pytest.mark.asyncio
+async def test_lazy_app_loads_once():
+    calls = []
+    sub_app = FastAPI()
+
+    @sub_app.get('/')
+    def index():
+        return {'ok': True}
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return sub_app
+
+    lazy = Lazy('sub_app', load)
+    assert lazy.state == LoadState.PENDING
+    transport = ASGITransport(app=LazyApp(lazy))
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        responses = await asyncio.gather(*(client.get('/') for _i in range(5)))
+    assert all(r.status_code == HTTPStatus.OK for r in responses)
+    assert len(calls) == 1
+    assert lazy.state == LoadState.READY
+
+
+def test_lazy_failure_is_retried():
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('Boom')
+        return 'loaded'
+
+    lazy = Lazy('flaky', load)
+    with pytest.raises(RuntimeError):
+        lazy.get()
+    assert lazy.state == LoadState.FAILED
+    assert lazy.get() == 'loaded'
+    assert lazy.state == LoadState.READY
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_readiness_in_lazy_mode(async_client, monkeypatch):
+    monkeypatch.setattr(main.settings, 'legacy_loading', LoadMode.LAZY)
+    res = await async_client.get('/ready')
+    assert res.status_code == HTTPStatus.OK
+    data = res.json()
+    assert data['ready']
+    assert set(data['components']) == {'api_v1', 'legacy_ward_map'}
+    assert res.headers['cache-control'] == 'no-store'
+
+
+@pytest.mark.asyncio
+async def test_readiness_after_background_loading(async_client, monkeypatch):
+    monkeypatch.setattr(main.settings, 'legacy_loading', LoadMode.BACKGROUND)
+    # The transport doesn't run the app lifespan, which starts the loading.
+    async with main.lifespan(main.app):
+        for _i in range(200):
+            res = await async_client.get('/ready')
+            if res.status_code == HTTPStatus.OK:
+                break
+            assert res.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+            await asyncio.sleep(0.1)
+        assert res.status_code == HTTPStatus.OK
+        assert res.json()['components'] == {'api_v1': 'ready', 'legacy_ward_map': 'ready'}
+    res = await async_client.get('/api/v1/p/1')
+    assert res.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_legacy_ward_map_loaded_off_event_loop(async_client, monkeypatch):
+    threads = []
+
+    def load():
+        threads.append(threading.get_ident())
+        return legacy_ward_map()
+
+    lazy = Lazy('legacy_ward_map', load)
+    monkeypatch.setattr(v2, 'lazy_legacy_ward_map', lazy)
+    res = await async_client.get('/api/v2/w/from-legacy/', params={'legacy_code': 1})
+    assert res.status_code == HTTPStatus.OK
+    res = await async_client.get('/api/v2/w/4/to-legacies/')
+    assert res.status_code == HTTPStatus.OK
+    assert lazy.state == LoadState.READY
+    assert threads and threading.get_ident() not in threads
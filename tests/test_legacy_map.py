@@ -0,0 +1,48 @@
+import pytest
+from vietnam_provinces import Ward
+from vietnam_provinces.legacy import Ward as LegacyWard
+
+from api.legacy_map import legacy_ward_map
+from api.records_v2 import LegacyWardRecord, WardRecord
+
+
+NAMES = ('Ba Đình', 'ba dinh', 'phu my', 'Phường 1', 'Xã Tân Hải', 'Thị trấn Phú Mỹ', 'xa', 'PHU MY', 'x y z', '')
+
+
+def _pairs(results) -> tuple:
+    return tuple(
+        (r.source_code, r.ward if isinstance(r.ward, WardRecord) else WardRecord.from_ward(r.ward)) for r in results
+    )
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_search_by_name_same_as_library(name):
+    assert _pairs(legacy_ward_map().search(name=name)) == _pairs(Ward.search_from_legacy(name=name))
+
+
+def test_search_by_code_same_as_library():
+    for w in LegacyWard.iter_all():
+        code = int(w.code)
+        assert _pairs(legacy_ward_map().search(code=code)) == _pairs(Ward.search_from_legacy(code=code))
+
+
+def test_to_legacies_same_as_library():
+    for w in Ward.iter_all():
+        expected = tuple(LegacyWardRecord.from_legacy_ward(x) for x in w.get_legacy_sources())
+        assert legacy_ward_map().to_legacies(int(w.code)) == expected
+
+
+@pytest.mark.parametrize('name', ('phu my', 'Phường 1', 'Xã Tân Hải'))
+def test_search_by_name_in_province(name):
+    ward_map = legacy_ward_map()
+    index = ward_map.name_index
+    matched = [index.entries[i].record for i in index.candidates(name)]
+    for province_code in {w.province_code for w in matched}:
+        scoped = ward_map.search_by_legacy_name(name, province_code)
+        assert all(ward_map.legacy_wards[r.source_code].province_code == province_code for r in scoped)
+        # Each new ward of the matched legacy wards in that province is listed, even if the country-wide search
+        # lists it with a legacy ward from another province.
+        expected = {
+            nw.ward.code for w in matched if w.province_code == province_code for nw in ward_map.forward[w.code]
+        }
+        assert {r.ward.code for r in scoped} == expected
@@ -0,0 +1,86 @@
+from http import HTTPStatus
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api.compression import COMPRESSORS, negotiate_encoding
+from api.main import app, settings
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_etag_revalidation(async_client):
+    res = await async_client.get('/api/v2/?depth=2')
+    assert res.status_code == HTTPStatus.OK, res.text
+    etag = res.headers['etag']
+    assert 'last-modified' in res.headers
+    res = await async_client.get('/api/v2/?depth=2', headers={'If-None-Match': etag})
+    assert res.status_code == HTTPStatus.NOT_MODIFIED
+    assert res.headers['etag'] == etag
+    assert not res.content
+
+
+@pytest.mark.asyncio
+async def test_etag_depends_on_query(async_client):
+    res1 = await async_client.get('/api/v1/?depth=1')
+    res2 = await async_client.get('/api/v1/?depth=3')
+    assert res1.headers['etag'] != res2.headers['etag']
+    # Order of query parameters doesn't matter
+    res1 = await async_client.get('/api/v1/w/search/?q=Phúc Xá&d=1')
+    res2 = await async_client.get('/api/v1/w/search/?d=1&q=Phúc Xá')
+    assert res1.headers['etag'] == res2.headers['etag']
+    res = await async_client.get('/api/v1/?depth=3', headers={'If-None-Match': res1.headers['etag']})
+    assert res.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_no_etag_on_error(async_client):
+    res = await async_client.get('/api/v2/w/999999')
+    assert res.status_code == HTTPStatus.NOT_FOUND
+    assert 'etag' not in res.headers
+
+
+@pytest.mark.asyncio
+async def test_configurable_cache_control(async_client, monkeypatch):
+    monkeypatch.setattr(settings, 'browser_cache_max_age', 86400)
+    monkeypatch.setattr(settings, 'cache_immutable', True)
+    res = await async_client.get('/api/v2/p/')
+    assert res.headers['cache-control'].startswith('max-age=86400, s-maxage=')
+    assert res.headers['cache-control'].endswith('immutable')
+
+
+@pytest.mark.asyncio
+async def test_precompressed_gzip(async_client):
+    res = await async_client.get('/api/v2/?depth=2', headers={'Accept-Encoding': 'gzip'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in res.headers['vary']
+    gzip_etag = res.headers['etag']
+    plain = await async_client.get('/api/v2/?depth=2', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    assert plain.content == res.content
+    assert plain.headers['etag'] != gzip_etag
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('encoding', ('br', 'zstd'))
+async def test_precompressed_optional(async_client, encoding):
+    if encoding not in COMPRESSORS:
+        pytest.skip(f'{encoding} is not available')
+    res = await async_client.get('/api/v1/w/', headers={'Accept-Encoding': f'gzip;q=0.5, {encoding}'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.headers['content-encoding'] == encoding
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding('') == 'identity'
+    assert negotiate_encoding('gzip, deflate') == 'gzip'
+    assert negotiate_encoding('gzip;q=0, deflate') == 'identity'
+    assert negotiate_encoding('compress') == 'identity'
+    assert negotiate_encoding('gzip;q=1.0, *;q=0.1') == 'gzip'
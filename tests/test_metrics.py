@@ -0,0 +1,67 @@
+from http import HTTPStatus
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api import main
+from api.main import app
+from api.metrics import metrics
+from api.ratelimit import Blocklist
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_metrics_by_route_template(async_client):
+    metrics.clear()
+    await async_client.get('/api/v2/w/4')
+    await async_client.get('/api/v2/w/8')
+    await async_client.get('/api/v2/w/999999')
+    await async_client.get('/api/v2/w/', params={'search': 'an'})
+    res = await async_client.get('/metrics')
+    assert res.status_code == HTTPStatus.OK
+    assert res.headers['content-type'].startswith('text/plain; version=0.0.4')
+    lines = res.text.splitlines()
+    assert 'http_requests_total{method="GET",route="/api/v2/w/{code}",status="200"} 2' in lines
+    assert 'http_requests_total{method="GET",route="/api/v2/w/{code}",status="404"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/v2/w/{code}"} 3' in lines
+    assert 'http_response_size_bytes_bucket{method="GET",route="/api/v2/w/",le="+Inf"} 1' in lines
+    assert not any('/api/v2/w/4' in line for line in lines)
+    (serialization,) = (
+        line
+        for line in lines
+        if line.startswith('http_serialization_duration_seconds_sum{method="GET",route="/api/v2/w/"}')
+    )
+    assert float(serialization.split()[-1]) > 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_label_responses_before_routing(async_client, monkeypatch):
+    metrics.clear()
+    res = await async_client.get('/api/v2/w/4')
+    res = await async_client.get('/api/v2/w/4', headers={'If-None-Match': res.headers['etag']})
+    assert res.status_code == HTTPStatus.NOT_MODIFIED
+    monkeypatch.setattr(main, 'blocklist', Blocklist('127.0.0.0/8'))
+    res = await async_client.get('/api/v1/', params={'depth': 3})
+    assert res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    lines = (await async_client.get('/metrics')).text.splitlines()
+    assert 'http_requests_total{method="GET",route="/api/v2/w/{code}",status="304"} 1' in lines
+    # The v1 app is loaded on first request, its routes are not known, so it is labeled by the mount path.
+    assert 'http_requests_total{method="GET",route="/api/v1",status="429"} 1' in lines
+    assert not any('<unmatched>' in line for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_metrics_bound_methods(async_client):
+    metrics.clear()
+    for method in ('PURGE', 'FOO'):
+        await async_client.request(method, '/api/v2/w/4')
+    await async_client.get('/api/v2/w/4')
+    lines = (await async_client.get('/metrics')).text.splitlines()
+    requests = [line for line in lines if line.startswith('http_requests_total{')]
+    assert {line.split('"')[1] for line in requests} == {'GET', 'other'}
@@ -0,0 +1,93 @@
+import os
+from http import HTTPStatus
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from api import main
+from api.ratelimit import Blocklist, MemoryBucketStore, RateLimiter, SharedBucketStore
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=main.app, client=('10.0.0.7', 1234))
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+def test_memory_bucket():
+    limiter = RateLimiter(rate=1, burst=10, store=MemoryBucketStore())
+    assert limiter.acquire('a', 6) == 0
+    assert limiter.acquire('a', 6) > 0
+    # Other clients have their own bucket
+    assert limiter.acquire('b', 6) == 0
+    # Cost is capped to the bucket size, so that the request can succeed eventually
+    assert limiter.acquire('c', 100) == 0
+
+
+def test_shared_bucket(tmp_path):
+    path = tmp_path / 'buckets'
+    store1 = SharedBucketStore(path, slots=16)
+    store2 = SharedBucketStore(path, slots=16)
+    try:
+        assert store1.take('a', 6, 1, 10) == 0
+        # The other worker sees the tokens taken by the first one
+        assert store2.take('a', 6, 1, 10) > 0
+        for i in range(40):
+            store2.take(f'client-{i}', 1, 1, 10)
+    finally:
+        store1.close()
+        store2.close()
+
+
+def test_blocklist_reload(tmp_path):
+    path = tmp_path / 'blocklist'
+    path.write_text('10.1.0.0/16\n# comment\n')
+    blocklist = Blocklist('1.2.3.4, 2001:db8::/32', path)
+    assert '1.2.3.4' in blocklist
+    assert '2001:db8::1' in blocklist
+    assert '10.1.2.3' in blocklist
+    assert '10.2.0.1' not in blocklist
+    path.write_text('10.2.0.1\n')
+    os.utime(path, (0, 1))
+    blocklist.reload()
+    assert '10.2.0.1' in blocklist
+    assert '10.1.2.3' not in blocklist
+
+
+@pytest.mark.asyncio
+async def test_blocklisted_client_refused_heavy_requests(async_client, monkeypatch):
+    monkeypatch.setattr(main, 'blocklist', Blocklist('10.0.0.0/24'))
+    res = await async_client.get('/api/v1/', params={'depth': 3})
+    assert res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    res = await async_client.get('/api/v1/')
+    assert res.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('url', ['/api/v1/p/', '/api/v1/w/', '/api/v2/w/', '/api/v1/export/district'])
+async def test_blocklisted_client_allowed_listings(async_client, monkeypatch, url):
+    monkeypatch.setattr(main, 'blocklist', Blocklist('10.0.0.0/24'))
+    res = await async_client.get(url)
+    assert res.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_with_retry_after(async_client, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', RateLimiter(rate=0.01, burst=100, store=MemoryBucketStore()))
+    res = await async_client.get('/api/v1/', params={'depth': 3})
+    assert res.status_code == HTTPStatus.OK
+    res = await async_client.get('/api/v1/w/4')
+    assert res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(res.headers['retry-after']) >= 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_v2_answers_problem_details(async_client, monkeypatch):
+    monkeypatch.setattr(main, 'rate_limiter', RateLimiter(rate=0.01, burst=1, store=MemoryBucketStore()))
+    await async_client.get('/api/v2/')
+    res = await async_client.get('/api/v2/')
+    assert res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert res.headers['content-type'] == 'application/problem+json'
+    assert res.json()['status'] == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(res.headers['retry-after']) >= 10
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from http import HTTPStatus
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response
+from httpx import ASGITransport, AsyncClient
+
+from api.main import app, response_cache
+from api.response_cache import ENTRY_OVERHEAD, CachedResponse, ResponseCache, ResponseCacheMiddleware
+from api.v2 import api_v2
+
+
+def make_entry(size: int, ttl: float = 60) -> CachedResponse:
+    return CachedResponse(200, (), b'x' * (size - ENTRY_OVERHEAD), time.monotonic() + ttl)
+
+
+def test_lru_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=1000, ttl=60, max_entry_bytes=600)
+    cache.put('a', make_entry(400))
+    cache.put('b', make_entry(400))
+    assert cache.get('a')
+    # "b" is the least recently used now
+    cache.put('c', make_entry(400))
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.size == 800
+    assert cache.evictions == 1
+    cache.put('d', make_entry(700))
+    assert 'd' not in cache.entries
+
+
+def test_ttl():
+    cache = ResponseCache(max_bytes=1000, ttl=60, max_entry_bytes=1000)
+    cache.put('a', make_entry(300, ttl=-1))
+    assert cache.get('a') is None
+    assert cache.expirations == 1
+    assert cache.size == 0
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_hit(async_client):
+    hits = response_cache.hits
+    url = '/api/v2/w/'
+    params = {'province': 79, 'search': 'an'}
+    first = await async_client.get(url, params=params)
+    second = await async_client.get(url, params={'search': 'an', 'province': 79})
+    assert second.status_code == HTTPStatus.OK
+    assert second.content == first.content
+    assert second.headers['etag'] == first.headers['etag']
+    assert response_cache.hits == hits + 1
+    # Error responses are not cached
+    for _i in range(2):
+        await async_client.get('/api/v2/w/suggest/', params={'q': 'ph', 'limit': 1000})
+    assert response_cache.hits == hits + 1
+    res = await async_client.get('/metrics')
+    assert f'response_cache_hits_total {response_cache.hits}' in res.text.splitlines()
+
+
+@pytest.mark.asyncio
+async def test_not_shared_between_hosts(async_client):
+    params = {'limit': 2}
+    first = await async_client.get('/api/v2/p/', params=params)
+    second = await async_client.get('/api/v2/p/', params=params, headers={'Host': 'other.example'})
+    assert first.headers['link'].startswith('<http://testserver/api/v2/p/?')
+    assert second.headers['link'].startswith('<http://other.example/api/v2/p/?')
+
+
+@pytest.mark.asyncio
+async def test_snapshots_not_cached(async_client):
+    size = response_cache.size
+    since = api_v2.state.dataset_history.versions()[0]
+    for _i in range(2):
+        res = await async_client.get('/api/v1/', params={'depth': 3})
+        assert res.status_code == HTTPStatus.OK
+        res = await async_client.get('/api/v2/export/', params={'format': 'msgpack'})
+        assert res.status_code == HTTPStatus.OK
+        res = await async_client.get('/api/v2/changes/', params={'since': since})
+        assert res.status_code == HTTPStatus.OK
+    assert response_cache.size == size
+
+
+@pytest.mark.asyncio
+async def test_big_response_not_cached():
+    sub_app = FastAPI()
+
+    @sub_app.get('/api/v2/big')
+    async def big(n: int):
+        return Response(b'[%s]' % b','.join([b'1'] * n), media_type='application/json')
+
+    cache = ResponseCache(max_bytes=10000, ttl=60, max_entry_bytes=1000)
+    transport = ASGITransport(app=ResponseCacheMiddleware(sub_app, cache))
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        res = await client.get('/api/v2/big', params={'n': 1000})
+        assert len(res.content) > 1000
+        assert not cache.entries
+        await client.get('/api/v2/big', params={'n': 10})
+        assert len(cache.entries) == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    calls = []
+    sub_app = FastAPI()
+
+    @sub_app.get('/api/v2/slow')
+    async def slow(q: str):
+        calls.append(q)
+        await asyncio.sleep(0.05)
+        return Response(b'{"q": "%s"}' % q.encode(), media_type='application/json')
+
+    cache = ResponseCache(max_bytes=10000, ttl=60, max_entry_bytes=1000)
+    transport = ASGITransport(app=ResponseCacheMiddleware(sub_app, cache))
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        responses = await asyncio.gather(*(client.get('/api/v2/slow', params={'q': 'a'}) for _i in range(5)))
+        assert {r.content for r in responses} == {b'{"q": "a"}'}
+        assert calls == ['a']
+        assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 4)
+        await client.get('/api/v2/slow', params={'q': 'b'})
+        assert calls == ['a', 'b']
@@ -0,0 +1,64 @@
+import pytest
+from vietnam_provinces import Province, Ward
+from vietnam_provinces.legacy import District as LegacyDistrict
+from vietnam_provinces.legacy import Province as LegacyProvince
+from vietnam_provinces.legacy import Ward as LegacyWard
+
+from api.search import (
+    legacy_district_index,
+    legacy_province_index,
+    legacy_ward_index,
+    province_index,
+    ward_index,
+)
+
+
+QUERIES = (
+    'Hà Nội',
+    'hien hoa',
+    'Hiền Hòa',
+    'Phúc Xá',
+    'Phường Phúc Xá',
+    'ba dinh',
+    'tỉnh',
+    'an h',
+    'Tân a b',
+    'thanh pho ho chi minh',
+    'Phan Rang-Tháp Chàm',
+    'Quận 1',
+    '',
+)
+
+
+@pytest.mark.parametrize(
+    ('library_search', 'get_index'),
+    (
+        (Province.search, province_index),
+        (Ward.search, ward_index),
+        (LegacyProvince.search, legacy_province_index),
+        (LegacyDistrict.search, legacy_district_index),
+        (LegacyWard.search, legacy_ward_index),
+    ),
+)
+def test_same_results_as_library(library_search, get_index):
+    index = get_index()
+    for q in QUERIES:
+        expected = tuple(r.code for r in library_search(q))
+        assert tuple(r.code for r in index.search(q)) == expected, q
+
+
+def test_scoped_search_same_as_filtering():
+    index = legacy_ward_index()
+    for q in ('an', 'Phúc Xá', 'phuong 1', 'Tân h'):
+        results = index.search(q)
+        for pcode in (1, 79, 2):
+            expected = tuple(w.code for w in results if w.province_code == pcode)
+            assert tuple(w.code for w in index.search(q, province_code=pcode)) == expected
+        for dcode in (1, 760):
+            expected = tuple(w.code for w in results if w.district_code == dcode)
+            assert tuple(w.code for w in index.search(q, district_code=dcode)) == expected
+    index = ward_index()
+    results = index.search('an')
+    expected = tuple(w.code for w in results if w.province_code == 79)
+    assert tuple(w.code for w in index.search('an', province_code=79)) == expected
+    assert index.search('an', province_code=999) == ()
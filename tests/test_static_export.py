@@ -0,0 +1,61 @@
+import asyncio
+import gzip
+from pathlib import Path
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from vietnam_provinces import __data_version__
+
+from api import static_export
+from api.main import app, build_cache_control
+from api.static_export import CURRENT_LINK, NGINX_HEADERS, export, file_path, iter_v1_urls, iter_v2_urls
+
+
+V1_URLS = (('/', 1), ('/', 2), ('/p/1', 3), ('/w/1', 1), ('/version', 1))
+V2_URLS = (('/p/', 1), ('/w/4', 1), ('/w/4/to-legacies/', 1))
+
+
+@pytest.fixture
+async def async_client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://testServer') as client:
+        yield client
+
+
+def test_file_path():
+    assert file_path('/api/v1/', 1) == Path('api/v1/index.json')
+    assert file_path('/api/v1/p/1', 3) == Path('api/v1/p/1/index.depth3.json')
+    assert file_path('/api/v2/w/4/to-legacies/', 1) == Path('api/v2/w/4/to-legacies/index.json')
+
+
+def test_urls():
+    v1 = set(iter_v1_urls())
+    assert {('/', 1), ('/p/1', 3), ('/d/1', 2), ('/w/1', 1)} <= v1
+    assert ('/d/1', 3) not in v1
+    # Left to the backend, for blocklist and rate limiting
+    assert not {('/', 2), ('/', 3), ('/d/', 1), ('/w/', 1)} & v1
+    v2 = set(iter_v2_urls())
+    assert {('/', 1), ('/p/1', 2), ('/w/4', 1), ('/w/4/to-legacies/', 1)} <= v2
+    assert not {('/', 2), ('/w/', 1)} & v2
+
+
+@pytest.mark.asyncio
+async def test_export(async_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_export, 'iter_v1_urls', lambda: iter(V1_URLS))
+    monkeypatch.setattr(static_export, 'iter_v2_urls', lambda: iter(V2_URLS))
+    # Run in another thread, because it runs its own event loop.
+    assert await asyncio.to_thread(export, tmp_path) == len(V1_URLS) + len(V2_URLS)
+    current = tmp_path / CURRENT_LINK
+    assert current.resolve() == (tmp_path / __data_version__).resolve()
+    for prefix, urls in (('/api/v1', V1_URLS), ('/api/v2', V2_URLS)):
+        for path, depth in urls:
+            res = await async_client.get(prefix + path, params={'depth': depth} if depth > 1 else None)
+            assert (current / file_path(prefix + path, depth)).read_bytes() == res.content
+    tree = current / 'api/v1/index.depth2.json'
+    assert gzip.decompress(tree.with_name(tree.name + '.gz').read_bytes()) == tree.read_bytes()
+    # Too small to compress
+    assert not (current / 'api/v1/version/index.json.gz').exists()
+    # Exporting again replaces the folder
+    assert await asyncio.to_thread(export, tmp_path) == len(V1_URLS) + len(V2_URLS)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [__data_version__, CURRENT_LINK, NGINX_HEADERS]
+    assert f"add_header 'Cache-Control' '{build_cache_control()}';" in (tmp_path / NGINX_HEADERS).read_text()
@@ -0,0 +1,100 @@
+from typing import NamedTuple
+
+import msgspec
+import pytest
+from vietnam_provinces import Province, ProvinceCode, Ward
+from vietnam_provinces.legacy import District as LegacyDistrict
+from vietnam_provinces.legacy import DistrictCode as LegacyDistrictCode
+from vietnam_provinces.legacy import ProvinceCode as LegacyProvinceCode
+from vietnam_provinces.legacy import Ward as LegacyWard
+
+from api.paging import ListParams, iter_page, page_range, paginate
+from api.records_v2 import ProvinceRecord, WardRecord
+from api.store import CompactRecords, DivisionTable, division_store, legacy_division_store
+
+
+class Item(NamedTuple):
+    code: int
+    parent_code: int
+
+
+class Record(msgspec.Struct):
+    name: str
+    code: int
+    parent_code: int
+    children: tuple[int, ...] = ()
+
+
+def make_record(item: Item) -> Record:
+    return Record(f'N{item.code % 2}', item.code, item.parent_code)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_table_children(compact):
+    items = [Item(5, 2), Item(1, 2), Item(3, 1), Item(4, 2), Item(2, 3)]
+    table = DivisionTable(items, make_record, ('parent_code',), compact)
+    assert tuple(table.records) == tuple(make_record(i) for i in sorted(items))
+    assert [r.code for r in table.children('parent_code', 2)] == [1, 4, 5]
+    assert [r.code for r in table.children('parent_code', 1)] == [3]
+    assert table.children('parent_code', 9) == ()
+    assert table.get(4) == Record('N0', 4, 2)
+    assert table.get(9) is None
+    assert table.get(0) is None
+    assert 3 in table
+    assert 6 not in table
+    assert [r.code for r in table.records_of([Item(5, 2), Item(1, 2)])] == [5, 1]
+    assert [r.code for r in table.records_of([Item(5, 2), Item(1, 2)], sort=True)] == [1, 5]
+
+
+def test_compact_records():
+    records = [make_record(Item(code, 1)) for code in range(1, 6)]
+    compact = CompactRecords(Record, records)
+    assert len(compact) == 5
+    assert compact[-1] == records[-1]
+    assert compact[1:3] == tuple(records[1:3])
+    assert compact[::2] == tuple(records[::2])
+    assert list(compact.iter_range(2, 4)) == records[2:4]
+    assert list(compact.iter_range(4, 4)) == []
+    assert compact.strings == ('N1', 'N0')
+
+
+@pytest.mark.parametrize(
+    'params', [ListParams(2, 0, None, None), ListParams(2, 1, 2, None), ListParams(None, 0, 3, None)]
+)
+def test_compact_records_pages(params):
+    records = tuple(make_record(Item(code, 1)) for code in range(1, 6))
+    compact = CompactRecords(Record, records)
+    assert paginate(compact, params, True) == paginate(records, params, True)
+    start, stop = page_range(compact, params, True)
+    assert tuple(iter_page(compact, start, stop)) == paginate(records, params, True)[0]
+
+
+def test_division_store():
+    store = division_store()
+    assert store.provinces.records == tuple(
+        ProvinceRecord.from_province(p) for p in sorted(Province.iter_all(), key=lambda p: p.code)
+    )
+    assert store.provinces.get(79) == ProvinceRecord.from_province(Province.from_code(ProvinceCode(79)))
+    expected = tuple(
+        WardRecord.from_ward(w) for w in sorted(Ward.iter_by_province(ProvinceCode(79)), key=lambda w: w.code)
+    )
+    assert store.wards.children('province_code', 79) == expected
+
+
+def test_legacy_division_store():
+    store = legacy_division_store()
+    codes = [d.code for d in store.districts.children('province_code', 79)]
+    assert codes == sorted(d.code for d in LegacyDistrict.iter_by_province(LegacyProvinceCode(79)))
+    codes = [w.code for w in store.wards.children('district_code', 760)]
+    assert codes == sorted(w.code for w in LegacyWard.iter_by_district(LegacyDistrictCode(760)))
+    assert len(store.wards) == sum(1 for _w in LegacyWard.iter_all())
+
+
+def test_compact_wards_same_records():
+    from api.records_v1 import WardRecord as LegacyWardRecord
+
+    store = legacy_division_store()
+    compact = DivisionTable(LegacyWard.iter_all(), LegacyWardRecord.from_ward, ('district_code',), compact=True)
+    assert tuple(compact.records) == tuple(store.wards.records)
+    for district in store.districts.records:
+        assert compact.children('district_code', district.code) == store.wards.children('district_code', district.code)
@@ -0,0 +1,60 @@
+import pytest
+
+from api.suggest import (
+    LEVELS,
+    SuggestIndex,
+    _keys,
+    legacy_ward_suggest_index,
+    normalize,
+    province_suggest_index,
+    ward_suggest_index,
+)
+
+
+QUERIES = ('p', 'ph', 'Phú', 'phu h', 'ba dinh', 'Phường Ba', 'xa t', 'hoa ', 'an', 'ha_noi', 'tan', 'zzz', ' ')
+
+
+def brute_force(index: SuggestIndex, query: str, limit: int, **scope: int) -> list[int]:
+    query = normalize(query)
+    if not query.strip():
+        return []
+    scored = []
+    for i, record in enumerate(index.records):
+        if any(int(getattr(record, attr)) != code for attr, code in scope.items()):
+            continue
+        keys, names = _keys(record)
+        kinds = [kind for key, kind in keys.items() if key.startswith(query)]
+        if not kinds:
+            continue
+        exact = query in names
+        scored.append(((not exact, min(kinds), LEVELS[record.division_type], len(record.name), i), i))
+    return [i for _s, i in sorted(scored)[:limit]]
+
+
+@pytest.mark.parametrize('get_index', (province_suggest_index, ward_suggest_index))
+@pytest.mark.parametrize('query', QUERIES)
+def test_same_as_brute_force(get_index, query):
+    index = get_index()
+    for limit in (1, 10, 50):
+        results = index.suggest(query, limit)
+        assert [index.records.index(r) for r in results] == brute_force(index, query, limit)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_scoped_same_as_brute_force(query):
+    index = legacy_ward_suggest_index()
+    for scope in ({'province_code': 1}, {'province_code': 79}, {'district_code': 1}):
+        results = index.suggest(query, 20, **scope)
+        assert [index.records.index(r) for r in results] == brute_force(index, query, 20, **scope)
+
+
+def test_ranking():
+    index = ward_suggest_index()
+    # Exact name first
+    assert index.suggest('Ba Đình', 1)[0].name == 'Phường Ba Đình'
+    # Name prefix before word prefix
+    names = [w.name for w in index.suggest('phu h', 3)]
+    assert all(n.startswith('Xã Phú H') for n in names)
+    assert not index.suggest('phu h', province_code=999)
+    with pytest.raises(ValueError):
+        index.suggest('an', district_code=1)
@@ -1,3 +1,4 @@
+import json
 from http import HTTPStatus
 
 import pytest
@@ -76,3 +77,156 @@ async def test_search_wards(async_client):
     res = await async_client.get('/api/v1/w/search/?q=Phúc Xá')
     assert res.status_code == HTTPStatus.OK, res.text
     assert len(res.json()) > 0
+
+
+@pytest.mark.asyncio
+async def test_show_all_divisions_depth(async_client):
+    res = await async_client.get('/api/v1/?depth=1')
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert all(p['districts'] == [] for p in res.json())
+    res = await async_client.get('/api/v1/?depth=3')
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert data[0]['districts'][0]['wards'][0]['code'] == 1
+
+
+@pytest.mark.asyncio
+async def test_snapshots_consistent_with_tree(async_client):
+    tree = (await async_client.get('/api/v1/?depth=3')).json()
+    res = await async_client.get('/api/v1/p/1?depth=3')
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == tree[0]
+    res = await async_client.get('/api/v1/d/1?depth=2')
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == tree[0]['districts'][0]
+    res = await async_client.get('/api/v1/p/1?depth=2')
+    assert all(d['wards'] == [] for d in res.json()['districts'])
+
+
+@pytest.mark.asyncio
+async def test_search_wards_scoped(async_client):
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'Phúc Xá', 'p': 1})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json()[0]['code'] == 1
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'Phúc Xá', 'p': 79})
+    assert res.json() == []
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'Phúc Xá', 'd': 1})
+    assert res.json()[0]['code'] == 1
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'Phúc Xá', 'd': 99999})
+    assert res.json() == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('path', ('/api/v1/w/', '/api/v1/d/'))
+async def test_streamed_listing_same_as_buffered(async_client, path):
+    buffered = await async_client.get(path)
+    streamed = await async_client.get(path, params={'stream': 'json'})
+    assert streamed.status_code == HTTPStatus.OK, streamed.text
+    assert streamed.content == buffered.content
+    ndjson = await async_client.get(path, params={'stream': 'ndjson'})
+    assert ndjson.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line) for line in ndjson.text.splitlines()] == buffered.json()
+
+
+@pytest.mark.asyncio
+async def test_batch_get_wards(async_client):
+    res = await async_client.post('/api/v1/w/batch/', json={'codes': [4, 999999, 1], 'expand': True})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert [(r['code'], r['found']) for r in data] == [(4, True), (999999, False), (1, True)]
+    assert data[0]['ward']['code'] == 4
+    assert data[0]['district']['code'] == data[0]['ward']['district_code']
+    assert data[0]['province']['code'] == data[0]['district']['province_code']
+    assert data[1]['ward'] is None
+    single = await async_client.get('/api/v1/w/1')
+    assert data[2]['ward'] == single.json()
+
+
+@pytest.mark.asyncio
+async def test_batch_get_districts_without_expand(async_client):
+    res = await async_client.post('/api/v1/d/batch/', json={'codes': [1, 0]})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert data[0]['found'] and data[0]['province'] is None
+    assert not data[1]['found']
+
+
+@pytest.mark.asyncio
+async def test_batch_too_many_codes(async_client):
+    res = await async_client.post('/api/v1/p/batch/', json={'codes': list(range(1001))})
+    assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_list_wards_paginated(async_client):
+    full = (await async_client.get('/api/v1/w/')).json()
+    res = await async_client.get('/api/v1/w/', params={'limit': 5, 'offset': 2})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == full[2:7]
+    assert f'after={full[6]["code"]}' in res.headers['link']
+    res = await async_client.get('/api/v1/w/', params={'limit': 3, 'after': full[6]['code']})
+    assert res.json() == full[7:10]
+    res = await async_client.get('/api/v1/w/', params={'after': full[-2]['code']})
+    assert res.json() == full[-1:]
+    assert 'link' not in res.headers
+
+
+@pytest.mark.asyncio
+async def test_tree_with_nested_fields(async_client):
+    res = await async_client.get(
+        '/api/v1/', params={'depth': 3, 'limit': 1, 'fields': 'code,name,districts.code,districts.wards.name'}
+    )
+    assert res.status_code == HTTPStatus.OK, res.text
+    (province,) = res.json()
+    assert province.keys() == {'code', 'name', 'districts'}
+    assert province['districts'][0].keys() == {'code', 'wards'}
+    assert province['districts'][0]['wards'][0] == {'name': 'Phường Phúc Xá'}
+    res = await async_client.get('/api/v1/', params={'fields': 'code,population'})
+    assert res.status_code == HTTPStatus.BAD_REQUEST
+    for fields in (',', '.'):
+        res = await async_client.get('/api/v1/', params={'fields': fields})
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_search_paginated(async_client):
+    full = (await async_client.get('/api/v1/w/search/', params={'q': 'an'})).json()
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'an', 'limit': 2, 'after': full[1]['code']})
+    assert res.json() == full[2:4]
+    res = await async_client.get('/api/v1/d/search/', params={'q': 'an', 'fields': 'code'})
+    assert all(d.keys() == {'code'} for d in res.json())
+
+
+@pytest.mark.asyncio
+async def test_suggest(async_client):
+    res = await async_client.get('/api/v1/w/suggest/', params={'q': 'phuc x', 'd': 1})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == [{'name': 'Phường Phúc Xá', 'code': 1}]
+    res = await async_client.get('/api/v1/d/suggest/', params={'q': 'ba d', 'p': 1})
+    assert res.json()[0] == {'name': 'Quận Ba Đình', 'code': 1}
+    res = await async_client.get('/api/v1/w/suggest/', params={'q': 'an', 'p': 999})
+    assert res.json() == []
+
+
+@pytest.mark.asyncio
+async def test_fuzzy_search(async_client):
+    res = await async_client.get('/api/v1/d/search/', params={'q': 'thu dc', 'p': 79, 'fuzzy': True})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json()[0] == {'name': 'Thành phố Thủ Đức', 'code': 769}
+    res = await async_client.get('/api/v1/w/search/', params={'q': 'phuc xaa', 'd': 1, 'fuzzy': True})
+    assert res.json()[0]['name'] == 'Phường Phúc Xá'
+    res = await async_client.get('/api/v1/p/search/', params={'q': 'ha noi', 'fuzzy': True, 'min_score': 0})
+    assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_parse_address(async_client):
+    res = await async_client.get('/api/v1/address/', params={'text': 'P. Phúc Xá, Q. Ba Đình, HN'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert data['province']['code'] == 1
+    assert data['district'] == {'code': 1, 'name': 'Quận Ba Đình', 'matched': 'Q. Ba Đình'}
+    assert data['ward'] == {'code': 1, 'name': 'Phường Phúc Xá', 'matched': 'P. Phúc Xá'}
+    res = await async_client.post('/api/v1/address/batch/', json={'addresses': ['Quận 1, HCM'] * 3})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert [r['district']['code'] for r in res.json()] == [760] * 3
@@ -3,6 +3,7 @@ from http import HTTPStatus
 import msgspec
 import pytest
 from httpx import ASGITransport, AsyncClient
+from vietnam_provinces import NESTED_DIVISIONS_JSON_PATH
 
 from api.main import app
 
@@ -159,3 +160,141 @@ async def test_lookup_from_legacy_ward_by_name(async_client):
     
     # Should return results
     assert len(wards) >= 0  # Allow for empty results but should not fail
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('params', ({}, {'province': 79}, {'search': 'an'}))
+async def test_streamed_wards_same_as_buffered(async_client, params):
+    buffered = await async_client.get('/api/v2/w/', params=params)
+    streamed = await async_client.get('/api/v2/w/', params={**params, 'stream': 'json'})
+    assert streamed.status_code == HTTPStatus.OK, streamed.text
+    assert streamed.content == buffered.content
+    ndjson = await async_client.get('/api/v2/w/', params={**params, 'stream': 'ndjson'})
+    wards = [msgspec.json.decode(line, type=WardResponse) for line in ndjson.content.splitlines()]
+    assert wards == list(msgspec.json.decode(buffered.content, type=tuple[WardResponse, ...]))
+
+
+@pytest.mark.asyncio
+async def test_batch_get_wards(async_client):
+    single = await async_client.get('/api/v2/w/4')
+    res = await async_client.post('/api/v2/w/batch/', json={'codes': [4, 1, 4], 'expand': True})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert [(r['code'], r['found']) for r in data] == [(4, True), (1, False), (4, True)]
+    assert data[0]['ward'] == single.json()
+    assert data[0]['province']['code'] == data[0]['ward']['province_code']
+    assert data[1]['ward'] is None and data[1]['province'] is None
+
+
+@pytest.mark.asyncio
+async def test_batch_get_provinces(async_client):
+    res = await async_client.post('/api/v2/p/batch/', json={'codes': [79, 2]})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert [(r['code'], r['found']) for r in res.json()] == [(79, True), (2, False)]
+
+
+@pytest.mark.asyncio
+async def test_bulk_convert_from_legacy_csv(async_client):
+    body = 'ref,legacy_code,legacy_name\nA1,1,\nA2,,Phường 1\nA3,,No Such Ward\nA4,x,\n'
+    res = await async_client.post('/api/v2/w/from-legacy/bulk/', content=body, headers={'content-type': 'text/csv'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    header, *rows = (line.split(',') for line in res.text.splitlines())
+    assert header[:3] == ['line', 'ref', 'status']
+    assert [r[:3] for r in rows] == [
+        ['2', 'A1', 'converted'],
+        ['3', 'A2', 'ambiguous'],
+        ['4', 'A3', 'not-found'],
+        ['5', '', 'invalid'],
+    ]
+    single = await async_client.get('/api/v2/w/from-legacy/', params={'legacy_code': 1})
+    assert int(rows[0][3]) == single.json()[0]['ward']['code']
+    assert len(rows[1][7].split()) > 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_convert_from_legacy_ndjson(async_client):
+    body = '{"ref": 7, "legacy_code": 1}\n{"legacy_name": "Phúc Xá"}\n'
+    res = await async_client.post(
+        '/api/v2/w/from-legacy/bulk/', content=body, headers={'content-type': 'application/x-ndjson'}
+    )
+    assert res.status_code == HTTPStatus.OK, res.text
+    rows = [msgspec.json.decode(line) for line in res.content.splitlines()]
+    assert rows[0]['ref'] == 7
+    assert rows[0]['status'] == rows[1]['status'] == 'converted'
+
+
+@pytest.mark.asyncio
+async def test_bulk_convert_rejects_bad_input(async_client):
+    res = await async_client.post('/api/v2/w/from-legacy/bulk/', content='a,b\n', headers={'content-type': 'text/csv'})
+    assert res.status_code == HTTPStatus.BAD_REQUEST
+    res = await async_client.post('/api/v2/w/from-legacy/bulk/', content='1\n', headers={'content-type': 'text/plain'})
+    assert res.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+
+@pytest.mark.asyncio
+async def test_list_wards_paginated_with_fields(async_client):
+    full = (await async_client.get('/api/v2/w/', params={'province': 79})).json()
+    res = await async_client.get(
+        '/api/v2/w/', params={'province': 79, 'after': full[9]['code'], 'limit': 10, 'fields': 'code,name'}
+    )
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == [{'code': w['code'], 'name': w['name']} for w in full[10:20]]
+    res = await async_client.get('/api/v2/w/', params={'limit': 2, 'stream': 'ndjson', 'fields': 'code'})
+    assert [msgspec.json.decode(line) for line in res.content.splitlines()] == [{'code': 4}, {'code': 8}]
+    res = await async_client.get('/api/v2/w/', params={'fields': 'code.name'})
+    assert res.status_code == HTTPStatus.BAD_REQUEST
+    for fields in (',', '.'):
+        res = await async_client.get('/api/v2/w/', params={'fields': fields})
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_tree_page_same_as_full_tree(async_client):
+    full = (await async_client.get('/api/v2/', params={'depth': 2})).json()
+    res = await async_client.get('/api/v2/', params={'depth': 2, 'limit': 5})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json() == full[:5]
+    # The whole tree is the file of vietnam_provinces
+    assert res.content == msgspec.json.encode(msgspec.json.decode(NESTED_DIVISIONS_JSON_PATH.read_bytes())[:5])
+    res = await async_client.get('/api/v2/', params={'depth': 2, 'limit': 1, 'fields': 'code,wards.short_codename'})
+    assert res.json()[0]['wards'][0] == {'short_codename': 'ba_dinh'}
+
+
+@pytest.mark.asyncio
+async def test_suggest(async_client):
+    res = await async_client.get('/api/v2/p/suggest/', params={'q': 'ha n', 'limit': 3})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json()[0]['name'] == 'Thành phố Hà Nội'
+    res = await async_client.get('/api/v2/w/suggest/', params={'q': 'ph', 'province': 1, 'limit': 5})
+    assert res.status_code == HTTPStatus.OK, res.text
+    wards = res.json()
+    assert len(wards) == 5
+    assert all(w['province_code'] == 1 for w in wards)
+    res = await async_client.get('/api/v2/w/suggest/', params={'q': 'ph', 'limit': 1000})
+    assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_fuzzy_search(async_client):
+    res = await async_client.get('/api/v2/w/', params={'search': 'thu dc'})
+    assert res.json() == []
+    res = await async_client.get('/api/v2/w/', params={'search': 'thu dc', 'fuzzy': True, 'limit': 3})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert res.json()[0]['name'] == 'Phường Thủ Đức'
+    res = await async_client.get('/api/v2/p/', params={'search': 'ha noii', 'fuzzy': True, 'min_score': 0.6})
+    assert [p['name'] for p in res.json()] == ['Thành phố Hà Nội']
+
+
+@pytest.mark.asyncio
+async def test_parse_address(async_client):
+    res = await async_client.get('/api/v2/address/', params={'text': 'phuong hoan kiem, ha noi'})
+    assert res.status_code == HTTPStatus.OK, res.text
+    data = res.json()
+    assert data['province'] == {'code': 1, 'name': 'Thành phố Hà Nội', 'matched': 'ha noi'}
+    assert data['ward']['name'] == 'Phường Hoàn Kiếm'
+    assert not data['ambiguous']
+    res = await async_client.post('/api/v2/address/batch/', json={'addresses': ['Hà Nội', 'nowhere']})
+    assert res.status_code == HTTPStatus.OK, res.text
+    assert [(r['province'] or {}).get('code') for r in res.json()] == [1, None]
+    res = await async_client.get('/api/v2/address/', params={'text': ''})
+    assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY